@@ -2,14 +2,30 @@
 # SQLite helpers for Pappaliiga CS (championship-centric).
 # - Safe UPSERTs for championships, matches, maps, votes, team/player per-map stats
 # - Back-compat insert_* wrappers that call the new upsert_* functions
+# - upsert_* never commit a transaction the caller has open.
+#   upsert_players_many / upsert_player and upsert_map_votes run under bulk():
+#   a SAVEPOINT inside the caller's transaction, otherwise a self-committed
+#   BEGIN IMMEDIATE/COMMIT unit. The rest issue plain statements, which
+#   autocommit one by one when no transaction is open (isolation_level=None).
+#   Group them with bulk() or run them as DBWriter jobs
 # - Query functions for fetching stats (used by html_gen.py)
 # All comments in English by design.
 
 from __future__ import annotations
 import sqlite3
 import json
+import logging
+import os
+import queue
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter, sub
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
 SCHEMA_PATH = Path(__file__).with_name("schema.sql")
 DEFAULT_TEAM_AVATAR = "https://pappaliiga.fi/app/themes/pappaliiga/images/src/pappaliiga-logo-white-bg.png"
@@ -18,139 +34,751 @@ DEFAULT_TEAM_AVATAR = "https://pappaliiga.fi/app/themes/pappaliiga/images/src/pa
 # Connection & init
 # -------------------------
 
-def get_conn(path: str) -> sqlite3.Connection:
-    con = sqlite3.connect(path)
-    con.row_factory = sqlite3.Row
-    con.execute("PRAGMA foreign_keys = ON;")
+class _Connection(sqlite3.Connection):
+    """
+    sqlite3.Connection that keeps one cursor per write helper. con.execute()
+    allocates a fresh Cursor on every call; the hot helpers reuse theirs.
+    """
 
-    # Performance pragmas (safe defaults for this workload)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper_cursors: dict[str, sqlite3.Cursor] = {}
+        self.db_key: Optional[str] = None  # _db_key(): tiedostopolku, haetaan kerran
+
+
+def _cur(con: sqlite3.Connection, name: str):
+    """
+    Reusable cursor for helper `name` on this connection. Plain sqlite3
+    connections (not opened via get_conn) fall back to con itself, which has
+    the same execute/executemany API.
+    """
+    cursors = getattr(con, "helper_cursors", None)
+    if cursors is None:
+        return con
+    cur = cursors.get(name)
+    if cur is None:
+        cur = cursors[name] = con.cursor()
+    return cur
+
+
+def _apply_write_pragmas(con: sqlite3.Connection, path: str) -> None:
+    """File-level pragmas for the read-write connection (WAL, page size, fsync policy)."""
     try:
-        con.execute("PRAGMA journal_mode=WAL;")      # persistent in DB file
+        # 8 KiB pages: fewer B-tree levels for player_stats. Only takes effect on a
+        # new, empty DB file and must precede journal_mode=WAL (no-op otherwise).
+        con.execute("PRAGMA page_size=8192;")
+    except Exception:
+        pass
+    try:
+        # persistent in DB file; returns the mode actually in effect
+        mode = con.execute("PRAGMA journal_mode=WAL;").fetchone()
+        if not mode or str(mode[0]).lower() != "wal":
+            logging.warning("journal_mode=WAL not applied for %s (got %r)", path, mode[0] if mode else None)
     except Exception:
         pass
     try:
         con.execute("PRAGMA synchronous=NORMAL;")    # per-connection
     except Exception:
         pass
+
+
+def _apply_read_pragmas(con: sqlite3.Connection) -> None:
+    """Per-connection cache/IO pragmas; used by both read-write and read-only connections."""
     try:
         con.execute("PRAGMA temp_store=MEMORY;")     # per-connection
     except Exception:
         pass
+    try:
+        con.execute("PRAGMA cache_size=-65536;")     # 64 MiB page cache, per-connection
+    except Exception:
+        pass
     try:
         con.execute("PRAGMA mmap_size=1073741824;")  # 1 GiB
     except Exception:
         pass
+    try:
+        con.execute("PRAGMA busy_timeout=5000;")     # wait for locks instead of SQLITE_BUSY
+    except Exception:
+        pass
 
+
+def _connect(target: str, check_same_thread: bool, row_factory: Any, uri: bool = False) -> sqlite3.Connection:
+    # isolation_level=None: the driver no longer issues implicit BEGINs.
+    # Each statement autocommits unless wrapped in bulk(); con.commit() is
+    # then a no-op outside bulk().
+    # cached_statements: keep every prepared statement of this module compiled.
+    con = sqlite3.connect(target, isolation_level=None, cached_statements=256, uri=uri,
+                          check_same_thread=check_same_thread, factory=_Connection)
+    # SQL tracing is opt-in: an installed trace callback costs a Python call per statement
+    if os.environ.get("PAPPALIIGA_SQL_TRACE"):
+        con.set_trace_callback(lambda stmt: logging.debug("SQL: %s", stmt))
+    # Readers get sqlite3.Row (dict-like access); write-only connections pass None
+    # and skip the per-row Row allocation.
+    con.row_factory = row_factory
     return con
 
 
-def init_db(con: sqlite3.Connection, schema_path: Path = SCHEMA_PATH) -> None:
-    sql = schema_path.read_text(encoding="utf-8")
-    con.executescript(sql)
-    con.executescript("""
-    CREATE INDEX IF NOT EXISTS idx_matches_champ      ON matches(championship_id);
-    CREATE INDEX IF NOT EXISTS idx_matches_status     ON matches(status);
-    CREATE INDEX IF NOT EXISTS idx_matches_ts         ON matches(championship_id, finished_at, started_at, scheduled_at, configured_at, last_seen_at);
+def get_conn(path: str, check_same_thread: bool = True, row_factory: Any = sqlite3.Row) -> sqlite3.Connection:
+    con = _connect(path, check_same_thread, row_factory)
+    con.execute("PRAGMA foreign_keys = ON;")
+    # Performance pragmas (safe defaults for this workload)
+    _apply_write_pragmas(con, path)
+    _apply_read_pragmas(con)
+    return con
+
+
+def get_conn_ro(path: str, check_same_thread: bool = True, row_factory: Any = sqlite3.Row) -> sqlite3.Connection:
+    """
+    Read-only connection (URI mode=ro + query_only) for the HTML/query path.
+    Under WAL it reads a consistent snapshot while sync keeps writing, and it
+    can never take the write lock. The DB must already exist (run sync first).
+    """
+    con = _connect(Path(path).resolve().as_uri() + "?mode=ro", check_same_thread, row_factory, uri=True)
+    try:
+        con.execute("PRAGMA query_only=1;")
+    except Exception:
+        pass
+    _apply_read_pragmas(con)
+    return con
+
+
+@contextmanager
+def ro_conn(path: str) -> Iterator[sqlite3.Connection]:
+    """Fresh read-only connection for one batch job (e.g. HTML generation), closed afterwards."""
+    con = get_conn_ro(path)
+    try:
+        yield con
+    finally:
+        con.close()
+
+
+class ConnPool:
+    """
+    One writer + N reader connections to the same WAL database.
+    WAL readers never block the writer, so probes can run on readers while the
+    writer holds a long transaction. Writes are serialized by a Python lock
+    (SQLite allows a single writer anyway; this avoids SQLITE_BUSY between threads).
+    """
+
+    def __init__(self, path: str, n_readers: int = 4):
+        self.path = path
+        # Write paths never read rows by name -> plain tuples on the writer
+        self.writer = get_conn(path, check_same_thread=False, row_factory=None)
+        self.writer.execute("PRAGMA query_only=0;")
+        # Let the WAL grow to ~10k pages before an automatic checkpoint; sync
+        # calls checkpoint() itself between divisions instead of stalling a commit.
+        self.writer.execute("PRAGMA wal_autocheckpoint=10000;")
+        self._write_lock = threading.Lock()
+        self.readers: queue.Queue[sqlite3.Connection] = queue.Queue()
+        self._all_readers: list[sqlite3.Connection] = []
+        for _ in range(max(1, n_readers)):
+            r = get_conn(path, check_same_thread=False, row_factory=sqlite3.Row)
+            r.execute("PRAGMA query_only=1;")
+            self._all_readers.append(r)
+            self.readers.put(r)
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        with self._write_lock:
+            yield self.writer
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        con = self.readers.get()
+        try:
+            yield con
+        finally:
+            self.readers.put(con)
+
+    def close(self) -> None:
+        for con in (*self._all_readers, self.writer):
+            try:
+                con.close()
+            except Exception:
+                pass
+
+
+class ReadPool:
+    """
+    N read-only connections (get_conn_ro) for parallel report generation.
+    WAL readers never block each other or the writer; each thread checks one
+    out with read() and returns it afterwards. Writes stay on the single writer.
+    """
+
+    def __init__(self, path: str, n: int = 4):
+        self.path = path
+        self._q: queue.SimpleQueue[sqlite3.Connection] = queue.SimpleQueue()
+        self._all: list[sqlite3.Connection] = []
+        for _ in range(max(1, n)):
+            con = get_conn_ro(path, check_same_thread=False)
+            self._all.append(con)
+            self._q.put(con)
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        con = self._q.get()
+        try:
+            yield con
+        finally:
+            self._q.put(con)
+
+    def close(self) -> None:
+        for con in self._all:
+            try:
+                con.close()
+            except Exception:
+                pass
+
+
+def open_pool(path: str, n_readers: int = 4) -> ConnPool:
+    # A pool is one sync run against one database: start with a clean match cache.
+    clear_sync_cache()
+    return ConnPool(path, n_readers=n_readers)
+
+
+def checkpoint(con: sqlite3.Connection, mode: str = "PASSIVE") -> tuple[int, int, int] | None:
+    """
+    Run a WAL checkpoint: PASSIVE between batches, TRUNCATE at the end of a run.
+    Returns (busy, wal_pages, checkpointed_pages) or None if the pragma failed.
+    """
+    mode = mode.upper()
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"invalid checkpoint mode: {mode}")
+    try:
+        row = con.execute(f"PRAGMA wal_checkpoint({mode});").fetchone()
+    except sqlite3.Error:
+        return None
+    return tuple(row) if row else None
+
+
+@contextmanager
+def bulk(con: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """
+    Group many upserts into one transaction (one fsync instead of one per statement).
+    BEGIN IMMEDIATE takes the write lock up front, so there is no SQLITE_BUSY
+    mid-transaction. Nested use falls back to a SAVEPOINT inside the outer transaction.
+    """
+    if con.in_transaction:
+        con.execute("SAVEPOINT bulk_sp")
+        try:
+            yield con
+        except BaseException:
+            con.execute("ROLLBACK TO SAVEPOINT bulk_sp")
+            con.execute("RELEASE SAVEPOINT bulk_sp")
+            raise
+        con.execute("RELEASE SAVEPOINT bulk_sp")
+        return
 
-    CREATE INDEX IF NOT EXISTS idx_maps_match         ON maps(match_id);
-    CREATE INDEX IF NOT EXISTS idx_maps_match_round   ON maps(match_id, round_index);
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        yield con
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    con.execute("COMMIT")
+
+
+class Committer:
+    """
+    Microbatched commits on an autocommit connection: begin() opens a write
+    transaction, tick() counts finished units and COMMITs every `every` units
+    or `seconds` seconds, whichever comes first. A crash loses at most one
+    window of work (sync simply refetches it on the next run).
+    """
+
+    def __init__(self, con: sqlite3.Connection, every: int = 500, seconds: float = 1.0):
+        self.con = con
+        self.every = every
+        self.seconds = seconds
+        self.n = 0
+        self.t0 = time.monotonic()
+
+    def begin(self) -> None:
+        if not self.con.in_transaction:
+            self.con.execute("BEGIN IMMEDIATE")
+            self.n = 0
+            self.t0 = time.monotonic()
+
+    def tick(self) -> None:
+        self.n += 1
+        if self.n >= self.every or time.monotonic() - self.t0 >= self.seconds:
+            self.flush()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the open window must be committed (None = nothing open)."""
+        if not self.con.in_transaction:
+            return None
+        return max(0.0, self.seconds - (time.monotonic() - self.t0))
 
-    CREATE INDEX IF NOT EXISTS idx_map_votes_match    ON map_votes(match_id);
+    def flush(self) -> None:
+        if self.con.in_transaction:
+            self.con.execute("COMMIT")
+        self.n = 0
+        self.t0 = time.monotonic()
 
-    CREATE INDEX IF NOT EXISTS idx_ps_match_round     ON player_stats(match_id, round_index);
-    CREATE INDEX IF NOT EXISTS idx_ps_team_match      ON player_stats(team_id, match_id);
-    """)
+
+_FLUSH = object()  # DBWriter queue marker: commit the open window now
+
+
+class DBWriter(threading.Thread):
+    """
+    Single background thread that owns every write of a sync run.
+    Producers (HTTP fetch loop) only enqueue jobs: submit(fn, *args) runs
+    fn(con, *args) on the pool writer, so the commit fsync never blocks the
+    next fetch. The queue is bounded -> producers backpressure when the writer
+    falls behind. Each job is a SAVEPOINT inside a Committer window (one COMMIT
+    per `commit_every` jobs or `commit_seconds`); a failed job rolls back alone.
+    `failed` counts rolled-back jobs and `commit_failed` failed COMMITs (each
+    loses its whole window); sync reports both at the end of the run.
+    """
+
+    def __init__(self, pool: ConnPool, maxsize: int = 8, commit_every: int = 32, commit_seconds: float = 1.0):
+        super().__init__(name="db-writer", daemon=True)
+        self.pool = pool
+        self.q: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.committer = Committer(pool.writer, every=commit_every, seconds=commit_seconds)
+        self.failed = 0
+        self.commit_failed = 0
+
+    def submit(self, fn, *args) -> None:
+        self.q.put((fn, args))
+
+    def _commit(self) -> None:
+        try:
+            with self.pool.write():
+                self.committer.flush()
+        except sqlite3.Error as e:
+            self.commit_failed += 1
+            logging.warning("db writer: commit failed: %s", e)
+            clear_identity_cache()
+
+    def run(self) -> None:
+        while True:
+            try:
+                job = self.q.get(timeout=self.committer.remaining())
+            except queue.Empty:
+                self._commit()  # time window elapsed while idle
+                continue
+            try:
+                if job is None or job is _FLUSH:
+                    self._commit()
+                    if job is None:
+                        return
+                    continue
+                fn, args = job
+                with self.pool.write() as con:
+                    try:
+                        self.committer.begin()
+                        with bulk(con):  # SAVEPOINT inside the open window
+                            fn(con, *args)
+                    except Exception as e:
+                        self.failed += 1
+                        logging.warning("db writer: %s%r failed: %s", getattr(fn, "__name__", fn), args[:1], e)
+                        # Rolled-back team/player inserts must not stay in the identity cache
+                        clear_identity_cache()
+                    try:
+                        self.committer.tick()
+                    except sqlite3.Error as e:
+                        self.commit_failed += 1
+                        logging.warning("db writer: commit failed: %s", e)
+                        clear_identity_cache()
+            finally:
+                self.q.task_done()
+
+    def flush(self) -> None:
+        """Block until every submitted job has been committed (or rolled back)."""
+        self.q.put(_FLUSH)
+        self.q.join()
+
+    def close(self) -> None:
+        self.q.put(None)
+        self.join()
+
+
+# One-shot migration: older DBs have maps(id AUTOINCREMENT, UNIQUE(match_id, round_index)).
+# Rebuild it as a WITHOUT ROWID table keyed by (match_id, round_index); indexes are
+# recreated by schema.sql / init_db afterwards.
+_SQL_MIGRATE_MAPS_WITHOUT_ROWID = """
+BEGIN IMMEDIATE;
+CREATE TABLE maps_new (
+  match_id      TEXT NOT NULL REFERENCES matches(match_id) ON DELETE CASCADE,
+  round_index   INTEGER NOT NULL,
+  map_name      TEXT,
+  score_team1   INTEGER,
+  score_team2   INTEGER,
+  winner_team_id TEXT,
+  rounds_total  INTEGER GENERATED ALWAYS AS (COALESCE(score_team1,0) + COALESCE(score_team2,0)) VIRTUAL,
+  PRIMARY KEY (match_id, round_index)
+) WITHOUT ROWID;
+INSERT INTO maps_new (match_id, round_index, map_name, score_team1, score_team2, winner_team_id)
+  SELECT match_id, round_index, map_name, score_team1, score_team2, winner_team_id FROM maps;
+DROP TABLE maps;
+ALTER TABLE maps_new RENAME TO maps;
+DELETE FROM sqlite_sequence WHERE name = 'maps';
+COMMIT;
+"""
+
+def _migrate_maps_without_rowid(con: sqlite3.Connection) -> None:
+    cols = {r[1] for r in con.execute("PRAGMA table_info(maps)").fetchall()}
+    if "id" in cols:
+        con.executescript(_SQL_MIGRATE_MAPS_WITHOUT_ROWID)
+        _COLS_CACHE.clear()
+
+
+# player_stats counters NOT NULL DEFAULT 0 (schema.sql): aggregates SUM the
+# columns directly. Older DBs have them nullable; rebuild once, NULL -> 0.
+# Indexes are recreated by schema.sql / _SQL_EXTRA_INDEXES right after.
+_SQL_MIGRATE_PSTAT_NOT_NULL = """
+BEGIN IMMEDIATE;
+CREATE TABLE player_stats_new (
+  id               INTEGER PRIMARY KEY AUTOINCREMENT,
+  match_id         TEXT NOT NULL REFERENCES matches(match_id) ON DELETE CASCADE,
+  round_index      INTEGER NOT NULL,
+  player_id        TEXT REFERENCES players(player_id) ON DELETE SET NULL,
+  team_id          TEXT REFERENCES teams(team_id) ON DELETE SET NULL,
+  kills            INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  deaths           INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  assists          INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  kd               REAL,
+  kr               REAL,
+  adr              REAL,
+  hs_pct           REAL,
+  mvps             INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  sniper_kills     INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  utility_damage   INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  enemies_flashed  INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  flash_count      INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  flash_successes  INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  mk_2k            INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  mk_3k            INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  mk_4k            INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  mk_5k            INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  clutch_kills     INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  cl_1v1_attempts  INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  cl_1v1_wins      INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  cl_1v2_attempts  INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  cl_1v2_wins      INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  entry_count      INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  entry_wins       INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  pistol_kills     INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  damage           INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+
+  UNIQUE(match_id, round_index, player_id)
+);
+INSERT INTO player_stats_new (
+  id, match_id, round_index, player_id, team_id,
+  kills, deaths, assists, kd, kr, adr, hs_pct,
+  mvps, sniper_kills, utility_damage, enemies_flashed, flash_count, flash_successes,
+  mk_2k, mk_3k, mk_4k, mk_5k,
+  clutch_kills, cl_1v1_attempts, cl_1v1_wins, cl_1v2_attempts, cl_1v2_wins,
+  entry_count, entry_wins, pistol_kills, damage
+)
+SELECT
+  id, match_id, round_index, player_id, team_id,
+  COALESCE(kills,0), COALESCE(deaths,0), COALESCE(assists,0),
+  kd, kr, adr, hs_pct,
+  COALESCE(mvps,0), COALESCE(sniper_kills,0), COALESCE(utility_damage,0),
+  COALESCE(enemies_flashed,0), COALESCE(flash_count,0), COALESCE(flash_successes,0),
+  COALESCE(mk_2k,0), COALESCE(mk_3k,0), COALESCE(mk_4k,0), COALESCE(mk_5k,0),
+  COALESCE(clutch_kills,0), COALESCE(cl_1v1_attempts,0), COALESCE(cl_1v1_wins,0),
+  COALESCE(cl_1v2_attempts,0), COALESCE(cl_1v2_wins,0),
+  COALESCE(entry_count,0), COALESCE(entry_wins,0), COALESCE(pistol_kills,0), COALESCE(damage,0)
+FROM player_stats;
+DROP TABLE player_stats;
+ALTER TABLE player_stats_new RENAME TO player_stats;
+COMMIT;
+"""
+
+def _migrate_pstat_not_null(con: sqlite3.Connection) -> None:
+    info = {r[1]: r[3] for r in con.execute("PRAGMA table_info(player_stats)").fetchall()}
+    if info and not info.get("kills"):
+        # DROP TABLE takes the secondary indexes along: recreate them as they were
+        # (ensure_read_schema runs this without the schema/extra-index pass after it)
+        indexes = [r[0] for r in con.execute(
+            "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name='player_stats' AND sql IS NOT NULL"
+        )]
+        con.executescript(_SQL_MIGRATE_PSTAT_NOT_NULL)
+        if indexes:
+            con.executescript("BEGIN IMMEDIATE;\n" + ";\n".join(indexes) + ";\nCOMMIT;")
+        _COLS_CACHE.clear()
+
+
+# Played rounds per map as a generated column: the aggregates read mp.rounds_total
+# instead of repeating COALESCE(score_team1,0)+COALESCE(score_team2,0) per row.
+# ALTER TABLE can only add VIRTUAL generated columns. That costs nothing here:
+# the join reads maps through its PK B-tree (WITHOUT ROWID), which already
+# holds score_team1/score_team2, so the value is computed from the same row.
+_SQL_ADD_MAPS_ROUNDS_TOTAL = (
+    "ALTER TABLE maps ADD COLUMN rounds_total INTEGER "
+    "GENERATED ALWAYS AS (COALESCE(score_team1,0) + COALESCE(score_team2,0)) VIRTUAL"
+)
+
+def _add_maps_rounds_total(con: sqlite3.Connection) -> None:
+    # table_xinfo (not table_info) lists generated columns
+    cols = {r[1] for r in con.execute("PRAGMA table_xinfo(maps)").fetchall()}
+    if "rounds_total" not in cols:
+        try:
+            con.execute(_SQL_ADD_MAPS_ROUNDS_TOTAL)
+        except sqlite3.Error as e:
+            logging.warning("maps.rounds_total lisäys epäonnistui: %s", e)
+
+def ensure_read_schema(path: str) -> None:
+    """
+    Schema the read queries depend on (maps.rounds_total, NOT NULL player_stats
+    counters that are summed without COALESCE), for a DB that has not been through
+    init_db since they were added. Read-only connections cannot ALTER, so html_gen
+    calls this once before opening ro_conn. No-op when up to date.
+    """
+    con = get_conn(path)
+    try:
+        _add_maps_rounds_total(con)
+        _migrate_pstat_not_null(con)
+    finally:
+        con.close()
+
+
+# map_votes natural key for upsert_map_votes. Existing DBs may hold duplicate
+# rows from older syncs: keep the first of each key, then add the index.
+_SQL_MIGRATE_MAP_VOTES_UNIQUE = """
+BEGIN IMMEDIATE;
+DELETE FROM map_votes WHERE id NOT IN (
+  SELECT MIN(id) FROM map_votes
+  GROUP BY match_id, COALESCE(round_num,-1), COALESCE(map_name,''), COALESCE(status,'')
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_map_votes
+  ON map_votes(match_id, COALESCE(round_num,-1), COALESCE(map_name,''), COALESCE(status,''));
+COMMIT;
+"""
+
+def _migrate_map_votes_unique(con: sqlite3.Connection) -> None:
+    if not con.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name='ux_map_votes'").fetchone():
+        con.executescript(_SQL_MIGRATE_MAP_VOTES_UNIQUE)
+
+# map_votes.status is stored lowercase (upsert_map_votes / insert_votes_many
+# normalize it), so reads compare status = 'pick' directly and the
+# (match_id, status, ...) index applies. Rows from older writers are fixed up
+# here; OR REPLACE drops a row that only differed from another by case.
+# No-op (no write) once every row is lowercase.
+_SQL_MIGRATE_VOTE_STATUS_LOWER = "UPDATE OR REPLACE map_votes SET status = LOWER(status) WHERE status <> LOWER(status)"
+
+def _migrate_vote_status_lower(con: sqlite3.Connection) -> None:
+    con.execute(_SQL_MIGRATE_VOTE_STATUS_LOWER)
+
+
+@lru_cache(maxsize=None)
+def _read_schema(schema_path: Path) -> str:
+    # Read + decode schema.sql once per process (pool setup calls init_db repeatedly)
+    return schema_path.read_text(encoding="utf-8")
+
+_SQL_EXTRA_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_matches_champ      ON matches(championship_id);
+CREATE INDEX IF NOT EXISTS idx_matches_status     ON matches(status);
+CREATE INDEX IF NOT EXISTS idx_matches_ts         ON matches(championship_id, finished_at, started_at, scheduled_at, configured_at, last_seen_at);
+
+CREATE INDEX IF NOT EXISTS idx_maps_match         ON maps(match_id);
+
+CREATE INDEX IF NOT EXISTS idx_map_votes_match    ON map_votes(match_id);
+
+CREATE INDEX IF NOT EXISTS idx_ps_match_round     ON player_stats(match_id, round_index);
+CREATE INDEX IF NOT EXISTS idx_ps_team_match      ON player_stats(team_id, match_id);
+
+-- player_stats ⋈ maps on (match_id, round_index) with the team filter in the same index
+CREATE INDEX IF NOT EXISTS idx_ps_match_round_team ON player_stats(match_id, round_index, team_id);
+-- MAX(last_seen_at) per championship (generated-at stamps): index seek, no row fetch
+CREATE INDEX IF NOT EXISTS ix_matches_champ_last_seen ON matches(championship_id, last_seen_at);
+-- per-team match lists: championship + both team columns without a table fetch
+CREATE INDEX IF NOT EXISTS idx_matches_champ_teams ON matches(championship_id, team1_id, team2_id);
+-- pick/drop lookups in the map stats (match_id IN ..., status = lowercase literal)
+-- seek both leading columns and are answered from the index alone
+CREATE INDEX IF NOT EXISTS idx_map_votes_match_status_map ON map_votes(match_id, status, map_name, selected_by_team_id);
+-- maps: the PK B-tree (WITHOUT ROWID) already serves the join incl. the virtual
+-- rounds_total; the earlier copy of it in an index was never used by the planner
+DROP INDEX IF EXISTS idx_maps_rounds_total;
+"""
+
+_SQL_INDEX_NAMES = "SELECT name FROM sqlite_master WHERE type='index'"
+
+def init_db(con: sqlite3.Connection, schema_path: Path = SCHEMA_PATH) -> None:
+    _migrate_maps_without_rowid(con)
+    _migrate_pstat_not_null(con)
+    before = {r[0] for r in con.execute(_SQL_INDEX_NAMES)}
+    con.executescript(_read_schema(schema_path))
+    _add_maps_rounds_total(con)
+    _migrate_map_votes_unique(con)
+    _migrate_vote_status_lower(con)
+    con.executescript(_SQL_EXTRA_INDEXES)
     con.commit()
+    # New indexes (or a DB never analyzed) -> refresh planner stats so they get used.
+    # Otherwise the PRAGMA optimize at the end of sync keeps sqlite_stat1 current.
+    has_stats = con.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone()
+    if not has_stats or {r[0] for r in con.execute(_SQL_INDEX_NAMES)} - before:
+        try:
+            con.execute("ANALYZE;")
+        except sqlite3.Error as e:
+            logging.warning("ANALYZE failed: %s", e)
+    prime_columns_cache(con)
 
 # -------------------------
 # Championships
 # -------------------------
 
+# Write-path SQL lives in module-level constants: the same string object is
+# handed to sqlite3 on every call, so the statement cache hits without
+# rebuilding/hashing a fresh literal per row.
+
+# One statement for both merge paths (SQLite >= 3.35: multiple ON CONFLICT
+# clauses + RETURNING). The natural key (season, division_num, is_playoffs) is
+# checked first through the uq_champ_season_div index and keeps the existing
+# championship_id; otherwise the row merges by championship_id.
+_SQL_UPSERT_CHAMP = """
+INSERT INTO championships (championship_id, season, division_num, name, is_playoffs, slug)
+VALUES (:championship_id, :season, :division_num, :name, :is_playoffs, :slug)
+ON CONFLICT(season, division_num, is_playoffs) DO UPDATE SET
+  name = CASE WHEN championships.name IS NULL OR championships.name='' THEN excluded.name ELSE championships.name END,
+  slug = CASE WHEN championships.slug IS NULL OR championships.slug='' THEN excluded.slug ELSE championships.slug END
+ON CONFLICT(championship_id) DO UPDATE SET
+  season       = COALESCE(championships.season, excluded.season),
+  division_num = COALESCE(championships.division_num, excluded.division_num),
+  name         = CASE WHEN championships.name IS NULL OR championships.name='' THEN excluded.name ELSE championships.name END,
+  is_playoffs  = COALESCE(championships.is_playoffs, excluded.is_playoffs),
+  slug         = CASE WHEN championships.slug IS NULL OR championships.slug='' THEN excluded.slug ELSE championships.slug END
+RETURNING championship_id
+"""
+
 def upsert_championship(con: sqlite3.Connection, row: Dict[str, Any]) -> Dict[str, Any]:
     """
     Merge by (season, division_num, is_playoffs) OR by championship_id.
     Returns the canonical row dict with the championship_id you must use downstream.
+    Does not commit: the caller owns the transaction.
     """
-    cur = con.execute(
-        """
-        SELECT championship_id, season, division_num, name, is_playoffs, slug
-        FROM championships
-        WHERE season=? AND division_num=? AND is_playoffs=?
-        LIMIT 1
-        """,
-        (row["season"], row["division_num"], row["is_playoffs"])
-    ).fetchone()
-
-    if cur:
-        existing_id = cur[0]
-        con.execute(
-            """
-            UPDATE championships SET
-              name = CASE WHEN name IS NULL OR name='' THEN :name ELSE name END,
-              slug = CASE WHEN slug IS NULL OR slug='' THEN :slug ELSE slug END
-            WHERE season=:season AND division_num=:division_num AND is_playoffs=:is_playoffs
-            """,
-            row
-        )
-        con.commit()
-        out = dict(row)
-        out["championship_id"] = existing_id
-        return out
-
-    sql = """
-    INSERT INTO championships (championship_id, season, division_num, name, is_playoffs, slug)
-    VALUES (:championship_id, :season, :division_num, :name, :is_playoffs, :slug)
-    ON CONFLICT(championship_id) DO UPDATE SET
-      season       = COALESCE(championships.season, excluded.season),
-      division_num = COALESCE(championships.division_num, excluded.division_num),
-      name         = CASE WHEN championships.name IS NULL OR championships.name='' THEN excluded.name ELSE championships.name END,
-      is_playoffs  = COALESCE(championships.is_playoffs, excluded.is_playoffs),
-      slug         = CASE WHEN championships.slug IS NULL OR championships.slug='' THEN excluded.slug ELSE championships.slug END
-    """
-    con.execute(sql, row)
-    con.commit()
-    return dict(row)
+    out = dict(row)
+    out["championship_id"] = con.execute(_SQL_UPSERT_CHAMP, row).fetchone()[0]
+    return out
 
 # -------------------------
 # Teams & Players
 # -------------------------
 
+_SQL_UPSERT_TEAM = """
+INSERT INTO teams (team_id, name, avatar, updated_at)
+VALUES (:team_id, :name, :avatar, COALESCE(:updated_at, strftime('%s','now')))
+ON CONFLICT(team_id) DO UPDATE SET
+  name       = CASE WHEN teams.name IS NULL OR teams.name='' THEN excluded.name ELSE teams.name END,
+  avatar     = COALESCE(NULLIF(teams.avatar, ''), NULLIF(excluded.avatar, ''), :default_avatar),
+  updated_at = COALESCE(excluded.updated_at, teams.updated_at)
+"""
+
+# Multi-row VALUES (see _execute_values); a missing updated_at is filled with
+# "now" in Python, the same value strftime('%s','now') would give.
+@lru_cache(maxsize=None)
+def _sql_upsert_players(n_rows: int) -> str:
+    return f"""
+INSERT INTO players (player_id, nickname, updated_at)
+VALUES {_values_sql(3, n_rows)}
+ON CONFLICT(player_id) DO UPDATE SET
+  nickname   = CASE WHEN players.nickname IS NULL OR players.nickname='' THEN excluded.nickname ELSE players.nickname END,
+  updated_at = COALESCE(excluded.updated_at, players.updated_at)
+"""
+
+# Identity cache: ids whose stored identity is already complete (team: non-empty
+# name + avatar, player: non-empty nickname). The upserts never overwrite a
+# non-empty value, so repeating them for these ids only touches updated_at;
+# such calls (updated_at=None) are skipped without going to SQLite.
+_TEAMS_KNOWN: set[str] = set()
+_PLAYERS_KNOWN: set[str] = set()
+
+def clear_identity_cache() -> None:
+    """Forget cached identities (call after a rollback that may have undone inserts)."""
+    _TEAMS_KNOWN.clear()
+    _PLAYERS_KNOWN.clear()
+
+def prime_identity_cache(con: sqlite3.Connection) -> None:
+    """Seed the identity cache from the DB (one pass over teams + players)."""
+    _TEAMS_KNOWN.update(r[0] for r in con.execute(
+        "SELECT team_id FROM teams WHERE team_id IS NOT NULL AND COALESCE(name,'')<>'' AND COALESCE(avatar,'')<>''"
+    ))
+    _PLAYERS_KNOWN.update(r[0] for r in con.execute(
+        "SELECT player_id FROM players WHERE COALESCE(nickname,'')<>''"
+    ))
+
 def upsert_team(con: sqlite3.Connection, team: Dict[str, Any]) -> None:
     """
     team = { team_id, name, avatar, updated_at? }
+    """
+    upsert_teams_many(con, [team])
+
+def upsert_teams_many(con: sqlite3.Connection, teams: Iterable[Dict[str, Any]]) -> None:
+    """
+    One executemany for a batch of teams (caller owns the transaction).
     Takuut:
       - tallennetaan aina jokin avatar (oletus jos puuttuu)
       - ei ylikirjoiteta olemassa olevaa ei-tyhjää arvoa
     """
-    if "updated_at" not in team:
-        team["updated_at"] = None
-    avatar_in = team.get("avatar")
-    team["avatar"] = avatar_in if (avatar_in is not None and str(avatar_in).strip() != "") else DEFAULT_TEAM_AVATAR
-
-    sql = """
-    INSERT INTO teams (team_id, name, avatar, updated_at)
-    VALUES (:team_id, :name, :avatar, COALESCE(:updated_at, strftime('%s','now')))
-    ON CONFLICT(team_id) DO UPDATE SET
-      name       = CASE WHEN teams.name IS NULL OR teams.name='' THEN excluded.name ELSE teams.name END,
-      avatar     = COALESCE(NULLIF(teams.avatar, ''), NULLIF(excluded.avatar, ''), :default_avatar),
-      updated_at = COALESCE(excluded.updated_at, teams.updated_at)
-    """
-    con.execute(sql, {**team, "default_avatar": DEFAULT_TEAM_AVATAR})
+    payload = []
+    for t in teams:
+        team_id = t.get("team_id")
+        updated_at = t.get("updated_at")
+        if team_id is not None and updated_at is None and team_id in _TEAMS_KNOWN:
+            continue  # identity already complete -> no-op upsert
+        avatar_in = t.get("avatar")
+        payload.append({
+            "team_id": team_id,
+            "name": t.get("name"),
+            "avatar": avatar_in if (avatar_in is not None and str(avatar_in).strip() != "") else DEFAULT_TEAM_AVATAR,
+            "updated_at": updated_at,
+            "default_avatar": DEFAULT_TEAM_AVATAR,
+        })
+    if not payload:
+        return
+    _cur(con, "upsert_team").executemany(_SQL_UPSERT_TEAM, payload)
+    # Avatar is always non-empty after the upsert; a non-empty name makes it complete
+    _TEAMS_KNOWN.update(r["team_id"] for r in payload if r["team_id"] is not None and r["name"] not in (None, ""))
 
 def upsert_player(con: sqlite3.Connection, player: Dict[str, Any]) -> None:
     """
     player = { player_id, nickname, updated_at? }
     """
-    if "updated_at" not in player:
-        player["updated_at"] = None
-    sql = """
-    INSERT INTO players (player_id, nickname, updated_at)
-    VALUES (:player_id, :nickname, COALESCE(:updated_at, strftime('%s','now')))
-    ON CONFLICT(player_id) DO UPDATE SET
-      nickname   = CASE WHEN players.nickname IS NULL OR players.nickname='' THEN excluded.nickname ELSE players.nickname END,
-      updated_at = COALESCE(excluded.updated_at, players.updated_at)
+    upsert_players_many(con, [player])
+
+def upsert_players_many(con: sqlite3.Connection, players: Iterable[Dict[str, Any]]) -> None:
+    """
+    Batch of players as chunked multi-row upserts, run as one unit (a SAVEPOINT
+    inside the caller's transaction, else its own BEGIN IMMEDIATE).
+    players: dicts with keys {player_id, nickname, updated_at?}
+    Rows without player_id are dropped and repeats are merged into one row per
+    player_id (last non-empty nickname, newest updated_at). Only a batch-size
+    cut: SQLite applies duplicate keys of one multi-row upsert in order, so
+    callers may pass repeats.
     """
-    con.execute(sql, player)
+    now = int(time.time())
+    best: dict[str, list] = {}
+    for p in players:
+        pid = p.get("player_id")
+        if not pid:
+            continue
+        updated_at = p.get("updated_at")
+        if updated_at is None:
+            if pid in _PLAYERS_KNOWN:
+                continue  # identity already complete -> no-op upsert
+            updated_at = now
+        nick = p.get("nickname") or ""
+        row = best.get(pid)
+        if row is None:
+            best[pid] = [pid, nick, updated_at]
+            continue
+        if nick:
+            row[1] = nick
+        if updated_at > row[2]:
+            row[2] = updated_at
+    if not best:
+        return
+    rows = [tuple(r) for r in best.values()]
+    with bulk(con):
+        _execute_values(_cur(con, "upsert_player"), _sql_upsert_players, rows, 3)
+    _PLAYERS_KNOWN.update(pid for pid, nick, _ in rows if nick)
+
+# Vanha nimi (vanhat skriptit)
+upsert_players_bulk = upsert_players_many
 
 # -------------------------
 # Query functions for stats (used by html_gen.py)
@@ -161,202 +789,437 @@ def query(con: sqlite3.Connection, sql: str, params: tuple = ()) -> list[dict]:
     rows = [dict(r) for r in cur.fetchall()]
     return rows
 
-_COLS_CACHE: dict[tuple[int, str], set[str]] = {}
+def query_one(con: sqlite3.Connection, sql: str, params: tuple = ()) -> tuple | None:
+    """
+    First row as a plain tuple (cursor-level row_factory=None): for one-row
+    aggregates that are unpacked by position, no sqlite3.Row/dict per call.
+    """
+    cur = con.cursor()
+    cur.row_factory = None
+    return cur.execute(sql, params).fetchone()
+
+def query_tuples(con: sqlite3.Connection, sql: str, params: tuple = ()) -> list[tuple]:
+    """All rows as plain tuples; see query_one()."""
+    cur = con.cursor()
+    cur.row_factory = None
+    return cur.execute(sql, params).fetchall()
 
-def has_column(con: sqlite3.Connection, table: str, col: str) -> bool:
-    key = (id(con), table)
+def query_iter(con: sqlite3.Connection, sql: str, params: tuple = (), arraysize: int = 1024) -> Iterator[sqlite3.Row]:
+    """
+    Stream rows in fetchmany batches as the connection's row objects (sqlite3.Row
+    on read connections, index by name) -- no dict copy, no full result list.
+    """
+    cur = con.execute(sql, params)
+    cur.arraysize = arraysize
+    while True:
+        batch = cur.fetchmany()
+        if not batch:
+            return
+        yield from batch
+
+# (database file, table) -> column names. Keyed by the file rather than the
+# connection, so the cache survives new connections (pool, ro_conn, reconnects).
+_COLS_CACHE: dict[tuple[str, str], set[str]] = {}
+
+def _db_key(con: sqlite3.Connection) -> str:
+    key = getattr(con, "db_key", None)
+    if key is None:
+        row = con.execute("PRAGMA database_list").fetchone()
+        path = row[2] if row else ""
+        # :memory: / temp DB has no file -> per-connection key
+        key = os.path.realpath(path) if path else f"conn:{id(con)}"
+        try:
+            con.db_key = key
+        except AttributeError:
+            pass  # plain sqlite3.Connection: no attributes, PRAGMA per call
+    return key
+
+def _table_columns(con: sqlite3.Connection, table: str) -> set[str]:
+    cur = con.execute(f"PRAGMA table_info({table})")
+    return {r[1] for r in cur.fetchall()}
+
+def prime_columns_cache(con: sqlite3.Connection) -> None:
+    """Fill _COLS_CACHE for every table of the database in one go (init_db)."""
+    db = _db_key(con)
+    tables = [r[0] for r in con.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+    for t in tables:
+        _COLS_CACHE[(db, t)] = _table_columns(con, t)
+
+def has_column(con: sqlite3.Connection, table: str, col: str, db_path: Optional[str] = None) -> bool:
+    key = (os.path.realpath(db_path) if db_path else _db_key(con), table)
     cols = _COLS_CACHE.get(key)
     if cols is None:
-        cur = con.execute(f"PRAGMA table_info({table})")
-        cols = {r[1] for r in cur.fetchall()}
+        cols = _table_columns(con, table)
         _COLS_CACHE[key] = cols
     return col in cols
 
+_SQL_TEAMS_IN_CHAMP = """
+WITH team_ids AS (
+  SELECT DISTINCT team1_id AS team_id FROM matches WHERE championship_id=? AND team1_id IS NOT NULL
+  UNION
+  SELECT DISTINCT team2_id AS team_id FROM matches WHERE championship_id=? AND team2_id IS NOT NULL
+)
+SELECT t.team_id,
+       COALESCE(t.name, '') AS team_name,
+       t.avatar
+FROM team_ids x
+LEFT JOIN teams t ON t.team_id = x.team_id
+ORDER BY team_name COLLATE NOCASE
+"""
+
 def get_teams_in_championship(con: sqlite3.Connection, division_id: int) -> list[dict]:
-    sql = """
-    WITH team_ids AS (
-      SELECT DISTINCT team1_id AS team_id FROM matches WHERE championship_id=? AND team1_id IS NOT NULL
-      UNION
-      SELECT DISTINCT team2_id AS team_id FROM matches WHERE championship_id=? AND team2_id IS NOT NULL
-    )
-    SELECT t.team_id,
-           COALESCE(t.name, '') AS team_name,
-           t.avatar
-    FROM team_ids x
-    LEFT JOIN teams t ON t.team_id = x.team_id
-    ORDER BY team_name COLLATE NOCASE
-    """
-    rows = query(con, sql, (division_id, division_id))
+    rows = query(con, _SQL_TEAMS_IN_CHAMP, (division_id, division_id))
     return [r for r in rows if r["team_id"]]
 
-def compute_team_summary_data(con: sqlite3.Connection, division_id: int, team_id: str) -> dict:
-    # Haetaan VAIN pelatut kartat (join maps) → näistä johdetaan kaikki
-    rows = query(con, """
-        SELECT m.match_id, m.team1_id, m.team2_id,
-               p.round_index, p.map_name, p.score_team1, p.score_team2, p.winner_team_id
-        FROM matches m
-        JOIN maps p ON p.match_id = m.match_id
-        WHERE m.championship_id=? AND (m.team1_id=? OR m.team2_id=?)
-        AND p.map_name <> 'forfeit'
-    """, (division_id, team_id, team_id))
-
-    # Pelatut ottelut = distinct match_id karttariveistä
-    matches_played = len({r["match_id"] for r in rows})
-    maps_played = len(rows)
-    maps_w = sum(1 for r in rows if r.get("winner_team_id") == team_id)
-
-    # Round-difference joukkueen näkökulmasta
-    rd = 0
-    for r in rows:
-        s1 = r.get("score_team1") or 0
-        s2 = r.get("score_team2") or 0
-        if r["team1_id"] == team_id:
-            rd += (s1 - s2)
-        elif r["team2_id"] == team_id:
-            rd += (s2 - s1)
-
-    # Aggregaatit suoraan player_statsista (ei team_stats-taulua)
-    agg = query(con, """
-        SELECT
-          SUM(ps.kills)           AS kills,
-          SUM(ps.deaths)          AS deaths,
-          AVG(COALESCE(ps.kr,0))  AS kr,
-          AVG(COALESCE(ps.adr,0)) AS adr,
-          SUM(COALESCE(ps.utility_damage,0)) AS util
-        FROM player_stats ps
-        JOIN matches m ON m.match_id = ps.match_id
-        WHERE ps.team_id=? AND m.championship_id=?
-    """, (team_id, division_id))[0]
-
-    kills = agg["kills"] or 0
-    deaths = agg["deaths"] or 0
+# Ottelut, kartat, voitot ja round-diff suoraan SQLitessä (yksi tulosrivi)
+_SQL_TEAM_SUMMARY_MAPS = """
+SELECT
+  COUNT(DISTINCT m.match_id) AS matches_played,
+  COUNT(*)                   AS maps_played,
+  SUM(CASE WHEN p.winner_team_id = :team THEN 1 ELSE 0 END) AS w,
+  SUM(CASE WHEN m.team1_id = :team THEN COALESCE(p.score_team1,0) - COALESCE(p.score_team2,0)
+           WHEN m.team2_id = :team THEN COALESCE(p.score_team2,0) - COALESCE(p.score_team1,0)
+           ELSE 0 END)       AS rd
+FROM matches m
+JOIN maps p ON p.match_id = m.match_id
+WHERE m.championship_id = :champ AND (m.team1_id = :team OR m.team2_id = :team)
+AND p.map_name <> 'forfeit'
+"""
+
+_SQL_TEAM_SUMMARY_AGG = """
+SELECT
+  SUM(ps.kills)           AS kills,
+  SUM(ps.deaths)          AS deaths,
+  AVG(COALESCE(ps.kr,0))  AS kr,
+  AVG(COALESCE(ps.adr,0)) AS adr,
+  SUM(ps.utility_damage) AS util
+FROM player_stats ps
+JOIN matches m ON m.match_id = ps.match_id
+WHERE ps.team_id=? AND m.championship_id=?
+"""
+
+def _team_summary(maps: dict | None, agg: dict | None) -> dict:
+    # maps: matches_played/maps_played/w/rd joukkueen näkökulmasta (SQL-aggregaatti)
+    maps = maps or {}
+    maps_played = maps.get("maps_played") or 0
+    maps_w = maps.get("w") or 0
+
+    agg = agg or {}
+    kills = agg.get("kills") or 0
+    deaths = agg.get("deaths") or 0
     kd = (kills / deaths) if deaths else float(kills)
 
     return {
-        "matches_played": matches_played,
+        "matches_played": maps.get("matches_played") or 0,
         "maps_played": maps_played,
         "w": maps_w,
         "l": maps_played - maps_w,
-        "rd": rd,
+        "rd": maps.get("rd") or 0,
         "kd": kd,
-        "kr": agg["kr"] or 0.0,
-        "adr": agg["adr"] or 0.0,
-        "util": agg["util"] or 0,
+        "kr": agg.get("kr") or 0.0,
+        "adr": agg.get("adr") or 0.0,
+        "util": agg.get("util") or 0,
     }
 
+def compute_team_summary_data(con: sqlite3.Connection, division_id: int, team_id: str) -> dict:
+    # Haetaan VAIN pelatut kartat (join maps) → näistä johdetaan kaikki
+    maps = query(con, _SQL_TEAM_SUMMARY_MAPS, {"champ": division_id, "team": team_id})[0]
+    # Aggregaatit suoraan player_statsista (ei team_stats-taulua)
+    agg = query(con, _SQL_TEAM_SUMMARY_AGG, (team_id, division_id))[0]
+    return _team_summary(maps, agg)
+
+# Sama kuin _SQL_TEAM_SUMMARY_MAPS koko divisioonalle: jokainen karttarivi
+# kummankin joukkueen näkökulmasta, GROUP BY team_id
+_SQL_CHAMP_SUMMARY_MAPS = """
+WITH team_maps AS (
+  SELECT m.team1_id AS team_id, m.match_id, p.winner_team_id,
+         COALESCE(p.score_team1,0) - COALESCE(p.score_team2,0) AS rd
+  FROM matches m
+  JOIN maps p ON p.match_id = m.match_id
+  WHERE m.championship_id = :champ AND m.team1_id IS NOT NULL
+  AND p.map_name <> 'forfeit'
+  UNION ALL
+  SELECT m.team2_id AS team_id, m.match_id, p.winner_team_id,
+         COALESCE(p.score_team2,0) - COALESCE(p.score_team1,0) AS rd
+  FROM matches m
+  JOIN maps p ON p.match_id = m.match_id
+  WHERE m.championship_id = :champ AND m.team2_id IS NOT NULL
+  AND m.team2_id IS NOT m.team1_id
+  AND p.map_name <> 'forfeit'
+)
+SELECT team_id,
+       COUNT(DISTINCT match_id) AS matches_played,
+       COUNT(*)                 AS maps_played,
+       SUM(CASE WHEN winner_team_id = team_id THEN 1 ELSE 0 END) AS w,
+       SUM(rd)                  AS rd
+FROM team_maps
+GROUP BY team_id
+"""
+
+# Rows are fed to the aggregates in (team_id, id) order -- the order the per-team
+# query reads them via ix_playerstats_team -- so the float AVGs match bit-for-bit.
+_SQL_CHAMP_SUMMARY_AGG = """
+SELECT
+  team_id,
+  SUM(kills)           AS kills,
+  SUM(deaths)          AS deaths,
+  AVG(COALESCE(kr,0))  AS kr,
+  AVG(COALESCE(adr,0)) AS adr,
+  SUM(utility_damage)  AS util
+FROM (
+  SELECT ps.team_id, ps.kills, ps.deaths, ps.kr, ps.adr, ps.utility_damage
+  FROM player_stats ps
+  JOIN matches m ON m.match_id = ps.match_id
+  WHERE m.championship_id=?
+  ORDER BY ps.team_id, ps.id
+)
+GROUP BY team_id
+"""
+
+def compute_all_team_summaries(con: sqlite3.Connection, division_id: int) -> dict[str, dict]:
+    """
+    compute_team_summary_data for every team of the division from two scans
+    (instead of two queries per team). Teams without played maps are missing;
+    callers fall back to compute_team_summary_data for those.
+    """
+    maps_by_team = {r["team_id"]: r for r in query(con, _SQL_CHAMP_SUMMARY_MAPS, {"champ": division_id})}
+    agg_by_team = {r["team_id"]: r for r in query(con, _SQL_CHAMP_SUMMARY_AGG, (division_id,))}
+    return {tid: _team_summary(maps, agg_by_team.get(tid)) for tid, maps in maps_by_team.items()}
 
-def compute_player_table_data(con: sqlite3.Connection, division_id: int, team_id: str) -> list[dict[str, Any]]:
-    HAS_PISTOL = has_column(con, "player_stats", "pistol_kills")
-    HAS_FLASH  = (has_column(con, "player_stats", "enemies_flashed")
-                  and has_column(con, "player_stats", "flash_count"))
-    HAS_FLASH_SUCC = has_column(con, "player_stats", "flash_successes")
-    HAS_MVPS  = has_column(con, "player_stats", "mvps")
 
+@lru_cache(maxsize=16)
+def _player_table_cols(has_pistol: bool, has_flash: bool, has_flash_succ: bool, has_mvps: bool) -> tuple[str, ...]:
+    """Player table select expressions ("<expr> AS <alias>") for the optional columns present."""
     select_cols = [
+        "ps.team_id AS team_id",
         "ps.player_id AS player_id",
         "COALESCE(MAX(pl.nickname),'') AS nickname_display",
         "COUNT(*) AS maps_played",
-        "SUM(COALESCE(ps.kills,0)) AS kills",
-        "SUM(COALESCE(ps.deaths,0)) AS deaths",
-        "SUM(COALESCE(ps.assists,0)) AS assists",
+        "SUM(ps.kills) AS kills",
+        "SUM(ps.deaths) AS deaths",
+        "SUM(ps.assists) AS assists",
         "AVG(COALESCE(ps.adr,0)) AS adr",
         "AVG(COALESCE(ps.kr,0)) AS kr",
         "AVG(COALESCE(ps.hs_pct,0)) AS hs_pct",
-        "SUM(COALESCE(ps.sniper_kills,0)) AS awp_kills",
-        "SUM(COALESCE(ps.mk_2k,0)) AS k2",
-        "SUM(COALESCE(ps.mk_3k,0)) AS k3",
-        "SUM(COALESCE(ps.mk_4k,0)) AS k4",
-        "SUM(COALESCE(ps.mk_5k,0)) AS k5",
-        "SUM(COALESCE(ps.utility_damage,0)) AS util",
-        "SUM(COALESCE(ps.damage,0)) AS damage",
+        "SUM(ps.sniper_kills) AS awp_kills",
+        "SUM(ps.mk_2k) AS k2",
+        "SUM(ps.mk_3k) AS k3",
+        "SUM(ps.mk_4k) AS k4",
+        "SUM(ps.mk_5k) AS k5",
+        "SUM(ps.utility_damage) AS util",
+        "SUM(ps.damage) AS damage",
     ]
-    if HAS_MVPS:
-        select_cols.append("SUM(COALESCE(ps.mvps,0)) AS mvps")
-    if HAS_FLASH:
+    if has_mvps:
+        select_cols.append("SUM(ps.mvps) AS mvps")
+    if has_flash:
         select_cols += [
-            "SUM(COALESCE(ps.enemies_flashed,0)) AS flashed",
-            "SUM(COALESCE(ps.flash_count,0)) AS flash_count",
+            "SUM(ps.enemies_flashed) AS flashed",
+            "SUM(ps.flash_count) AS flash_count",
         ]
-    if HAS_FLASH_SUCC:
-        select_cols.append("SUM(COALESCE(ps.flash_successes,0)) AS flash_successes")
+    if has_flash_succ:
+        select_cols.append("SUM(ps.flash_successes) AS flash_successes")
 
     select_cols += [
-        "SUM(COALESCE(mp.score_team1,0)+COALESCE(mp.score_team2,0)) AS rounds",
-        "SUM(COALESCE(ps.clutch_kills,0))    AS clutch_kills",
-        "SUM(COALESCE(ps.cl_1v1_attempts,0)) AS c11_att",
-        "SUM(COALESCE(ps.cl_1v1_wins,0))     AS c11_win",
-        "SUM(COALESCE(ps.cl_1v2_attempts,0)) AS c12_att",
-        "SUM(COALESCE(ps.cl_1v2_wins,0))     AS c12_win",
-        "SUM(COALESCE(ps.entry_count,0))     AS entry_count",
-        "SUM(COALESCE(ps.entry_wins,0))      AS entry_win",
+        "SUM(mp.rounds_total) AS rounds",
+        "SUM(ps.clutch_kills)    AS clutch_kills",
+        "SUM(ps.cl_1v1_attempts) AS c11_att",
+        "SUM(ps.cl_1v1_wins)     AS c11_win",
+        "SUM(ps.cl_1v2_attempts) AS c12_att",
+        "SUM(ps.cl_1v2_wins)     AS c12_win",
+        "SUM(ps.entry_count)     AS entry_count",
+        "SUM(ps.entry_wins)      AS entry_win",
     ]
-    if HAS_PISTOL:
-        select_cols.append("SUM(COALESCE(ps.pistol_kills,0)) AS pistol_kills")
+    if has_pistol:
+        select_cols.append("SUM(ps.pistol_kills) AS pistol_kills")
+    return tuple(select_cols)
 
-    sql = f"""
+def _col_alias(expr: str) -> str:
+    return expr.rsplit(" AS ", 1)[1].strip()
+
+@lru_cache(maxsize=16)
+def _player_table_sql(has_pistol: bool, has_flash: bool, has_flash_succ: bool, has_mvps: bool, all_teams: bool = False) -> str:
+    """
+    Player table SELECT for the optional columns present; built once per schema variant.
+    all_teams=True: whole division grouped by (team_id, player_id), no team filter.
+    """
+    select_cols = _player_table_cols(has_pistol, has_flash, has_flash_succ, has_mvps)
+    if all_teams:
+        # Division rows fed in (team_id, id) order -- the order the per-team
+        # query reads ix_playerstats_team -- so float AVGs match it bit-for-bit.
+        source = """(
+        SELECT ps.* FROM player_stats ps
+        JOIN matches m ON m.match_id = ps.match_id
+        WHERE m.championship_id = ?
+        ORDER BY ps.team_id, ps.id
+      ) ps"""
+        where, group = "", "ps.team_id, ps.player_id"
+    else:
+        source = "player_stats ps"
+        where, group = "WHERE m.championship_id = ? AND ps.team_id = ?", "ps.player_id"
+
+    return f"""
       SELECT
         {", ".join(select_cols)}
-      FROM player_stats ps
+      FROM {source}
       JOIN matches m
         ON m.match_id = ps.match_id
       JOIN maps mp
         ON mp.match_id = ps.match_id AND mp.round_index = ps.round_index
       LEFT JOIN players pl
         ON pl.player_id = ps.player_id
-      WHERE m.championship_id = ? AND ps.team_id = ?
-      GROUP BY ps.player_id
-      ORDER BY kills DESC
+      {where}
+      GROUP BY {group}
+      ORDER BY {"ps.team_id, " if all_teams else ""}kills DESC
     """
-    rows = query(con, sql, (division_id, team_id))
 
-    out = []
-    for r in rows:
-        kills = r["kills"] or 0
-        deaths = r["deaths"] or 0
-        assists = r["assists"] or 0
-        kd = (kills / deaths) if deaths else float(kills)
-        rounds = r["rounds"] or 0
-        maps_played = r["maps_played"] or 0
-        rpm = (rounds / maps_played) if maps_played else 0.0
+def _player_table_flags(con: sqlite3.Connection) -> tuple[bool, bool, bool, bool]:
+    HAS_PISTOL = has_column(con, "player_stats", "pistol_kills")
+    HAS_FLASH  = (has_column(con, "player_stats", "enemies_flashed")
+                  and has_column(con, "player_stats", "flash_count"))
+    HAS_FLASH_SUCC = has_column(con, "player_stats", "flash_successes")
+    HAS_MVPS  = has_column(con, "player_stats", "mvps")
+    return HAS_PISTOL, HAS_FLASH, HAS_FLASH_SUCC, HAS_MVPS
 
-        row = {
-            "player_id": r["player_id"],
-            "nickname": r["nickname_display"],
-            "maps_played": maps_played,
-            "rounds": rounds,
-            "rpm": rpm,
-            "kd": kd,
-            "adr": r["adr"] or 0.0,
-            "kr": r["kr"] or 0.0,
-            "kill": kills,
-            "death": deaths,
-            "assist": assists,
-            "mvps": r.get("mvps", 0) or 0,
-            "hs_pct": r["hs_pct"] or 0.0,
-            "awp_kills": r["awp_kills"] or 0,
-            "k2": r["k2"] or 0,
-            "k3": r["k3"] or 0,
-            "k4": r["k4"] or 0,
-            "k5": r["k5"] or 0,
-            "util": r["util"] or 0,
-            "clutch_kills": r["clutch_kills"] or 0,
-            "c11_att": r["c11_att"] or 0,
-            "c11_win": r["c11_win"] or 0,
-            "c12_att": r["c12_att"] or 0,
-            "c12_win": r["c12_win"] or 0,
-            "entry_count": r["entry_count"] or 0,
-            "entry_win": r["entry_win"] or 0,
-            "damage": r["damage"] or 0,
-        }
-        if "pistol_kills" in r.keys():
-            row["pistol_kills"] = r["pistol_kills"] or 0
-        if "flashed" in r.keys():        row["flashed"] = r["flashed"] or 0
-        if "flash_count" in r.keys():    row["flash_count"] = r["flash_count"] or 0
-        if "flash_successes" in r.keys():row["flash_successes"] = r["flash_successes"] or 0
+# -------------------------
+# player_champ_agg: player table rows materialized per championship
+# -------------------------
+# Filled by refresh_champ_agg at the end of each sync pass with exactly the rows
+# the live player table query returns, so the HTML path reads a few hundred
+# rows instead of joining player_stats ⋈ matches ⋈ maps per division.
+# player_champ_agg_state records MAX(matches.last_seen_at) at refresh time; every
+# match write moves last_seen_at, so newer matches mean the rows are stale.
+
+@lru_cache(maxsize=16)
+def _champ_agg_insert_sql(has_pistol: bool, has_flash: bool, has_flash_succ: bool, has_mvps: bool) -> str:
+    flags = (has_pistol, has_flash, has_flash_succ, has_mvps)
+    aliases = [_col_alias(c) for c in _player_table_cols(*flags)]
+    return (f"INSERT INTO player_champ_agg (championship_id, {', '.join(aliases)})\n"
+            f"SELECT ?, {', '.join(aliases)} FROM ({_player_table_sql(*flags, all_teams=True)})")
+
+@lru_cache(maxsize=16)
+def _champ_agg_select_sql(has_pistol: bool, has_flash: bool, has_flash_succ: bool, has_mvps: bool, one_team: bool = False) -> str:
+    # Only the columns the live query would return (_player_row keys off them).
+    # Rows were inserted in the live query's output order, so rowid order
+    # reproduces it including ties on kills.
+    aliases = [_col_alias(c) for c in _player_table_cols(has_pistol, has_flash, has_flash_succ, has_mvps)]
+    where = "championship_id = ? AND team_id = ?" if one_team else "championship_id = ?"
+    return f"SELECT {', '.join(aliases)} FROM player_champ_agg WHERE {where} ORDER BY rowid"
+
+_SQL_DELETE_CHAMP_AGG = "DELETE FROM player_champ_agg WHERE championship_id = ?"
+
+_SQL_MARK_CHAMP_AGG = """
+INSERT OR REPLACE INTO player_champ_agg_state (championship_id, last_seen_at)
+SELECT ?, COALESCE(MAX(last_seen_at), 0) FROM matches WHERE championship_id = ?
+"""
+
+# 1 when the marker is at least the newest match write (ix_matches_champ_last_seen
+# answers the MAX); no row when the championship was never marked
+_SQL_CHAMP_AGG_FRESH = """
+SELECT s.last_seen_at >= COALESCE((SELECT MAX(last_seen_at) FROM matches WHERE championship_id = ?1), 0)
+FROM player_champ_agg_state s
+WHERE s.championship_id = ?1
+"""
+
+def refresh_champ_agg(con: sqlite3.Connection, championship_id: str) -> None:
+    """
+    Rebuild player_champ_agg for one championship (DELETE + INSERT ... SELECT).
+    Does not commit: the caller owns the transaction (sync runs it as a DBWriter job).
+    """
+    flags = _player_table_flags(con)
+    con.execute(_SQL_DELETE_CHAMP_AGG, (championship_id,))
+    con.execute(_champ_agg_insert_sql(*flags), (championship_id, championship_id))
+    con.execute(_SQL_MARK_CHAMP_AGG, (championship_id, championship_id))
+
+def _champ_agg_rows(con: sqlite3.Connection, flags: tuple, params: tuple) -> Optional[list[dict]]:
+    # None -> not materialized (tables missing on an old DB, never refreshed, or
+    # matches written after the last refresh): use the live query
+    try:
+        fresh = query_one(con, _SQL_CHAMP_AGG_FRESH, (params[0],))
+        if not (fresh and fresh[0]):
+            return None
+        rows = query(con, _champ_agg_select_sql(*flags, one_team=len(params) == 2), params)
+    except sqlite3.OperationalError:
+        return None
+    return rows or None
 
-        out.append(row)
+def compute_player_table_data(con: sqlite3.Connection, division_id: int, team_id: str) -> list[dict[str, Any]]:
+    flags = _player_table_flags(con)
+    rows = _champ_agg_rows(con, flags, (division_id, team_id))
+    if rows is None:
+        rows = query(con, _player_table_sql(*flags), (division_id, team_id))
+    return [_player_row(r) for r in rows]
+
+def compute_all_player_tables(con: sqlite3.Connection, division_id: int) -> dict[str, list[dict[str, Any]]]:
+    """compute_player_table_data for every team of the division (player_champ_agg, else one grouped scan)."""
+    flags = _player_table_flags(con)
+    rows = _champ_agg_rows(con, flags, (division_id,))
+    if rows is None:
+        rows = query(con, _player_table_sql(*flags, all_teams=True), (division_id,))
+    out: dict[str, list[dict[str, Any]]] = defaultdict(list)
+    for r in rows:
+        out[r["team_id"]].append(_player_row(r))
+    return dict(out)
 
-    return out
+def _player_row(r: dict) -> dict[str, Any]:
+    kills = r["kills"] or 0
+    deaths = r["deaths"] or 0
+    assists = r["assists"] or 0
+    kd = (kills / deaths) if deaths else float(kills)
+    rounds = r["rounds"] or 0
+    maps_played = r["maps_played"] or 0
+    rpm = (rounds / maps_played) if maps_played else 0.0
+
+    row = {
+        "player_id": r["player_id"],
+        "nickname": r["nickname_display"],
+        "maps_played": maps_played,
+        "rounds": rounds,
+        "rpm": rpm,
+        "kd": kd,
+        "adr": r["adr"] or 0.0,
+        "kr": r["kr"] or 0.0,
+        "kill": kills,
+        "death": deaths,
+        "assist": assists,
+        "mvps": r.get("mvps", 0) or 0,
+        "hs_pct": r["hs_pct"] or 0.0,
+        "awp_kills": r["awp_kills"] or 0,
+        "k2": r["k2"] or 0,
+        "k3": r["k3"] or 0,
+        "k4": r["k4"] or 0,
+        "k5": r["k5"] or 0,
+        "util": r["util"] or 0,
+        "clutch_kills": r["clutch_kills"] or 0,
+        "c11_att": r["c11_att"] or 0,
+        "c11_win": r["c11_win"] or 0,
+        "c12_att": r["c12_att"] or 0,
+        "c12_win": r["c12_win"] or 0,
+        "entry_count": r["entry_count"] or 0,
+        "entry_win": r["entry_win"] or 0,
+        "damage": r["damage"] or 0,
+    }
+    if "pistol_kills" in r.keys():
+        row["pistol_kills"] = r["pistol_kills"] or 0
+    if "flashed" in r.keys():        row["flashed"] = r["flashed"] or 0
+    if "flash_count" in r.keys():    row["flash_count"] = r["flash_count"] or 0
+    if "flash_successes" in r.keys():row["flash_successes"] = r["flash_successes"] or 0
+    return row
+
+_SQL_CHAMP_MAP_AVGS = """
+SELECT
+  mp.map_name                                     AS map,
+  SUM(ps.kills)                                   AS kills,
+  SUM(ps.deaths)                                  AS deaths,
+  SUM(mp.rounds_total * COALESCE(ps.adr,0))      AS adr_w,
+  SUM(mp.rounds_total)                            AS rw
+FROM player_stats ps
+JOIN maps    mp ON mp.match_id = ps.match_id AND mp.round_index = ps.round_index
+JOIN matches m  ON m.match_id  = ps.match_id
+WHERE m.championship_id = ?
+AND mp.map_name <> 'forfeit'
+GROUP BY mp.map_name
+"""
 
 def compute_champ_map_avgs_data(con: sqlite3.Connection, division_id: int) -> dict[str, tuple[float, float]]:
     """
@@ -365,20 +1228,7 @@ def compute_champ_map_avgs_data(con: sqlite3.Connection, division_id: int) -> di
       - kd = SUM(kills) / SUM(deaths) kartalla
       - adr = kierros-painotettu ADR kartalla (paino = kartan pelatut kierrokset = score1+score2)
     """
-    rows = query(con, """
-        SELECT
-          mp.map_name                                     AS map,
-          SUM(ps.kills)                                   AS kills,
-          SUM(ps.deaths)                                  AS deaths,
-          SUM( (COALESCE(mp.score_team1,0)+COALESCE(mp.score_team2,0)) * COALESCE(ps.adr,0) ) AS adr_w,
-          SUM(  COALESCE(mp.score_team1,0)+COALESCE(mp.score_team2,0) )                        AS rw
-        FROM player_stats ps
-        JOIN maps    mp ON mp.match_id = ps.match_id AND mp.round_index = ps.round_index
-        JOIN matches m  ON m.match_id  = ps.match_id
-        WHERE m.championship_id = ?
-        AND mp.map_name <> 'forfeit'
-        GROUP BY mp.map_name
-    """, (division_id,))
+    rows = query(con, _SQL_CHAMP_MAP_AVGS, (division_id,))
 
     out: dict[str, tuple[float, float]] = {}
     for r in rows:
@@ -389,6 +1239,202 @@ def compute_champ_map_avgs_data(con: sqlite3.Connection, division_id: int) -> di
         out[r["map"]] = (kd, adr)
     return out
 
+_SQL_CHAMP_PLAYED_MAPS = """
+SELECT DISTINCT mp.map_name AS map_id
+FROM maps mp
+JOIN matches m ON m.match_id = mp.match_id
+WHERE m.championship_id = ?
+    AND mp.map_name IS NOT NULL AND mp.map_name <> ''
+    AND mp.map_name <> 'forfeit'
+"""
+
+_SQL_MAP_STATS = """
+WITH allmaps(map) AS (
+    SELECT value FROM json_each(:maps)
+),
+-- MATERIALIZED: computed once, every CTE below reads the same small row set
+-- (a TEMP table is not possible on the read-only HTML connection).
+-- Luetaan muodossa match_id IN (SELECT ... FROM my_matches): JOINina planneri
+-- rakensi bloom-filtterin koko map_votes/player_stats -taulusta joka kutsulla.
+my_matches AS MATERIALIZED (
+    SELECT m.match_id, m.team1_id, m.team2_id
+    FROM matches m
+    WHERE m.championship_id = :champ
+      AND (:team = m.team1_id OR :team = m.team2_id)
+),
+-- Pickit kerran per (match_id, map_name), omat ja vastustajan samalla
+-- map_votes-läpikäynnillä: LEFT JOIN korvaa rivikohtaiset EXISTS-haut
+picks_agg AS (
+    SELECT v.match_id, v.map_name,
+           MAX(CASE WHEN v.selected_by_team_id = :team THEN 1 ELSE 0 END) AS own_pick,
+           MAX(CASE WHEN v.selected_by_team_id IS NOT NULL AND v.selected_by_team_id <> :team
+                    THEN 1 ELSE 0 END) AS opp_pick
+    FROM map_votes v
+    WHERE v.match_id IN (SELECT match_id FROM my_matches)
+      AND v.status = 'pick'
+    GROUP BY v.match_id, v.map_name
+),
+team_maps AS (
+    -- Pelatut kartat + W/L sekä pick-alkuperä; samalla läpikäynnillä joukkueen
+    -- pelaajarivit karttakohtaisesti (KD/ADR), ei erillistä player_stats-skannia
+    SELECT
+        mp.map_name AS map,
+        CASE WHEN m.team1_id = :team THEN mp.score_team1 ELSE mp.score_team2 END AS rounds_for,
+        CASE WHEN m.team1_id = :team THEN mp.score_team2 ELSE mp.score_team1 END AS rounds_against,
+        CASE
+            WHEN m.team1_id = :team AND mp.score_team1 > mp.score_team2 THEN 1
+            WHEN m.team2_id = :team AND mp.score_team2 > mp.score_team1 THEN 1
+            ELSE 0
+        END AS win,
+        1 AS game,
+        COALESCE(pk.own_pick, 0) AS own_pick,
+        COALESCE(pk.opp_pick, 0) AS opp_pick,
+        SUM(ps.kills)                              AS kills,
+        SUM(ps.deaths)                             AS deaths,
+        SUM(mp.rounds_total * COALESCE(ps.adr,0))  AS adr_weighted,
+        mp.rounds_total * COUNT(ps.match_id)       AS rounds_weight
+    FROM my_matches m
+    JOIN maps mp
+      ON mp.match_id = m.match_id
+     AND mp.round_index IS NOT NULL
+    LEFT JOIN picks_agg pk ON pk.match_id = m.match_id AND pk.map_name = mp.map_name
+    LEFT JOIN player_stats ps
+      ON ps.match_id    = mp.match_id
+     AND ps.round_index = mp.round_index
+     AND ps.team_id     = :team
+    GROUP BY mp.match_id, mp.round_index
+),
+-- Omat dropit indeksoituna (1./2. ban)
+team_drops AS (
+    SELECT
+        v.match_id,
+        v.map_name,
+        v.selected_by_team_id,
+        v.round_num,
+        ROW_NUMBER() OVER (
+            PARTITION BY v.match_id, v.selected_by_team_id
+            ORDER BY COALESCE(v.round_num, 999), v.map_name
+        ) AS drop_idx
+    FROM map_votes v
+    WHERE v.match_id IN (SELECT match_id FROM my_matches)
+      AND v.status = 'drop'
+      AND v.selected_by_team_id = :team
+),
+-- Vastustajan dropit niissä matseissa joissa :team pelasi
+opp_drops AS (
+    SELECT v.match_id, v.map_name
+    FROM map_votes v
+    WHERE (v.match_id, v.selected_by_team_id) IN (
+            SELECT match_id, CASE WHEN team1_id = :team THEN team2_id ELSE team1_id END
+            FROM my_matches)
+      AND v.status = 'drop'
+),
+ban_counts AS (
+    -- Yksi GROUP BY -ajo dropeista (ei korreloituja COUNT-alikyselyitä per kartta)
+    SELECT map_name AS map,
+           SUM(CASE WHEN drop_idx = 1 THEN 1 ELSE 0 END)       AS ban1,
+           SUM(CASE WHEN drop_idx = 2 THEN 1 ELSE 0 END)       AS ban2,
+           SUM(CASE WHEN drop_idx IN (1,2) THEN 1 ELSE 0 END)  AS total_own_ban
+    FROM team_drops
+    GROUP BY map_name
+),
+opp_ban_counts AS (
+    SELECT map_name AS map, COUNT(*) AS opp_ban
+    FROM opp_drops
+    GROUP BY map_name
+),
+decov AS (
+    SELECT
+        v.map_name AS map,
+        COUNT(*)   AS decov_cnt
+    FROM map_votes v
+    WHERE v.match_id IN (SELECT match_id FROM my_matches)
+      AND v.status IN ('decider','overflow')
+    GROUP BY v.map_name
+)
+
+SELECT
+    am.map                                                        AS map,
+    COALESCE(COUNT(tm.map), 0)                                    AS played,
+    COALESCE(SUM(tm.own_pick), 0)                                 AS picks,
+    COALESCE(SUM(tm.opp_pick), 0)                                 AS opp_picks,
+
+    COALESCE(SUM(tm.win), 0)                                      AS wins,
+    COALESCE(SUM(tm.game), 0)                                     AS games,
+    CASE WHEN COALESCE(SUM(tm.game),0)=0 THEN 0.0
+         ELSE 100.0 * SUM(tm.win) / SUM(tm.game) END              AS wr,
+
+    COALESCE(SUM(CASE WHEN tm.own_pick=1 THEN tm.win  ELSE 0 END),0) AS wins_own,
+    COALESCE(SUM(CASE WHEN tm.own_pick=1 THEN tm.game ELSE 0 END),0) AS games_own,
+    CASE WHEN COALESCE(SUM(CASE WHEN tm.own_pick=1 THEN tm.game ELSE 0 END),0)=0 THEN 0.0
+         ELSE 100.0 * SUM(CASE WHEN tm.own_pick=1 THEN tm.win ELSE 0 END)
+                      / SUM(CASE WHEN tm.own_pick=1 THEN tm.game ELSE 0 END) END AS wr_own,
+
+    COALESCE(SUM(CASE WHEN tm.opp_pick=1 THEN tm.win  ELSE 0 END),0) AS wins_opp,
+    COALESCE(SUM(CASE WHEN tm.opp_pick=1 THEN tm.game ELSE 0 END),0) AS games_opp,
+    CASE WHEN COALESCE(SUM(CASE WHEN tm.opp_pick=1 THEN tm.game ELSE 0 END),0)=0 THEN 0.0
+         ELSE 100.0 * SUM(CASE WHEN tm.opp_pick=1 THEN tm.win ELSE 0 END)
+                      / SUM(CASE WHEN tm.opp_pick=1 THEN tm.game ELSE 0 END) END AS wr_opp,
+
+    COALESCE(SUM(tm.rounds_for), 0) - COALESCE(SUM(tm.rounds_against), 0) AS rd,
+
+    COALESCE(bc.ban1, 0)                                          AS ban1,
+    COALESCE(bc.ban2, 0)                                          AS ban2,
+    COALESCE(ob.opp_ban, 0)                                       AS opp_ban,
+    COALESCE(bc.total_own_ban, 0)                                 AS total_own_ban,
+
+    -- Nolla-jakajan suoja NULLIFillä (natiivi, kerran per kartta); Python-UDF
+    -- (create_function) maksaisi callbackin per kutsu eikä olisi nopeampi
+    COALESCE(1.0 * SUM(tm.kills) / NULLIF(SUM(tm.deaths),0), 0.0)  AS kd,
+    COALESCE(1.0 * SUM(tm.adr_weighted) / NULLIF(SUM(tm.rounds_weight),0), 0.0) AS adr,
+
+    COALESCE(dc.decov_cnt, 0)                                     AS decov
+
+FROM allmaps am
+LEFT JOIN team_maps tm ON tm.map = am.map
+LEFT JOIN ban_counts bc ON bc.map = am.map
+LEFT JOIN opp_ban_counts ob ON ob.map = am.map
+LEFT JOIN decov dc      ON dc.map = am.map
+GROUP BY am.map
+ORDER BY am.map
+"""
+
+# Viimeinen fallback jos seasonin poolia eikä muuta karttalistaa löydy
+_DEFAULT_MAP_POOL = ("de_nuke","de_inferno","de_mirage","de_overpass","de_dust2","de_ancient","de_train","de_anubis")
+
+# (database file, championship_id, fallback_sql) -> JSON map list. The same for
+# every team of a division, so the pool lookup / DISTINCT fallback scan runs once
+# per division instead of once per team. invalidate_caches() after writes.
+_MAP_POOL_CACHE: dict[tuple[str, Any, str], str] = {}
+
+def _map_pool_param(con: sqlite3.Connection, championship_id: int, fallback_sql: str, fallback_params: tuple = ()) -> str:
+    """
+    Map ids for the allmaps CTE as one JSON array (bound to :maps / json_each).
+    Season pool first, then fallback_sql, then _DEFAULT_MAP_POOL.
+    """
+    key = (_db_key(con), championship_id, fallback_sql)
+    cached = _MAP_POOL_CACHE.get(key)
+    if cached is not None:
+        return cached
+    pool = get_season_map_pool(con, championship_id)
+    if pool:
+        all_maps = [r["map_id"] for r in pool]
+    else:
+        all_maps = [r["map_id"] for r in query(con, fallback_sql, fallback_params)] or list(_DEFAULT_MAP_POOL)
+    _MAP_POOL_CACHE[key] = out = json.dumps(all_maps)
+    return out
+
+def invalidate_caches() -> None:
+    """Drop read-side caches derived from table contents (call when an ingest completes)."""
+    _invalidate_map_caches()
+    _TEAM_TS_CACHE.clear()
+    _CHAMP_LAST_SEEN_CACHE.clear()
+
+def _invalidate_map_caches() -> None:
+    # Catalog / season pool writes change these immediately (not only at ingest end)
+    _MAP_POOL_CACHE.clear()
+    _MAPS_CATALOG_CACHE.clear()
+
 def compute_map_stats_table_data(con, championship_id: int, team_id: str):
     """
     Palauttaa listan rivejä [{map, played, picks, opp_picks, wins, games, wr,
@@ -397,177 +1443,11 @@ def compute_map_stats_table_data(con, championship_id: int, team_id: str):
                                kd, adr, rd, ban1, ban2, opp_ban, total_own_ban,
                                decov}]
     """
-    # Map pool for the season; fallbacks if not present
-    pool = get_season_map_pool(con, championship_id)
-    if pool:
-        all_maps = [r["map_id"] for r in pool]
-    else:
-        rows = query(con, """
-            SELECT DISTINCT mp.map_name AS map_id
-            FROM maps mp
-            JOIN matches m ON m.match_id = mp.match_id
-            WHERE m.championship_id = ?
-                AND mp.map_name IS NOT NULL AND mp.map_name <> ''
-                AND mp.map_name <> 'forfeit'
-        """, (championship_id,))
-        if rows:
-            all_maps = [r["map_id"] for r in rows]
-        else:
-            all_maps = ["de_nuke","de_inferno","de_mirage","de_overpass","de_dust2","de_ancient","de_train","de_anubis"]
-
-    values_sql = ", ".join([f"('{m}')" for m in all_maps])
-
-    sql = f"""
-        WITH allmaps(map) AS (
-            VALUES {values_sql}
-        ),
-        my_matches AS (
-            SELECT m.*
-            FROM matches m
-            WHERE m.championship_id = :champ
-              AND (:team = m.team1_id OR :team = m.team2_id)
-        ),
-        team_maps AS (
-            -- Pelatut kartat + W/L sekä pick-alkuperä
-            SELECT
-                mp.map_name AS map,
-                CASE WHEN m.team1_id = :team THEN mp.score_team1 ELSE mp.score_team2 END AS rounds_for,
-                CASE WHEN m.team1_id = :team THEN mp.score_team2 ELSE mp.score_team1 END AS rounds_against,
-                CASE
-                    WHEN m.team1_id = :team AND mp.score_team1 > mp.score_team2 THEN 1
-                    WHEN m.team2_id = :team AND mp.score_team2 > mp.score_team1 THEN 1
-                    ELSE 0
-                END AS win,
-                1 AS game,
-                CASE WHEN EXISTS (
-                    SELECT 1 FROM map_votes v
-                    WHERE v.match_id = m.match_id
-                      AND LOWER(v.status) = 'pick'
-                      AND v.map_name = mp.map_name
-                      AND v.selected_by_team_id = :team
-                ) THEN 1 ELSE 0 END AS own_pick,
-                CASE WHEN EXISTS (
-                    SELECT 1 FROM map_votes v
-                    WHERE v.match_id = m.match_id
-                      AND LOWER(v.status) = 'pick'
-                      AND v.map_name = mp.map_name
-                      AND v.selected_by_team_id IS NOT NULL
-                      AND v.selected_by_team_id <> :team
-                ) THEN 1 ELSE 0 END AS opp_pick
-            FROM my_matches m
-            JOIN maps mp
-              ON mp.match_id = m.match_id
-             AND mp.round_index IS NOT NULL
-        ),
-        -- Omat dropit indeksoituna (1./2. ban)
-        team_drops AS (
-            SELECT
-                v.match_id,
-                v.map_name,
-                v.selected_by_team_id,
-                v.round_num,
-                ROW_NUMBER() OVER (
-                    PARTITION BY v.match_id, v.selected_by_team_id
-                    ORDER BY COALESCE(v.round_num, 999), v.map_name
-                ) AS drop_idx
-            FROM map_votes v
-            JOIN my_matches m ON m.match_id = v.match_id
-            WHERE LOWER(v.status) = 'drop'
-              AND v.selected_by_team_id = :team
-        ),
-        -- Vastustajan dropit niissä matseissa joissa :team pelasi
-        opp_drops AS (
-            SELECT v.match_id, v.map_name
-            FROM map_votes v
-            JOIN my_matches m ON m.match_id = v.match_id
-            WHERE LOWER(v.status) = 'drop'
-              AND (
-                    (m.team1_id = :team AND v.selected_by_team_id = m.team2_id) OR
-                    (m.team2_id = :team AND v.selected_by_team_id = m.team1_id)
-                  )
-        ),
-        ban_counts AS (
-            SELECT
-                am.map,
-                COALESCE((SELECT COUNT(*) FROM team_drops td WHERE td.map_name = am.map AND td.drop_idx = 1), 0) AS ban1,
-                COALESCE((SELECT COUNT(*) FROM team_drops td WHERE td.map_name = am.map AND td.drop_idx = 2), 0) AS ban2,
-                COALESCE((SELECT COUNT(*) FROM opp_drops od WHERE od.map_name = am.map), 0) AS opp_ban,
-                COALESCE((SELECT COUNT(*) FROM team_drops td WHERE td.map_name = am.map AND td.drop_idx IN (1,2)), 0) AS total_own_ban
-            FROM allmaps am
-        ),
-        -- Joukkueen KD/ADR karttatasolla
-        perf AS (
-            SELECT
-                mp.map_name AS map,
-                SUM(ps.kills)  AS kills,
-                SUM(ps.deaths) AS deaths,
-                SUM( (COALESCE(mp.score_team1,0)+COALESCE(mp.score_team2,0)) * COALESCE(ps.adr,0) ) AS adr_weighted,
-                SUM(  COALESCE(mp.score_team1,0)+COALESCE(mp.score_team2,0) )                          AS rounds_weight
-            FROM player_stats ps
-            JOIN my_matches m
-              ON m.match_id = ps.match_id
-            JOIN maps mp
-              ON mp.match_id   = ps.match_id
-             AND mp.round_index = ps.round_index
-            WHERE ps.team_id = :team
-            GROUP BY mp.map_name
-        ),
-
-        decov AS (
-            SELECT
-                v.map_name AS map,
-                COUNT(*)   AS decov_cnt
-            FROM map_votes v
-            JOIN my_matches m ON m.match_id = v.match_id
-            WHERE LOWER(v.status) IN ('decider','overflow')
-            GROUP BY v.map_name
-        )
-
-        SELECT
-            am.map                                                        AS map,
-            COALESCE(COUNT(tm.map), 0)                                    AS played,
-            COALESCE(SUM(tm.own_pick), 0)                                 AS picks,
-            COALESCE(SUM(tm.opp_pick), 0)                                 AS opp_picks,
-
-            COALESCE(SUM(tm.win), 0)                                      AS wins,
-            COALESCE(SUM(tm.game), 0)                                     AS games,
-            CASE WHEN COALESCE(SUM(tm.game),0)=0 THEN 0.0
-                 ELSE 100.0 * SUM(tm.win) / SUM(tm.game) END              AS wr,
-
-            COALESCE(SUM(CASE WHEN tm.own_pick=1 THEN tm.win  ELSE 0 END),0) AS wins_own,
-            COALESCE(SUM(CASE WHEN tm.own_pick=1 THEN tm.game ELSE 0 END),0) AS games_own,
-            CASE WHEN COALESCE(SUM(CASE WHEN tm.own_pick=1 THEN tm.game ELSE 0 END),0)=0 THEN 0.0
-                 ELSE 100.0 * SUM(CASE WHEN tm.own_pick=1 THEN tm.win ELSE 0 END)
-                              / SUM(CASE WHEN tm.own_pick=1 THEN tm.game ELSE 0 END) END AS wr_own,
-
-            COALESCE(SUM(CASE WHEN tm.opp_pick=1 THEN tm.win  ELSE 0 END),0) AS wins_opp,
-            COALESCE(SUM(CASE WHEN tm.opp_pick=1 THEN tm.game ELSE 0 END),0) AS games_opp,
-            CASE WHEN COALESCE(SUM(CASE WHEN tm.opp_pick=1 THEN tm.game ELSE 0 END),0)=0 THEN 0.0
-                 ELSE 100.0 * SUM(CASE WHEN tm.opp_pick=1 THEN tm.win ELSE 0 END)
-                              / SUM(CASE WHEN tm.opp_pick=1 THEN tm.game ELSE 0 END) END AS wr_opp,
-
-            COALESCE(SUM(tm.rounds_for), 0) - COALESCE(SUM(tm.rounds_against), 0) AS rd,
-
-            COALESCE(bc.ban1, 0)                                          AS ban1,
-            COALESCE(bc.ban2, 0)                                          AS ban2,
-            COALESCE(bc.opp_ban, 0)                                       AS opp_ban,
-            COALESCE(bc.total_own_ban, 0)                                 AS total_own_ban,
-
-            COALESCE(1.0 * p.kills / NULLIF(p.deaths,0), 0.0)             AS kd,
-            COALESCE(1.0 * p.adr_weighted / NULLIF(p.rounds_weight,0), 0.0) AS adr,
-
-            COALESCE(dc.decov_cnt, 0)                                     AS decov
-
-        FROM allmaps am
-        LEFT JOIN team_maps tm ON tm.map = am.map
-        LEFT JOIN ban_counts bc ON bc.map = am.map
-        LEFT JOIN perf p        ON p.map  = am.map
-        LEFT JOIN decov dc      ON dc.map = am.map
-        GROUP BY am.map
-        ORDER BY am.map
-    """
-
-    rows = query(con, sql, {"champ": championship_id, "team": team_id})
+    # Map pool for the season; fallbacks if not present.
+    # Map ids are bound as one JSON array: the statement text stays constant,
+    # so the prepared statement is reused for every team (and ids need no quoting).
+    maps = _map_pool_param(con, championship_id, _SQL_CHAMP_PLAYED_MAPS, (championship_id,))
+    rows = query(con, _SQL_MAP_STATS, {"champ": championship_id, "team": team_id, "maps": maps})
 
     # pretty names
     catalog = get_maps_catalog_lookup(con)
@@ -579,80 +1459,88 @@ def compute_map_stats_table_data(con, championship_id: int, team_id: str):
         out.append(r)
     return out
 
+_SQL_CHAMP_TOP_PLAYED = """
+SELECT mp.map_name AS map_name, COUNT(*) AS c
+FROM maps mp
+JOIN matches m ON m.match_id = mp.match_id
+WHERE m.championship_id = ? AND mp.map_name IS NOT NULL
+AND mp.map_name <> 'forfeit'
+GROUP BY mp.map_name
+ORDER BY c DESC, mp.map_name ASC
+LIMIT 4
+"""
+
+_SQL_CHAMP_TOP_BANNED = """
+SELECT v.map_name AS map_name, COUNT(*) AS c
+FROM map_votes v
+JOIN matches m ON m.match_id = v.match_id
+WHERE m.championship_id = ?
+  AND v.status = 'drop'
+  AND v.map_name IS NOT NULL
+GROUP BY v.map_name
+ORDER BY c DESC, v.map_name ASC
+LIMIT 4
+"""
+
 def compute_champ_map_summary_data(con: sqlite3.Connection, division_id: int) -> dict:
-    played_rows = query(con, """
-        SELECT mp.map_name AS map_name, COUNT(*) AS c
-        FROM maps mp
-        JOIN matches m ON m.match_id = mp.match_id
-        WHERE m.championship_id = ? AND mp.map_name IS NOT NULL
-        AND mp.map_name <> 'forfeit'
-        GROUP BY mp.map_name
-        ORDER BY c DESC, mp.map_name ASC
-        LIMIT 4
-    """, (division_id,))
+    played_rows = query(con, _SQL_CHAMP_TOP_PLAYED, (division_id,))
     top_played = [(r["map_name"], r["c"]) for r in played_rows]
 
-    ban_rows = query(con, """
-        SELECT v.map_name AS map_name, COUNT(*) AS c
-        FROM map_votes v
-        JOIN matches m ON m.match_id = v.match_id
-        WHERE m.championship_id = ?
-          AND v.status = 'drop'
-          AND v.map_name IS NOT NULL
-        GROUP BY v.map_name
-        ORDER BY c DESC, v.map_name ASC
-        LIMIT 4
-    """, (division_id,))
+    ban_rows = query(con, _SQL_CHAMP_TOP_BANNED, (division_id,))
     top_banned = [(r["map_name"], r["c"]) for r in ban_rows]
 
     return {"top_played": top_played, "top_banned": top_banned}
 
 
+# Every column comes back non-NULL (COALESCE) and in this order: the loop in
+# compute_champ_thresholds_data unpacks each row positionally.
+_SQL_CHAMP_THRESHOLDS = """
+SELECT
+  ps.player_id,
+  COALESCE(SUM(ps.kills),0)         AS kills,
+  COALESCE(SUM(ps.deaths),0)        AS deaths,
+  COALESCE(AVG(ps.adr),0.0)         AS adr,
+  COALESCE(AVG(ps.kr),0.0)          AS kr,
+  COALESCE(AVG(ps.hs_pct),0.0)      AS hs_pct,
+  COALESCE(SUM(ps.utility_damage),0) AS util,
+  COALESCE(SUM(mp.rounds_total),0)  AS rounds,
+  SUM(ps.entry_wins)    AS entry_wins,
+  SUM(ps.entry_count)   AS entry_count,
+  SUM(ps.cl_1v1_wins)   AS cl_1v1_wins,
+  SUM(ps.cl_1v1_attempts)   AS cl_1v1_attempts,
+  SUM(ps.cl_1v2_wins)   AS cl_1v2_wins,
+  SUM(ps.cl_1v2_attempts)   AS cl_1v2_attempts,
+  SUM(ps.enemies_flashed) AS enemies_flashed,
+  SUM(ps.flash_count)     AS flash_count,
+  SUM(ps.flash_successes) AS flash_successes
+FROM player_stats ps
+JOIN matches m ON m.match_id = ps.match_id
+JOIN maps mp   ON mp.match_id = ps.match_id AND mp.round_index = ps.round_index
+WHERE m.championship_id = ?
+GROUP BY ps.player_id
+"""
+
 def compute_champ_thresholds_data(con: sqlite3.Connection, division_id: int) -> dict:
-    rows = query(con, """
-      SELECT
-        ps.player_id,
-        SUM(ps.kills)                     AS kills,
-        SUM(ps.deaths)                    AS deaths,
-        AVG(ps.adr)                       AS adr,
-        AVG(ps.kr)                        AS kr,
-        AVG(ps.hs_pct)                    AS hs_pct,
-        SUM(ps.utility_damage)            AS util,
-        SUM(COALESCE(mp.score_team1,0)+COALESCE(mp.score_team2,0)) AS rounds,
-        SUM(COALESCE(ps.entry_wins,0))    AS entry_wins,
-        SUM(COALESCE(ps.entry_count,0))   AS entry_count,
-        SUM(COALESCE(ps.cl_1v1_wins,0))   AS cl_1v1_wins,
-        SUM(COALESCE(ps.cl_1v1_attempts,0))   AS cl_1v1_attempts,
-        SUM(COALESCE(ps.cl_1v2_wins,0))   AS cl_1v2_wins,
-        SUM(COALESCE(ps.cl_1v2_attempts,0))   AS cl_1v2_attempts,
-        SUM(COALESCE(ps.enemies_flashed,0)) AS enemies_flashed,
-        SUM(COALESCE(ps.flash_count,0))     AS flash_count,
-        SUM(COALESCE(ps.flash_successes,0)) AS flash_successes
-      FROM player_stats ps
-      JOIN matches m ON m.match_id = ps.match_id
-      JOIN maps mp   ON mp.match_id = ps.match_id AND mp.round_index = ps.round_index
-      WHERE m.championship_id = ?
-      GROUP BY ps.player_id
-    """, (division_id,))
-
-    def _percentile(lst, q):
-        lst = sorted(lst)
-        if not lst:
+    rows = query_iter(con, _SQL_CHAMP_THRESHOLDS, (division_id,))
+
+    def _percentile(srt, q):
+        # srt on jo järjestetty (pack lajittelee kerran kaikille kolmelle kvantiilille)
+        if not srt:
             return 0.0
-        pos = (len(lst) - 1) * q
+        pos = (len(srt) - 1) * q
         i = int(pos)
         frac = pos - i
-        if i + 1 < len(lst):
-            return lst[i] + frac * (lst[i + 1] - lst[i])
-        return lst[i]
+        if i + 1 < len(srt):
+            return srt[i] + frac * (srt[i + 1] - srt[i])
+        return srt[i]
 
     def pack(lst, fallback=(0.0, 0.5, 1.0)):
-        lst = [v for v in lst if v is not None]
-        if not lst:
+        srt = sorted([v for v in lst if v is not None])
+        if not srt:
             return fallback
-        p25 = _percentile(lst, 0.25)
-        p50 = _percentile(lst, 0.50)
-        p75 = _percentile(lst, 0.75)
+        p25 = _percentile(srt, 0.25)
+        p50 = _percentile(srt, 0.50)
+        p75 = _percentile(srt, 0.75)
         if p25 == p75:
             p25 = min(p25, p25 * 0.9)
             p75 = max(p75, p75 * 1.1 if p75 != 0 else 0.1)
@@ -662,18 +1550,11 @@ def compute_champ_thresholds_data(con: sqlite3.Connection, division_id: int) ->
     entrywr_vals, c11_vals, c12_vals, enem_per_flash_vals, survival_vals, rating1_vals = [], [], [], [], [], []
     flash_succ_vals = []
 
-    for r in rows:
-        kills  = r["kills"] or 0
-        deaths = r["deaths"] or 0
+    for (_pid, kills, deaths, adr, kr, hs_pct, util, rounds,
+         ewin, eatt, c11_win, c11_att, c12_win, c12_att,
+         efl, fct, fsu) in rows:
         kd = (kills / deaths) if deaths else float(kills)
-
-        adr = r["adr"] or 0.0
-        kr  = r["kr"] or 0.0
-        hs_pct = r["hs_pct"] or 0.0
-
-        rounds = r["rounds"] or 0
-        util   = r["util"] or 0
-        udpr   = (util / rounds) if rounds else 0.0
+        udpr = (util / rounds) if rounds else 0.0
 
         deaths_per_round = (deaths / rounds) if rounds else 0.0
         survival = max(0.0, 1.0 - deaths_per_round) * 100.0
@@ -681,23 +1562,11 @@ def compute_champ_thresholds_data(con: sqlite3.Connection, division_id: int) ->
         survival_ratio = survival / 100.0
         rating1 = ((kr / 0.679) + (survival_ratio / 0.317) + (adr / 79.9)) / 3.0
 
-        ewin = r["entry_wins"]  or 0
-        eatt = r["entry_count"] or 0
         entry_wr = (100.0 * ewin / eatt) if eatt else None
-
-        c11_att = r.get("cl_1v1_attempts", 0) or 0
-        c11_win = r.get("cl_1v1_wins", 0) or 0
         c11_wr = (c11_win / c11_att * 100.0) if c11_att else 0.0
-
-        c12_att = r.get("cl_1v2_attempts", 0) or 0
-        c12_win = r.get("cl_1v2_wins", 0) or 0
         c12_wr = (c12_win / c12_att * 100.0) if c12_att else 0.0
 
-        efl = r["enemies_flashed"] or 0
-        fct = r["flash_count"]     or 0
         enem_per_flash = (efl / fct) if fct else None
-
-        fsu = r["flash_successes"] or 0
         flash_succ = (100.0 * fsu / fct) if fct else None  # percent 0..100
 
         kd_vals.append(kd)
@@ -735,220 +1604,423 @@ def upsert_match(con: sqlite3.Connection, row: dict) -> None:
     Upsert 'matches' header. last_seen_at päivittyy aina.
     Ei tallenna joukkueiden nimiä; nimet haetaan teams-taulusta.
     """
-    sql = """
-    INSERT INTO matches(
-      match_id, championship_id,
-      best_of,
-      configured_at, started_at, finished_at, scheduled_at, status,
-      last_seen_at,
-      team1_id, team2_id, winner_team_id
-    ) VALUES (
-      :match_id, :championship_id,
-      :best_of,
-      :configured_at, :started_at, :finished_at, :scheduled_at, :status,
-      strftime('%s','now'),
-      :team1_id, :team2_id, :winner_team_id
-    )
-    ON CONFLICT(match_id) DO UPDATE SET
-      best_of       = COALESCE(excluded.best_of,       matches.best_of),
+    upsert_matches_many(con, [row])
+
+# Optional columns are normalized once ({**_MATCH_EMPTY, **row}, all C-level) and
+# read back positionally with a single itemgetter call.
+_MATCH_COLS = (
+    "match_id", "championship_id",
+    "best_of",
+    "configured_at", "started_at", "finished_at", "scheduled_at", "status",
+    "team1_id", "team2_id", "winner_team_id",
+)
+_MATCH_EMPTY = dict.fromkeys(_MATCH_COLS)
+_match_values = itemgetter(*_MATCH_COLS)
+
+_SQL_UPSERT_MATCH = """
+INSERT INTO matches(
+  match_id, championship_id,
+  best_of,
+  configured_at, started_at, finished_at, scheduled_at, status,
+  team1_id, team2_id, winner_team_id,
+  last_seen_at
+) VALUES (
+  ?, ?,
+  ?,
+  ?, ?, ?, ?, ?,
+  ?, ?, ?,
+  strftime('%s','now')
+)
+ON CONFLICT(match_id) DO UPDATE SET
+  best_of       = COALESCE(excluded.best_of,       matches.best_of),
+
+  configured_at = COALESCE(excluded.configured_at, matches.configured_at),
+  started_at    = COALESCE(excluded.started_at,    matches.started_at),
+  finished_at   = COALESCE(excluded.finished_at,   matches.finished_at),
+  scheduled_at  = COALESCE(excluded.scheduled_at,  matches.scheduled_at),
+  status        = COALESCE(excluded.status,        matches.status),
+
+  team1_id      = COALESCE(excluded.team1_id,      matches.team1_id),
+  team2_id      = COALESCE(excluded.team2_id,      matches.team2_id),
+  winner_team_id= COALESCE(excluded.winner_team_id, matches.winner_team_id),
+
+  last_seen_at  = strftime('%s','now')
+"""
+
+def upsert_matches_many(con: sqlite3.Connection, rows: Iterable[dict]) -> None:
+    """
+    Batch version of upsert_match(): one prepared statement reused via executemany().
+    Missing optional keys are treated as NULL (i.e. keep the stored value).
+    """
+    _CHAMP_LAST_SEEN_CACHE.clear()  # last_seen_at moves on every upsert
+    _cur(con, "upsert_match").executemany(_SQL_UPSERT_MATCH, (_match_values({**_MATCH_EMPTY, **r}) for r in _forget_synced(rows)))
+
+# --- multi-row VALUES helpers ------------------------------------------------
+# One INSERT ... VALUES (...),(...),... per match instead of one statement
+# execution per row. Chunked under SQLite's default 999 bound-parameter limit.
 
-      configured_at = COALESCE(excluded.configured_at, matches.configured_at),
-      started_at    = COALESCE(excluded.started_at,    matches.started_at),
-      finished_at   = COALESCE(excluded.finished_at,   matches.finished_at),
-      scheduled_at  = COALESCE(excluded.scheduled_at,  matches.scheduled_at),
-      status        = COALESCE(excluded.status,        matches.status),
+_SQLITE_MAX_PARAMS = 999
 
-      team1_id      = COALESCE(excluded.team1_id,      matches.team1_id),
-      team2_id      = COALESCE(excluded.team2_id,      matches.team2_id),
-      winner_team_id= COALESCE(excluded.winner_team_id, matches.winner_team_id),
+@lru_cache(maxsize=None)
+def _values_sql(n_cols: int, n_rows: int) -> str:
+    row = "(" + ", ".join("?" * n_cols) + ")"
+    return ", ".join([row] * n_rows)
 
-      last_seen_at  = strftime('%s','now')
+def _execute_values(cur, sql_for_n, rows: Iterable[tuple], n_cols: int) -> None:
     """
-    con.execute(sql, row)
+    cur: connection or helper cursor.
+    rows: positional tuples of n_cols values (any iterable; consumed one chunk
+    at a time, so a generator is never materialized as a whole list).
+    sql_for_n(n) returns the (cached) statement text for n rows, so each
+    distinct size is prepared only once.
+    """
+    size = max(1, _SQLITE_MAX_PARAMS // n_cols)
+    it = iter(rows)
+    while part := list(islice(it, size)):
+        cur.execute(sql_for_n(len(part)), [v for row in part for v in row])
+
+@lru_cache(maxsize=None)
+def build_upsert(table: str, key_cols: tuple[str, ...], cols: tuple[str, ...], n_rows: int = 1, guard: bool = True) -> str:
+    """
+    INSERT INTO table(key_cols + cols) VALUES ... ON CONFLICT(key_cols) DO UPDATE
+    for `cols` only. Memoized per column tuple: a caller that passes a subset of
+    the columns gets its own narrower statement that leaves the rest untouched.
+    guard=True adds "WHERE old IS NOT new" so re-syncing identical data is a
+    no-op (no dirty page, no WAL frame).
+    """
+    all_cols = key_cols + cols
+    sql = (f"INSERT INTO {table}({', '.join(all_cols)})\n"
+           f"VALUES {_values_sql(len(all_cols), n_rows)}\n"
+           f"ON CONFLICT({', '.join(key_cols)}) DO ")
+    if not cols:
+        return sql + "NOTHING"
+    sql += "UPDATE SET\n  " + ",\n  ".join(f"{c}=excluded.{c}" for c in cols)
+    if guard:
+        sql += "\nWHERE " + "\n   OR ".join(f"{table}.{c} IS NOT excluded.{c}" for c in cols)
+    return sql
+
+_MAP_VALUE_COLS = ("round_index", "map_name", "score_team1", "score_team2", "winner_team_id")
+_map_values = itemgetter(*_MAP_VALUE_COLS)
+
+_MAP_KEY_COLS = ("match_id", "round_index")
+_MAP_UPDATE_COLS = _MAP_VALUE_COLS[1:]
+
+@lru_cache(maxsize=None)
+def _sql_upsert_maps(n_rows: int) -> str:
+    return build_upsert("maps", _MAP_KEY_COLS, _MAP_UPDATE_COLS, n_rows)
 
 def upsert_maps(con, match_id: str, rounds: list[dict]):
-    sql = """
-    INSERT INTO maps(match_id, round_index, map_name, score_team1, score_team2, winner_team_id)
-    VALUES(:match_id, :round_index, :map_name, :score_team1, :score_team2, :winner_team_id)
-    ON CONFLICT(match_id, round_index) DO UPDATE SET
-      map_name=excluded.map_name,
-      score_team1=excluded.score_team1,
-      score_team2=excluded.score_team2,
-      winner_team_id=excluded.winner_team_id
-    """
-    payload = [{**r, "match_id": match_id} for r in rounds]
-    con.executemany(sql, payload)
+    """
+    All maps of one match in a single multi-row upsert.
+    rounds: {round_index, map_name, score_team1, score_team2, winner_team_id}
+    """
+    _SYNCED_SNAPSHOTS.pop(match_id, None)
+    rows = ((match_id, *_map_values(r)) for r in rounds)
+    _execute_values(_cur(con, "upsert_maps"), _sql_upsert_maps, rows, 1 + len(_MAP_VALUE_COLS))
+
+def upsert_maps_many(con, rows: Iterable[dict]) -> None:
+    """
+    rows: {match_id, round_index, map_name, score_team1, score_team2, winner_team_id}
+    """
+    _cur(con, "upsert_maps").executemany(_sql_upsert_maps(1), ((r["match_id"], *_map_values(r)) for r in _forget_synced(rows)))
+
+_SQL_DELETE_MAP_VOTES = "DELETE FROM map_votes WHERE match_id = ?"
+
+_VOTE_VALUE_COLS = ("round_num", "map_name", "status", "selected_by_faction", "selected_by_team_id")
+_vote_get = itemgetter(*_VOTE_VALUE_COLS)
+
+def _vote_values(v: dict) -> tuple:
+    # status stored lowercase: read queries compare it without LOWER()
+    round_num, map_name, status, faction, team_id = _vote_get(v)
+    return (round_num, map_name, status.lower() if status else status, faction, team_id)
+
+@lru_cache(maxsize=None)
+def _sql_insert_votes(n_rows: int) -> str:
+    return (f"INSERT INTO map_votes(match_id, {', '.join(_VOTE_VALUE_COLS)})\n"
+            f"VALUES {_values_sql(1 + len(_VOTE_VALUE_COLS), n_rows)}")
+
+# Conflict target = the ux_map_votes expression index (NULL-safe natural key)
+_VOTE_CONFLICT = "match_id, COALESCE(round_num,-1), COALESCE(map_name,''), COALESCE(status,'')"
+
+@lru_cache(maxsize=None)
+def _sql_upsert_votes(n_rows: int) -> str:
+    return (_sql_insert_votes(n_rows) + f"\nON CONFLICT({_VOTE_CONFLICT}) DO UPDATE SET\n"
+            "  selected_by_faction=excluded.selected_by_faction,\n"
+            "  selected_by_team_id=excluded.selected_by_team_id\n"
+            "WHERE map_votes.selected_by_faction IS NOT excluded.selected_by_faction\n"
+            "   OR map_votes.selected_by_team_id IS NOT excluded.selected_by_team_id")
+
+@lru_cache(maxsize=None)
+def _sql_prune_votes(n_keys: int) -> str:
+    # Rows of the match whose (round_num, map_name, status) is not in the new set.
+    # IS compares NULL-safely; the column affinity applies, as it did on insert.
+    return ("DELETE FROM map_votes WHERE match_id = ? AND NOT EXISTS (\n"
+            f"  SELECT 1 FROM (VALUES {_values_sql(3, n_keys)}) k\n"
+            "  WHERE k.column1 IS map_votes.round_num AND k.column2 IS map_votes.map_name\n"
+            "    AND k.column3 IS map_votes.status)")
 
 def upsert_map_votes(con, match_id: str, votes: list[dict]):
     """
-    Replace all veto rows for a match to avoid duplicates between sync runs.
+    Make the match's veto rows equal to `votes` (no duplicates between sync runs).
     votes: {round_num, map_name, status, selected_by_faction, selected_by_team_id}
+    UPSERT on the natural key, then one DELETE for rows no longer present:
+    unchanged votes cause no page writes. Both run as one unit (a SAVEPOINT
+    inside the caller's transaction, else its own BEGIN IMMEDIATE).
+    """
+    rows = [(match_id, *_vote_values(v)) for v in votes]
+    cur = _cur(con, "map_votes")
+    with bulk(con):
+        if not rows:
+            cur.execute(_SQL_DELETE_MAP_VOTES, (match_id,))
+            return
+        _execute_values(cur, _sql_upsert_votes, rows, 1 + len(_VOTE_VALUE_COLS))
+        keys = dict.fromkeys(r[1:4] for r in rows)
+        if 1 + 3 * len(keys) <= _SQLITE_MAX_PARAMS:
+            cur.execute(_sql_prune_votes(len(keys)), [match_id, *(v for k in keys for v in k)])
+        else:  # very long payload: fall back to a full rewrite
+            cur.execute(_SQL_DELETE_MAP_VOTES, (match_id,))
+            _execute_values(cur, _sql_insert_votes, rows, 1 + len(_VOTE_VALUE_COLS))
+
+def insert_votes_many(con, rows: Iterable[dict]) -> None:
+    """
+    Plain batch INSERT for veto rows (callers handle de-duplication).
+    rows: {match_id, round_num, map_name, status, selected_by_faction, selected_by_team_id}
     """
-    con.execute("DELETE FROM map_votes WHERE match_id = ?", (match_id,))
-    sql = """
-    INSERT INTO map_votes(match_id, round_num, map_name, status, selected_by_faction, selected_by_team_id)
-    VALUES(:match_id, :round_num, :map_name, :status, :selected_by_faction, :selected_by_team_id)
+    _cur(con, "map_votes").executemany(_sql_insert_votes(1), ((r["match_id"], *_vote_values(r)) for r in rows))
+
+# player_stats payloads are positional: one itemgetter call per row builds the
+# value tuple in C instead of 30 named-parameter lookups. Rows missing stat
+# columns take the narrower statement (see _pstat_groups); key columns are required.
+_PSTAT_VALUE_COLS = (
+    "round_index", "player_id", "team_id",
+    "kills", "deaths", "assists", "kd", "kr", "adr", "hs_pct", "mvps", "sniper_kills", "utility_damage",
+    "enemies_flashed", "flash_count", "flash_successes",
+    "mk_2k", "mk_3k", "mk_4k", "mk_5k",
+    "clutch_kills", "cl_1v1_attempts", "cl_1v1_wins", "cl_1v2_attempts", "cl_1v2_wins",
+    "entry_count", "entry_wins", "pistol_kills", "damage",
+)
+_pstat_values = itemgetter(*_PSTAT_VALUE_COLS)
+
+# Columns rewritten on conflict (everything except the key).
+_PSTAT_KEY_COLS = ("match_id", "round_index", "player_id")
+_PSTAT_UPDATE_COLS = _PSTAT_VALUE_COLS[2:]
+_PSTAT_ALL_KEYS = frozenset(_PSTAT_VALUE_COLS)
+
+def _pstat_groups(rows: Iterable[dict], match_id: Optional[str] = None) -> Dict[tuple, list]:
     """
-    payload = [{**v, "match_id": match_id} for v in votes]
-    con.executemany(sql, payload)
+    Group value tuples by the stat columns a row actually carries. Complete rows
+    (the sync path) share the full statement via itemgetter; partial rows get a
+    narrower build_upsert() that does not touch the columns they lack.
+    """
+    full: list = []
+    groups: Dict[tuple, list] = {_PSTAT_UPDATE_COLS: full}
+    for r in rows:
+        mid = match_id if match_id is not None else r["match_id"]
+        if _PSTAT_ALL_KEYS <= r.keys():
+            full.append((mid, *_pstat_values(r)))
+        else:
+            cols = tuple(c for c in _PSTAT_UPDATE_COLS if c in r)
+            groups.setdefault(cols, []).append((mid, r["round_index"], r["player_id"], *[r[c] for c in cols]))
+    return groups
+
+def _upsert_pstat_groups(con, groups: Dict[tuple, list]) -> None:
+    # Multi-row VALUES upserts (chunked by _execute_values): a match's ~30 rows
+    # go in as one statement instead of one executemany step per row.
+    cur = _cur(con, "player_stats")
+    for cols, values in groups.items():
+        if values:
+            _execute_values(cur, lambda n, cols=cols: build_upsert("player_stats", _PSTAT_KEY_COLS, cols, n),
+                            values, len(_PSTAT_KEY_COLS) + len(cols))
 
 def upsert_player_stats(con, match_id: str, rows: list[dict]):
-    sql = """
-    INSERT INTO player_stats(
-      match_id, round_index, player_id, team_id,
-      kills, deaths, assists, kd, kr, adr, hs_pct, mvps, sniper_kills, utility_damage,
-      enemies_flashed, flash_count, flash_successes,
-      mk_2k, mk_3k, mk_4k, mk_5k,
-      clutch_kills, cl_1v1_attempts, cl_1v1_wins, cl_1v2_attempts, cl_1v2_wins,
-      entry_count, entry_wins, pistol_kills, damage
-    )
-    VALUES(
-      :match_id, :round_index, :player_id, :team_id,
-      :kills, :deaths, :assists, :kd, :kr, :adr, :hs_pct, :mvps, :sniper_kills, :utility_damage,
-      :enemies_flashed, :flash_count, :flash_successes,
-      :mk_2k, :mk_3k, :mk_4k, :mk_5k,
-      :clutch_kills, :cl_1v1_attempts, :cl_1v1_wins, :cl_1v2_attempts, :cl_1v2_wins,
-      :entry_count, :entry_wins, :pistol_kills, :damage
+    _SYNCED_SNAPSHOTS.pop(match_id, None)
+    _upsert_pstat_groups(con, _pstat_groups(rows, match_id))
+
+def upsert_player_stats_many(con, rows: Iterable[dict]) -> None:
+    """
+    rows: per-map player stat dicts incl. match_id (see _extract_player_rows in sync.py)
+    """
+    _upsert_pstat_groups(con, _pstat_groups(_forget_synced(rows)))
+
+# Skip-logic probe for sync: header fields + existence flags in one statement
+# (one prepare, one index seek per table) instead of three separate queries.
+_SQL_MATCH_SNAPSHOT = """
+SELECT m.match_id IS NOT NULL,
+       m.status, m.scheduled_at, m.started_at, m.finished_at, m.team1_id, m.team2_id,
+       EXISTS(SELECT 1 FROM maps WHERE match_id = q.id),
+       EXISTS(SELECT 1 FROM maps WHERE match_id = q.id AND map_name = 'forfeit'),
+       EXISTS(SELECT 1 FROM player_stats WHERE match_id = q.id)
+FROM (SELECT ? AS id) AS q
+LEFT JOIN matches m ON m.match_id = q.id
+"""
+
+_FINISHED_STATUSES = ("finished", "played", "closed")
+
+# Snapshots of matches that are finished and complete. That state is monotonic
+# during a sync run, so re-checks are answered without touching SQLite.
+# Writes to matches/maps/player_stats drop the entry (see _forget_synced).
+# The cache assumes one database per process; open_pool() resets it.
+_SYNCED_SNAPSHOTS: dict[str, dict] = {}
+
+def clear_sync_cache() -> None:
+    """Forget all per-run caches: 'fully synced' snapshots and known identities."""
+    _SYNCED_SNAPSHOTS.clear()
+    clear_identity_cache()
+
+def _forget_synced(rows: Iterable[dict]) -> Iterator[dict]:
+    # Pass-through for executemany payloads; invalidates touched matches on the way.
+    for r in rows:
+        _SYNCED_SNAPSHOTS.pop(r.get("match_id"), None)
+        yield r
+
+def get_match_snapshot(con: sqlite3.Connection, match_id: str) -> dict:
+    """
+    Snapshot used by sync's skip logic:
+      {exists, status, scheduled_at, started_at, finished_at, team1_id, team2_id,
+       has_any_map, has_forfeit_map, has_player_stats, fully_synced}
+    status is lowercased (None if the match is not in DB).
+    fully_synced = finished and has player_stats (or maps incl. a 'forfeit' map).
+    """
+    cached = _SYNCED_SNAPSHOTS.get(match_id)
+    if cached is not None:
+        return dict(cached)
+
+    (exists, status, sched, start, finish, t1, t2,
+     has_any_map, has_ff_map, has_ps) = _cur(con, "match_snapshot").execute(_SQL_MATCH_SNAPSHOT, (match_id,)).fetchone()
+    snap = {
+        "exists": bool(exists),
+        "status": (status or "").lower() if exists else None,
+        "scheduled_at": sched, "started_at": start, "finished_at": finish,
+        "team1_id": t1, "team2_id": t2,
+        "has_any_map": bool(has_any_map), "has_player_stats": bool(has_ps), "has_forfeit_map": bool(has_ff_map),
+    }
+    snap["fully_synced"] = snap["status"] in _FINISHED_STATUSES and (
+        snap["has_player_stats"] or (snap["has_any_map"] and snap["has_forfeit_map"])
     )
-    ON CONFLICT(match_id, round_index, player_id) DO UPDATE SET
-      team_id=excluded.team_id,
-      kills=excluded.kills, deaths=excluded.deaths, assists=excluded.assists, kd=excluded.kd,
-      kr=excluded.kr, adr=excluded.adr, hs_pct=excluded.hs_pct, mvps=excluded.mvps,
-      sniper_kills=excluded.sniper_kills, utility_damage=excluded.utility_damage,
-      enemies_flashed=excluded.enemies_flashed, flash_count=excluded.flash_count, flash_successes=excluded.flash_successes,
-      mk_2k=excluded.mk_2k, mk_3k=excluded.mk_3k, mk_4k=excluded.mk_4k, mk_5k=excluded.mk_5k,
-      clutch_kills=excluded.clutch_kills, cl_1v1_attempts=excluded.cl_1v1_attempts, cl_1v1_wins=excluded.cl_1v1_wins,
-      cl_1v2_attempts=excluded.cl_1v2_attempts, cl_1v2_wins=excluded.cl_1v2_wins,
-      entry_count=excluded.entry_count, entry_wins=excluded.entry_wins,
-      pistol_kills=excluded.pistol_kills, damage=excluded.damage
-    """
-    payload = [{**r, "match_id": match_id} for r in rows]
-    con.executemany(sql, payload)
+    if snap["fully_synced"]:
+        _SYNCED_SNAPSHOTS[match_id] = dict(snap)
+    return snap
+
+def match_fully_synced(con: sqlite3.Connection, match_id: str) -> bool:
+    return get_match_snapshot(con, match_id)["fully_synced"]
+
+# MATERIALIZED + vain avaimet: ps_agg/picks lukevat saman pienen id-joukon
+_SQL_MIRROR_MY_MATCHES = """
+WITH my_matches AS MATERIALIZED (
+  SELECT m.match_id, m.team1_id, m.team2_id
+  FROM matches m
+  WHERE m.championship_id = :champ
+    AND (:team = m.team1_id OR :team = m.team2_id)
+)"""
+
+# Otsikkorivi per matsi (nimet/avatarit kerran, ei jokaisella karttarivillä)
+_SQL_TEAM_MATCHES_MIRROR_HEAD = _SQL_MIRROR_MY_MATCHES + """
+SELECT
+  mm.match_id, mm.team1_id, mm.team2_id,
+  m.best_of, m.status,
+  COALESCE(m.started_at, m.scheduled_at, m.configured_at, 0) AS ts,
+  CASE WHEN m.finished_at IS NOT NULL THEN 1 ELSE 0 END AS played,
+  t1.name AS team1_name, t2.name AS team2_name,
+  t1.avatar AS t1_avatar, t2.avatar AS t2_avatar
+FROM my_matches mm
+JOIN matches m     ON m.match_id = mm.match_id
+LEFT JOIN teams t1 ON t1.team_id = mm.team1_id
+LEFT JOIN teams t2 ON t2.team_id = mm.team2_id
+ORDER BY ts ASC, mm.match_id ASC
+"""
+
+# Karttarivit: yksi rivi per pelattu kartta, joukkuesummat valmiiksi aggregoituna
+_SQL_TEAM_MATCHES_MIRROR_MAPS = _SQL_MIRROR_MY_MATCHES + """,
+ps_agg AS (
+  SELECT
+    ps.match_id, ps.round_index, ps.team_id,
+    SUM(ps.kills)   AS kills,
+    SUM(ps.deaths)  AS deaths,
+    SUM(ps.damage)  AS dmg,
+    AVG(NULLIF(ps.adr,0))       AS adr_avg
+  FROM player_stats ps
+  WHERE ps.match_id IN (SELECT match_id FROM my_matches)
+  GROUP BY ps.match_id, ps.round_index, ps.team_id
+),
+picks AS (
+  SELECT v.match_id, v.map_name,
+         MAX(v.selected_by_team_id) AS pick_team_id
+  FROM map_votes v
+  WHERE v.match_id IN (SELECT match_id FROM my_matches)
+    AND v.status = 'pick'
+  GROUP BY v.match_id, v.map_name
+)
+SELECT
+  ma.match_id, ma.round_index, ma.map_name, pk.pick_team_id,
+  -- Suunta SQL:ssä: "me" = :team, "opp" = matsin toinen joukkue
+  COALESCE(CASE WHEN mm.team1_id = :team THEN ma.score_team1 ELSE ma.score_team2 END, 0) AS rf,
+  COALESCE(CASE WHEN mm.team1_id = :team THEN ma.score_team2 ELSE ma.score_team1 END, 0) AS ra,
+  COALESCE(me.kills, 0)      AS me_kills,
+  COALESCE(me.deaths, 0)     AS me_deaths,
+  COALESCE(me.adr_avg, 0.0)  AS me_adr,
+  COALESCE(me.dmg, 0)        AS me_dmg,
+  COALESCE(1.0 * me.kills / NULLIF(me.deaths, 0), 1.0 * COALESCE(me.kills, 0)) AS me_kd,
+  COALESCE(op.kills, 0)      AS opp_kills,
+  COALESCE(op.deaths, 0)     AS opp_deaths,
+  COALESCE(op.adr_avg, 0.0)  AS opp_adr,
+  COALESCE(op.dmg, 0)        AS opp_dmg,
+  COALESCE(1.0 * op.kills / NULLIF(op.deaths, 0), 1.0 * COALESCE(op.kills, 0)) AS opp_kd
+FROM my_matches mm
+JOIN maps ma ON ma.match_id = mm.match_id
+LEFT JOIN ps_agg me ON me.match_id=ma.match_id AND me.round_index=ma.round_index AND me.team_id=:team
+LEFT JOIN ps_agg op ON op.match_id=ma.match_id AND op.round_index=ma.round_index
+                   AND op.team_id = CASE WHEN mm.team1_id = :team THEN mm.team2_id ELSE mm.team1_id END
+LEFT JOIN picks pk  ON pk.match_id=ma.match_id AND pk.map_name=ma.map_name
+ORDER BY ma.match_id ASC, ma.round_index ASC
+"""
 
 def get_team_matches_mirror(con: sqlite3.Connection, championship_id: int, team_id: str) -> list[dict]:
-    cur = con.cursor()
-    sql = """
-    WITH my_matches AS (
-      SELECT
-        m.match_id, m.championship_id, m.team1_id, m.team2_id,
-        m.best_of, m.status,
-        COALESCE(m.started_at, m.scheduled_at, m.configured_at, 0) AS ts,
-        CASE WHEN m.finished_at IS NOT NULL THEN 1 ELSE 0 END AS played
-      FROM matches m
-      WHERE m.championship_id = :champ
-        AND (:team = m.team1_id OR :team = m.team2_id)
-    ),
-    mp AS (
-      SELECT
-        mm.match_id, mm.team1_id, mm.team2_id,
-        mm.best_of, mm.status, mm.ts, mm.played,
-        ma.round_index, ma.map_name, ma.score_team1, ma.score_team2
-      FROM my_matches mm
-      LEFT JOIN maps ma ON ma.match_id = mm.match_id
-    ),
-    ps_agg AS (
-      SELECT
-        ps.match_id, ps.round_index, ps.team_id,
-        SUM(COALESCE(ps.kills,0))   AS kills,
-        SUM(COALESCE(ps.deaths,0))  AS deaths,
-        SUM(COALESCE(ps.damage,0))  AS dmg,
-        AVG(NULLIF(ps.adr,0))       AS adr_avg
-      FROM player_stats ps
-      JOIN my_matches m ON m.match_id = ps.match_id
-      GROUP BY ps.match_id, ps.round_index, ps.team_id
-    ),
-    picks AS (
-      SELECT v.match_id, v.map_name,
-             MAX(v.selected_by_team_id) AS pick_team_id
-      FROM map_votes v
-      JOIN my_matches m ON m.match_id = v.match_id
-      WHERE v.status = 'pick'
-      GROUP BY v.match_id, v.map_name
-    )
-    SELECT
-      mp.match_id, mp.ts, mp.status, mp.best_of, mp.played,
-      mp.team1_id, mp.team2_id,
-      t1.name AS team1_name, t2.name AS team2_name,
-      t1.avatar AS t1_avatar, t2.avatar AS t2_avatar,
-      mp.round_index, mp.map_name, mp.score_team1, mp.score_team2,
-      pk.pick_team_id,
-      COALESCE(ps1.kills, 0)      AS t1_kills,
-      COALESCE(ps1.deaths, 0)     AS t1_deaths,
-      COALESCE(ps1.adr_avg, 0.0)  AS t1_adr,
-      COALESCE(ps1.dmg, 0)        AS t1_dmg,
-      COALESCE(ps2.kills, 0)      AS t2_kills,
-      COALESCE(ps2.deaths, 0)     AS t2_deaths,
-      COALESCE(ps2.adr_avg, 0.0)  AS t2_adr,
-      COALESCE(ps2.dmg, 0)        AS t2_dmg
-    FROM mp
-    LEFT JOIN ps_agg ps1 ON ps1.match_id=mp.match_id AND ps1.round_index=mp.round_index AND ps1.team_id=mp.team1_id
-    LEFT JOIN ps_agg ps2 ON ps2.match_id=mp.match_id AND ps2.round_index=mp.round_index AND ps2.team_id=mp.team2_id
-    LEFT JOIN picks pk    ON pk.match_id=mp.match_id AND pk.map_name=mp.map_name
-    LEFT JOIN teams t1    ON t1.team_id = mp.team1_id
-    LEFT JOIN teams t2    ON t2.team_id = mp.team2_id
-    ORDER BY (mp.ts IS NULL) ASC, mp.ts ASC, mp.match_id ASC, mp.round_index ASC
-    """
-    rows = cur.execute(sql, {"champ": championship_id, "team": team_id}).fetchall()
+    params = {"champ": championship_id, "team": team_id}
 
+    # Matsit valmiiksi järjestyksessä (ts, match_id); kartat liitetään match_id:llä
     out: dict[str, dict] = {}
-    for r in rows:
+    for r in con.execute(_SQL_TEAM_MATCHES_MIRROR_HEAD, params):
         mid = r["match_id"]
-        if mid not in out:
-            me_on_left = (r["team1_id"] == team_id)
-            opp_id = r["team2_id"] if me_on_left else r["team1_id"]
-            opp_name  = (r["team2_name"] if me_on_left else r["team1_name"])
-            opp_avatar= (r["t2_avatar"]  if me_on_left else r["t1_avatar"])
-            my_name   = (r["team1_name"] if me_on_left else r["team2_name"])
-
-            out[mid] = {
-                "match_id": mid,
-                "status": r["status"],
-                "best_of": r["best_of"],
-                "ts": r["ts"],
-                "played": int(r["played"] or 0),
-                "left":  {"team_id": team_id, "team_name": my_name or ""},
-                "right": {"team_id": opp_id,   "team_name": opp_name or "", "avatar": opp_avatar},
-                "maps": []
-            }
-
-        if r["round_index"] is None:
-            continue
-
-        me_is_t1 = (r["team1_id"] == team_id)
-        rf = (r["score_team1"] if me_is_t1 else r["score_team2"])
-        ra = (r["score_team2"] if me_is_t1 else r["score_team1"])
-
-        me_kills  = (r["t1_kills"]  if me_is_t1 else r["t2_kills"])  or 0
-        me_deaths = (r["t1_deaths"] if me_is_t1 else r["t2_deaths"]) or 0
-        me_adr    = (r["t1_adr"]    if me_is_t1 else r["t2_adr"])    or 0.0
-        me_damage = (r["t1_dmg"]    if me_is_t1 else r["t2_dmg"])    or 0
-
-        opp_kills  = (r["t2_kills"]  if me_is_t1 else r["t1_kills"])  or 0
-        opp_deaths = (r["t2_deaths"] if me_is_t1 else r["t1_deaths"]) or 0
-        opp_adr    = (r["t2_adr"]    if me_is_t1 else r["t1_adr"])    or 0.0
-        opp_damage = (r["t2_dmg"]    if me_is_t1 else r["t1_dmg"])    or 0
-
-        me_kd  = (float(me_kills) / me_deaths) if me_deaths else float(me_kills)
-        opp_kd = (float(opp_kills) / opp_deaths) if opp_deaths else float(opp_kills)
+        me_on_left = (r["team1_id"] == team_id)
+        opp_id = r["team2_id"] if me_on_left else r["team1_id"]
+        opp_name  = (r["team2_name"] if me_on_left else r["team1_name"])
+        opp_avatar= (r["t2_avatar"]  if me_on_left else r["t1_avatar"])
+        my_name   = (r["team1_name"] if me_on_left else r["team2_name"])
+
+        out[mid] = {
+            "match_id": mid,
+            "status": r["status"],
+            "best_of": r["best_of"],
+            "ts": r["ts"],
+            "played": int(r["played"] or 0),
+            "left":  {"team_id": team_id, "team_name": my_name or ""},
+            "right": {"team_id": opp_id,   "team_name": opp_name or "", "avatar": opp_avatar},
+            "maps": []
+        }
 
-        out[mid]["maps"].append({
+    for r in con.execute(_SQL_TEAM_MATCHES_MIRROR_MAPS, params):
+        out[r["match_id"]]["maps"].append({
             "round_index": r["round_index"],
             "map": r["map_name"],
-            "rf": rf if rf is not None else 0,
-            "ra": ra if ra is not None else 0,
+            "rf": r["rf"],
+            "ra": r["ra"],
             "pick_team_id": r["pick_team_id"],
-            "left":  {"adr": float(me_adr or 0.0),  "kd": float(me_kd),  "dmg": int(me_damage),  "kills": int(me_kills),  "deaths": int(me_deaths)},
-            "right": {"adr": float(opp_adr or 0.0), "kd": float(opp_kd), "dmg": int(opp_damage), "kills": int(opp_kills), "deaths": int(opp_deaths)}
+            "left":  {"adr": r["me_adr"],  "kd": r["me_kd"],  "dmg": r["me_dmg"],  "kills": r["me_kills"],  "deaths": r["me_deaths"]},
+            "right": {"adr": r["opp_adr"], "kd": r["opp_kd"], "dmg": r["opp_dmg"], "kills": r["opp_kills"], "deaths": r["opp_deaths"]}
         })
 
-    return [out[mid] for mid in sorted(out, key=lambda k: (out[k]["ts"] is None, out[k]["ts"] or 0, k))]
+    return list(out.values())
 
 # --- Maps catalog helpers ----------------------------------------------------
 
+@lru_cache(maxsize=1024)
 def normalize_map_id(name: str) -> str:
     """Return canonical map_id like 'de_ancient' from variants like 'Ancient', 'de_ancient', 'ancient'."""
     if not name:
         return ""
+    # Already canonical (the common case): no string copies
+    if isinstance(name, str) and name.startswith("de_") and name.islower() and name.isidentifier():
+        return name
     s = str(name).strip().lower().replace(" ", "")
     if not s.startswith("de_"):
         s = "de_" + s
@@ -958,69 +2030,91 @@ def upsert_map_catalog(con: sqlite3.Connection, row: dict) -> None:
     """
     row: {map_id, pretty_name, image_sm, image_lg}
     """
-    sql = """
-    INSERT INTO maps_catalog (map_id, pretty_name, image_sm, image_lg, first_seen_at, last_seen_at)
-    VALUES (:map_id, :pretty_name, :image_sm, :image_lg, strftime('%s','now'), strftime('%s','now'))
-    ON CONFLICT(map_id) DO UPDATE SET
-      pretty_name = COALESCE(excluded.pretty_name, maps_catalog.pretty_name),
-      image_sm    = COALESCE(NULLIF(excluded.image_sm,''), maps_catalog.image_sm),
-      image_lg    = COALESCE(NULLIF(excluded.image_lg,''), maps_catalog.image_lg),
-      last_seen_at= strftime('%s','now')
-    """
-    con.execute(sql, row)
+    upsert_map_catalog_many(con, [row])
+
+_SQL_UPSERT_MAP_CATALOG = """
+INSERT INTO maps_catalog (map_id, pretty_name, image_sm, image_lg, first_seen_at, last_seen_at)
+VALUES (:map_id, :pretty_name, :image_sm, :image_lg, strftime('%s','now'), strftime('%s','now'))
+ON CONFLICT(map_id) DO UPDATE SET
+  pretty_name = COALESCE(excluded.pretty_name, maps_catalog.pretty_name),
+  image_sm    = COALESCE(NULLIF(excluded.image_sm,''), maps_catalog.image_sm),
+  image_lg    = COALESCE(NULLIF(excluded.image_lg,''), maps_catalog.image_lg),
+  last_seen_at= strftime('%s','now')
+"""
+
+def upsert_map_catalog_many(con: sqlite3.Connection, rows: Iterable[dict]) -> None:
+    _cur(con, "map_catalog").executemany(_SQL_UPSERT_MAP_CATALOG, rows)
+    _invalidate_map_caches()
 
 
 def add_map_to_season_pool(con: sqlite3.Connection, season: int, map_id: str) -> None:
-    con.execute(
-        "INSERT OR IGNORE INTO map_pool_seasons (season, map_id) VALUES (?, ?)",
-        (int(season), map_id)
-    )
+    add_maps_to_season_pool(con, season, [map_id])
+
+_SQL_ADD_MAP_TO_POOL = "INSERT OR IGNORE INTO map_pool_seasons (season, map_id) VALUES (?, ?)"
+
+def add_maps_to_season_pool(con: sqlite3.Connection, season: int, map_ids: Iterable[str]) -> None:
+    season = int(season)
+    _cur(con, "map_catalog").executemany(_SQL_ADD_MAP_TO_POOL, ((season, mid) for mid in map_ids))
+    _invalidate_map_caches()
 
 def get_map_art(con: sqlite3.Connection, map_name_or_id: str) -> dict | None:
     """
     Return {'map_id','pretty_name','image_sm','image_lg'} for given map name/id, or None.
     """
     mid = normalize_map_id(map_name_or_id)
-    cur = con.execute("SELECT map_id, pretty_name, image_sm, image_lg FROM maps_catalog WHERE map_id=?", (mid,))
-    row = cur.fetchone()
+    row = get_maps_catalog_lookup(con).get(mid)
     if not row:
         return None
-    return {"map_id": row[0], "pretty_name": row[1], "image_sm": row[2], "image_lg": row[3]}
+    return {"map_id": row["map_id"], "pretty_name": row["pretty_name"],
+            "image_sm": row["image_sm"], "image_lg": row["image_lg"]}
+
+_SQL_SEASON_MAP_POOL = """
+SELECT mc.map_id,
+       COALESCE(NULLIF(mc.pretty_name,''), mc.map_id) AS pretty_name
+FROM championships c
+JOIN map_pool_seasons s ON s.season = c.season
+JOIN maps_catalog mc    ON mc.map_id = s.map_id
+WHERE c.championship_id = ?
+ORDER BY pretty_name COLLATE NOCASE
+"""
 
 def get_season_map_pool(con: sqlite3.Connection, championship_id: int) -> list[dict]:
     """
     Palauttaa [{map_id, pretty_name}] championshipin seasonin map-poolista.
     """
-    sql = """
-    SELECT mc.map_id,
-           COALESCE(NULLIF(mc.pretty_name,''), mc.map_id) AS pretty_name
-    FROM championships c
-    JOIN map_pool_seasons s ON s.season = c.season
-    JOIN maps_catalog mc    ON mc.map_id = s.map_id
-    WHERE c.championship_id = ?
-    ORDER BY pretty_name COLLATE NOCASE
-    """
-    return query(con, sql, (championship_id,))
+    return query(con, _SQL_SEASON_MAP_POOL, (championship_id,))
+
+_SQL_MAPS_CATALOG = "SELECT map_id, pretty_name, image_sm, image_lg FROM maps_catalog"
+
+# database file -> catalog lookup; a handful of rows read on every team page
+# and map art call. Shared between callers: treat as read-only.
+# invalidate_caches() after writes.
+_MAPS_CATALOG_CACHE: dict[str, dict[str, dict]] = {}
 
 def get_maps_catalog_lookup(con: sqlite3.Connection) -> dict[str, dict]:
     """
-    map_id -> {pretty_name, image_sm, image_lg}
+    map_id -> {map_id, pretty_name, image_sm, image_lg}
     """
-    rows = query(con, "SELECT map_id, pretty_name, image_sm, image_lg FROM maps_catalog", ())
-    return {r["map_id"]: r for r in rows}
+    key = _db_key(con)
+    cached = _MAPS_CATALOG_CACHE.get(key)
+    if cached is not None:
+        return cached
+    rows = query(con, _SQL_MAPS_CATALOG, ())
+    _MAPS_CATALOG_CACHE[key] = out = {r["map_id"]: r for r in rows}
+    return out
+
+_SQL_DIV_GENERATED_TS = "SELECT MAX(last_seen_at) AS ts FROM matches WHERE championship_id = ?"
 
 def get_division_generated_ts(con: sqlite3.Connection, championship_id: str) -> int | None:
     """
     Returns latest sync timestamp (epoch seconds) for given championship,
     based on matches.last_seen_at MAX.
     """
-    cur = con.execute(
-        "SELECT MAX(last_seen_at) AS ts FROM matches WHERE championship_id = ?",
-        (championship_id,)
-    )
-    row = cur.fetchone()
+    row = query_one(con, _SQL_DIV_GENERATED_TS, (championship_id,))
     return int(row[0]) if row and row[0] is not None else None
 
+_SQL_MAX_LAST_SEEN_FOR_CHAMPS = "SELECT MAX(last_seen_at) FROM matches WHERE championship_id IN (SELECT value FROM json_each(?))"
+
 def get_max_last_seen_for_champs(con: sqlite3.Connection, champ_ids: list[str]) -> int | None:
     """
     Returns MAX(last_seen_at) across the given championships.
@@ -1028,15 +2122,57 @@ def get_max_last_seen_for_champs(con: sqlite3.Connection, champ_ids: list[str])
     """
     if not champ_ids:
         return None
-    placeholders = ",".join(["?"] * len(champ_ids))
-    sql = f"SELECT MAX(last_seen_at) FROM matches WHERE championship_id IN ({placeholders})"
-    cur = con.execute(sql, champ_ids)
-    row = cur.fetchone()
+    row = query_one(con, _SQL_MAX_LAST_SEEN_FOR_CHAMPS, (json.dumps(list(champ_ids)),))
     return int(row[0]) if row and row[0] is not None else None
 
 _TS_EXPR = "COALESCE(m.finished_at, m.started_at, m.scheduled_at, m.configured_at, m.last_seen_at, 0)"
 
 
+# (curr_ts, prev_ts) for every team of a championship in one pass:
+# distinct match timestamps per team (matches with at least one map row),
+# ranked newest first.
+_SQL_TEAMS_LAST_PREV_TS = f"""
+WITH tms AS (
+  SELECT m.team1_id AS team_id, { _TS_EXPR } AS ts
+  FROM matches m
+  WHERE m.championship_id = :champ AND m.team1_id IS NOT NULL
+    AND EXISTS (SELECT 1 FROM maps mp WHERE mp.match_id = m.match_id)
+  UNION
+  SELECT m.team2_id AS team_id, { _TS_EXPR } AS ts
+  FROM matches m
+  WHERE m.championship_id = :champ AND m.team2_id IS NOT NULL
+    AND EXISTS (SELECT 1 FROM maps mp WHERE mp.match_id = m.match_id)
+),
+ranked AS (
+  SELECT team_id, ts, ROW_NUMBER() OVER (PARTITION BY team_id ORDER BY ts DESC) AS rn
+  FROM tms
+)
+SELECT team_id,
+       MAX(CASE WHEN rn = 1 THEN ts END) AS curr_ts,
+       MAX(CASE WHEN rn = 2 THEN ts END) AS prev_ts
+FROM ranked
+WHERE rn <= 2
+GROUP BY team_id
+"""
+
+# (database file, championship_id) -> {team_id: (curr_ts, prev_ts)}.
+# The team summary / player / map deltas of every team read it, so the
+# division is ranked once instead of once per team and call.
+# invalidate_caches() after writes.
+_TEAM_TS_CACHE: dict[tuple[str, Any], dict[str, tuple[int | None, int | None]]] = {}
+
+def get_all_teams_curr_prev_ts(con: sqlite3.Connection, division_id: int) -> dict[str, tuple[int | None, int | None]]:
+    """
+    Returns {team_id: (curr_ts, prev_ts)} for every team with played maps in the championship.
+    """
+    key = (_db_key(con), division_id)
+    cached = _TEAM_TS_CACHE.get(key)
+    if cached is not None:
+        return cached
+    rows = con.execute(_SQL_TEAMS_LAST_PREV_TS, {"champ": division_id}).fetchall()
+    _TEAM_TS_CACHE[key] = out = {r[0]: (r[1], r[2]) for r in rows}
+    return out
+
 def _get_team_last_prev_ts(con: sqlite3.Connection, division_id: int, team_id: str) -> tuple[int | None, int | None]:
     """
     Returns (curr_ts, prev_ts) for this team within the championship,
@@ -1044,18 +2180,53 @@ def _get_team_last_prev_ts(con: sqlite3.Connection, division_id: int, team_id: s
     curr_ts = timestamp of most recent match the team played (with at least one map row)
     prev_ts = previous one, or None if not available
     """
-    rows = query(con, f"""
-        SELECT DISTINCT { _TS_EXPR } AS ts
-        FROM matches m
-        WHERE m.championship_id=? AND (m.team1_id=? OR m.team2_id=?)
-          AND EXISTS (SELECT 1 FROM maps mp WHERE mp.match_id = m.match_id)
-        ORDER BY ts ASC
-    """, (division_id, team_id, team_id))
-    if not rows:
-        return (None, None)
-    curr_ts = rows[-1]["ts"]
-    prev_ts = rows[-2]["ts"] if len(rows) >= 2 else None
-    return (curr_ts, prev_ts)
+    return get_all_teams_curr_prev_ts(con, division_id).get(team_id, (None, None))
+
+# Molemmat rajat (curr/prev) yhdellä ajolla: ehdolliset summat saman rivijoukon yli
+_SQL_TEAM_SUMMARY_UNTIL = f"""
+WITH team_maps AS (
+  SELECT m.match_id, { _TS_EXPR } AS ts, mp.winner_team_id, mp.rounds_total,
+         CASE WHEN m.team1_id = :team THEN COALESCE(mp.score_team1,0) - COALESCE(mp.score_team2,0)
+              WHEN m.team2_id = :team THEN COALESCE(mp.score_team2,0) - COALESCE(mp.score_team1,0)
+              ELSE 0 END AS rd
+  FROM matches m
+  JOIN maps mp ON mp.match_id = m.match_id
+  WHERE m.championship_id = :champ AND (m.team1_id = :team OR m.team2_id = :team)
+    AND { _TS_EXPR } <= :curr
+    AND mp.map_name <> 'forfeit'
+),
+team_ps AS (
+  SELECT { _TS_EXPR } AS ts,
+         ps.kills, ps.deaths, ps.damage, ps.utility_damage AS util
+  FROM player_stats ps
+  JOIN matches m ON m.match_id = ps.match_id
+  WHERE ps.team_id = :team AND m.championship_id = :champ AND { _TS_EXPR } <= :curr
+)
+-- Sarakkeet pareittain <x>_curr, <x>_prev: Python lukee ne row[0::2] / row[1::2]
+SELECT ma.*, pa.* FROM
+(SELECT
+  COUNT(DISTINCT match_id)                                          AS matches_played_curr,
+  COUNT(DISTINCT CASE WHEN ts <= :prev THEN match_id END)           AS matches_played_prev,
+  COUNT(*)                                                          AS maps_played_curr,
+  COALESCE(SUM(CASE WHEN ts <= :prev THEN 1 ELSE 0 END), 0)         AS maps_played_prev,
+  COALESCE(SUM(CASE WHEN winner_team_id = :team THEN 1 ELSE 0 END), 0) AS w_curr,
+  COALESCE(SUM(CASE WHEN ts <= :prev AND winner_team_id = :team THEN 1 ELSE 0 END), 0) AS w_prev,
+  COALESCE(SUM(rd), 0)                                              AS rd_curr,
+  COALESCE(SUM(CASE WHEN ts <= :prev THEN rd ELSE 0 END), 0)        AS rd_prev,
+  COALESCE(SUM(rounds_total), 0)                                    AS rounds_curr,
+  COALESCE(SUM(CASE WHEN ts <= :prev THEN rounds_total ELSE 0 END), 0) AS rounds_prev
+ FROM team_maps) ma,
+(SELECT
+  COALESCE(SUM(kills), 0)                                           AS kills_curr,
+  COALESCE(SUM(CASE WHEN ts <= :prev THEN kills ELSE 0 END), 0)     AS kills_prev,
+  COALESCE(SUM(deaths), 0)                                          AS deaths_curr,
+  COALESCE(SUM(CASE WHEN ts <= :prev THEN deaths ELSE 0 END), 0)    AS deaths_prev,
+  COALESCE(SUM(damage), 0)                                          AS damage_curr,
+  COALESCE(SUM(CASE WHEN ts <= :prev THEN damage ELSE 0 END), 0)    AS damage_prev,
+  COALESCE(SUM(util), 0)                                            AS util_curr,
+  COALESCE(SUM(CASE WHEN ts <= :prev THEN util ELSE 0 END), 0)      AS util_prev
+ FROM team_ps) pa
+"""
 
 def compute_team_summary_with_delta(con: sqlite3.Connection, division_id: int, team_id: str) -> dict:
     """
@@ -1063,55 +2234,19 @@ def compute_team_summary_with_delta(con: sqlite3.Connection, division_id: int, t
     Uses true per-round metrics for KR/ADR.
     """
     curr_ts, _ = _get_team_last_prev_ts(con, division_id, team_id)
+    zero = {"matches_played":0,"maps_played":0,"w":0,"l":0,"rd":0,"kd":0.0,"kr":0.0,"adr":0.0,"util":0}
 
-    def _summary_until(cutoff: int | None) -> dict:
-        if cutoff is None:
-            return {"matches_played":0,"maps_played":0,"w":0,"l":0,"rd":0,"kd":0.0,"kr":0.0,"adr":0.0,"util":0}
-
-        rows = query(con, f"""
-            SELECT m.match_id, m.team1_id, m.team2_id,
-                   mp.score_team1, mp.score_team2, mp.winner_team_id
-            FROM matches m
-            JOIN maps mp ON mp.match_id = m.match_id
-            WHERE m.championship_id=? AND (m.team1_id=? OR m.team2_id=?)
-              AND { _TS_EXPR } <= ?
-              AND mp.map_name <> 'forfeit'
-        """, (division_id, team_id, team_id, cutoff))
-        mids = {r["match_id"] for r in rows}
-        maps_played = len(rows)
-        matches_played = len(mids)
-        maps_w = sum(1 for r in rows if r.get("winner_team_id") == team_id)
-
-        rd = 0
-        for r in rows:
-            s1 = r.get("score_team1") or 0
-            s2 = r.get("score_team2") or 0
-            if r["team1_id"] == team_id:
-                rd += (s1 - s2)
-            elif r["team2_id"] == team_id:
-                rd += (s2 - s1)
+    if curr_ts is None:
+        return {"curr": dict(zero), "prev": None, "delta": None}
 
+    prev_cutoff = max(0, int(curr_ts) - 1)
+    row = query_one(con, _SQL_TEAM_SUMMARY_UNTIL,
+                    {"champ": division_id, "team": team_id, "curr": curr_ts, "prev": prev_cutoff})
+
+    def _summary(vals: tuple) -> dict:
+        (matches_played, maps_played, maps_w, rd, rounds, kills, deaths, damage, util) = vals
         if maps_played == 0:
-            return {"matches_played":0,"maps_played":0,"w":0,"l":0,"rd":0,"kd":0.0,"kr":0.0,"adr":0.0,"util":0}
-
-        rounds_sum = sum(((r.get("score_team1") or 0) + (r.get("score_team2") or 0)) for r in rows)
-
-        agg = query(con, f"""
-            SELECT
-            SUM(COALESCE(ps.kills,0))           AS kills,
-            SUM(COALESCE(ps.deaths,0))          AS deaths,
-            SUM(COALESCE(ps.damage,0))          AS damage,
-            SUM(COALESCE(ps.utility_damage,0))  AS util
-            FROM player_stats ps
-            JOIN matches m ON m.match_id = ps.match_id
-            WHERE ps.team_id=? AND m.championship_id=? AND { _TS_EXPR } <= ?
-        """, (team_id, division_id, cutoff))[0]
-
-        kills   = int(agg["kills"] or 0)
-        deaths  = int(agg["deaths"] or 0)
-        damage  = int(agg["damage"] or 0)
-        rounds  = int(rounds_sum)
-        util    = int(agg["util"] or 0)
+            return dict(zero)
 
         kd  = (kills / deaths) if deaths else (float(kills) if rounds else 0.0)
         kr  = (kills / rounds) if rounds else 0.0
@@ -1129,14 +2264,8 @@ def compute_team_summary_with_delta(con: sqlite3.Connection, division_id: int, t
             "util": util
         }
 
-    if curr_ts is None:
-        zero = _summary_until(None)
-        return {"curr": zero, "prev": None, "delta": None}
-
-    prev_cutoff = max(0, int(curr_ts) - 1)
-
-    prev = _summary_until(prev_cutoff)
-    curr = _summary_until(curr_ts)
+    prev = _summary(row[1::2])
+    curr = _summary(row[0::2])
 
     # Jos ennen viimeisintä ei ollut dataa → delta None
     if (prev["matches_played"]==0 and prev["maps_played"]==0 and prev["w"]==0 and prev["l"]==0 and
@@ -1150,87 +2279,106 @@ def compute_team_summary_with_delta(con: sqlite3.Connection, division_id: int, t
 # Player deltas (row aggregates)
 # -----------------------------
 
-def _player_agg_until(con: sqlite3.Connection, division_id: int, team_id: str, player_id: str, cutoff: int | None) -> dict:
+# (alias, player_stats column) summed per cutoff; _player_agg_row unpacks
+# the result columns in this order.
+_PLAYER_DELTA_SUMS = (
+    ("kills", "kills"), ("deaths", "deaths"), ("assists", "assists"), ("damage", "damage"),
+    ("k2", "mk_2k"), ("k3", "mk_3k"), ("k4", "mk_4k"), ("k5", "mk_5k"),
+    ("mvps", "mvps"), ("util", "utility_damage"),
+    ("flashed", "enemies_flashed"), ("flash_count", "flash_count"), ("flash_successes", "flash_successes"),
+    ("entry_count", "entry_count"), ("entry_wins", "entry_wins"),
+    ("clutch_kills", "clutch_kills"),
+    ("c11_att", "cl_1v1_attempts"), ("c11_win", "cl_1v1_wins"),
+    ("c12_att", "cl_1v2_attempts"), ("c12_win", "cl_1v2_wins"),
+    ("awp", "sniper_kills"), ("pistol_kills", "pistol_kills"),
+)
+
+def _player_deltas_sql() -> str:
+    # Yksi GROUP BY player_id -ajo: <alias>_curr (ts <= :curr) ja <alias>_prev (ts <= :prev)
+    aggs = [
+        "COUNT(*) AS maps_played_curr",
+        "COUNT(CASE WHEN ts <= :prev THEN 1 END) AS maps_played_prev",
+        "SUM(rounds_total) AS rounds_curr",
+        "SUM(CASE WHEN ts <= :prev THEN rounds_total END) AS rounds_prev",
+        "AVG(COALESCE(hs_pct,0)) AS hs_pct_curr",
+        "AVG(CASE WHEN ts <= :prev THEN COALESCE(hs_pct,0) END) AS hs_pct_prev",
+    ]
+    for alias, col in _PLAYER_DELTA_SUMS:
+        aggs.append(f"SUM({col}) AS {alias}_curr")
+        aggs.append(f"SUM(CASE WHEN ts <= :prev THEN {col} END) AS {alias}_prev")
+    agg_sql = ",\n  ".join(aggs)
+    return f"""
+WITH pids AS (
+  -- Kauden pelaajat (joilta on havaittu statsia)
+  SELECT DISTINCT ps.player_id
+  FROM player_stats ps
+  JOIN matches m ON m.match_id = ps.match_id
+  WHERE m.championship_id = :champ AND ps.team_id = :team
+),
+played AS (
+  SELECT ps.*, mp.rounds_total, { _TS_EXPR } AS ts
+  FROM player_stats ps
+  JOIN matches m ON m.match_id = ps.match_id
+  JOIN maps    mp ON mp.match_id = ps.match_id AND mp.round_index = ps.round_index
+  WHERE m.championship_id = :champ AND ps.team_id = :team AND { _TS_EXPR } <= :curr
+),
+agg AS (
+  SELECT player_id,
+  {agg_sql}
+  FROM played
+  GROUP BY player_id
+)
+-- pid, agg.player_id, sitten <x>_curr/<x>_prev -parit: Python lukee row[2::2] / row[3::2]
+SELECT pids.player_id AS pid, agg.*
+FROM pids
+LEFT JOIN agg ON agg.player_id = pids.player_id
+"""
+
+_SQL_PLAYER_DELTAS = _player_deltas_sql()
+
+def _player_agg_row(vals: tuple) -> dict:
     """
-    Aggregates player stats up to cutoff. Returns 0/None defaults for missing data.
+    Builds one player's aggregate (<= cutoff) from one half of a
+    _SQL_PLAYER_DELTAS row (the _curr or the _prev columns, in SELECT order:
+    maps_played, rounds, hs_pct, then _PLAYER_DELTA_SUMS). Returns 0 defaults
+    for missing data.
     Uses per-round true metrics:
       - adr = total_damage / total_rounds
       - kr  = total_kills  / total_rounds
       - kd  = kills / deaths  (kills if deaths=0 and rounds>0 else 0.0)
     """
-    if cutoff is None:
-        return {
-            "maps_played": 0, "rounds": 0,
-            "kills": 0, "deaths": 0, "assists": 0, "damage": 0,
-            "adr": 0.0, "kr": 0.0, "kd": 0.0,
-            "hs_pct": 0.0, "k2": 0, "k3": 0, "k4": 0, "k5": 0,
-            "mvps": 0, "util": 0, "udpr": 0.0,
-            "flashed": 0, "flash_count": 0, "flash_successes": 0,
-            "entry_count": 0, "entry_wins": 0,
-            "clutch_kills": 0, "c11_att": 0, "c11_win": 0, "c12_att": 0, "c12_win": 0,
-            "awp": 0, "pistol_kills": 0
-        }
+    (maps_played, rounds, hs_pct,
+     kills, deaths, assists, damage, k2, k3, k4, k5, mvps, util,
+     flashed, flash_count, flash_successes, entry_count, entry_wins, clutch_kills,
+     c11_att, c11_win, c12_att, c12_win, awp, pistol_kills) = [v or 0 for v in vals]
 
-    row = query(con, f"""
-        SELECT
-          COUNT(*) AS maps_played,
-          SUM(COALESCE(mp.score_team1,0) + COALESCE(mp.score_team2,0)) AS rounds,
-          SUM(COALESCE(ps.kills,0))          AS kills,
-          SUM(COALESCE(ps.deaths,0))         AS deaths,
-          SUM(COALESCE(ps.assists,0))        AS assists,
-          SUM(COALESCE(ps.damage,0))         AS damage,
-          AVG(COALESCE(ps.hs_pct,0))         AS hs_pct,
-          SUM(COALESCE(ps.mk_2k,0))          AS k2,
-          SUM(COALESCE(ps.mk_3k,0))          AS k3,
-          SUM(COALESCE(ps.mk_4k,0))          AS k4,
-          SUM(COALESCE(ps.mk_5k,0))          AS k5,
-          SUM(COALESCE(ps.mvps,0))           AS mvps,
-          SUM(COALESCE(ps.utility_damage,0)) AS util,
-          SUM(COALESCE(ps.enemies_flashed,0)) AS flashed,
-          SUM(COALESCE(ps.flash_count,0))     AS flash_count,
-          SUM(COALESCE(ps.flash_successes,0)) AS flash_successes,
-          SUM(COALESCE(ps.entry_count,0))     AS entry_count,
-          SUM(COALESCE(ps.entry_wins,0))      AS entry_wins,
-          SUM(COALESCE(ps.clutch_kills,0))    AS clutch_kills,
-          SUM(COALESCE(ps.cl_1v1_attempts,0)) AS c11_att,
-          SUM(COALESCE(ps.cl_1v1_wins,0))     AS c11_win,
-          SUM(COALESCE(ps.cl_1v2_attempts,0)) AS c12_att,
-          SUM(COALESCE(ps.cl_1v2_wins,0))     AS c12_win,
-          SUM(COALESCE(ps.sniper_kills,0))    AS awp,
-          SUM(COALESCE(ps.pistol_kills,0))    AS pistol_kills
-        FROM player_stats ps
-        JOIN matches m ON m.match_id = ps.match_id
-        JOIN maps    mp ON mp.match_id = ps.match_id AND mp.round_index = ps.round_index
-        WHERE m.championship_id=? AND ps.team_id=? AND ps.player_id=? AND { _TS_EXPR } <= ?
-    """, (division_id, team_id, player_id, cutoff))[0]
-
-    rounds = int(row["rounds"] or 0)
-    kills  = int(row["kills"]  or 0)
-    deaths = int(row["deaths"] or 0)
-    damage = int(row["damage"] or 0)
+    rounds = int(rounds)
+    kills  = int(kills)
+    deaths = int(deaths)
+    damage = int(damage)
 
     kd  = (kills / deaths) if deaths else (float(kills) if rounds else 0.0)
     kr  = (kills / rounds) if rounds else 0.0
     adr = (damage / rounds) if rounds else 0.0
-    udpr = (float(row["util"] or 0) / rounds) if rounds else 0.0
+    udpr = (float(util) / rounds) if rounds else 0.0
 
     return {
-        "maps_played": int(row["maps_played"] or 0),
+        "maps_played": int(maps_played),
         "rounds": rounds,
-        "kills": kills, "deaths": deaths, "assists": int(row["assists"] or 0),
+        "kills": kills, "deaths": deaths, "assists": int(assists),
         "damage": damage,
         "adr": float(adr), "kr": float(kr), "kd": float(kd),
-        "hs_pct": float(row["hs_pct"] or 0.0),
-        "k2": int(row["k2"] or 0), "k3": int(row["k3"] or 0), "k4": int(row["k4"] or 0), "k5": int(row["k5"] or 0),
-        "mvps": int(row["mvps"] or 0),
-        "util": int(row["util"] or 0), "udpr": float(udpr),
-        "flashed": int(row["flashed"] or 0), "flash_count": int(row["flash_count"] or 0), "flash_successes": int(row["flash_successes"] or 0),
-        "entry_count": int(row["entry_count"] or 0), "entry_wins": int(row["entry_wins"] or 0),
-        "clutch_kills": int(row["clutch_kills"] or 0),
-        "c11_att": int(row["c11_att"] or 0), "c11_win": int(row["c11_win"] or 0),
-        "c12_att": int(row["c12_att"] or 0), "c12_win": int(row["c12_win"] or 0),
-        "awp": int(row["awp"] or 0),
-        "pistol_kills": int(row["pistol_kills"] or 0),
+        "hs_pct": float(hs_pct),
+        "k2": int(k2), "k3": int(k3), "k4": int(k4), "k5": int(k5),
+        "mvps": int(mvps),
+        "util": int(util), "udpr": float(udpr),
+        "flashed": int(flashed), "flash_count": int(flash_count), "flash_successes": int(flash_successes),
+        "entry_count": int(entry_count), "entry_wins": int(entry_wins),
+        "clutch_kills": int(clutch_kills),
+        "c11_att": int(c11_att), "c11_win": int(c11_win),
+        "c12_att": int(c12_att), "c12_win": int(c12_win),
+        "awp": int(awp),
+        "pistol_kills": int(pistol_kills),
     }
 
 def compute_player_deltas(con: sqlite3.Connection, division_id: int, team_id: str) -> dict[str, dict]:
@@ -1243,27 +2391,21 @@ def compute_player_deltas(con: sqlite3.Connection, division_id: int, team_id: st
         return {}
 
     prev_cutoff = max(0, int(curr_ts) - 1)
-
-    # Kauden pelaajat (joilta on havaittu statsia)
-    pids = [r["player_id"] for r in query(con, """
-      SELECT DISTINCT ps.player_id
-      FROM player_stats ps
-      JOIN matches m ON m.match_id = ps.match_id
-      WHERE m.championship_id=? AND ps.team_id=?
-    """, (division_id, team_id))]
+    rows = query_tuples(con, _SQL_PLAYER_DELTAS,
+                        {"champ": division_id, "team": team_id, "curr": curr_ts, "prev": prev_cutoff})
 
     out: dict[str, dict] = {}
-    for pid in pids:
-        prev = _player_agg_until(con, division_id, team_id, pid, prev_cutoff)
-        curr = _player_agg_until(con, division_id, team_id, pid, curr_ts)
+    for r in rows:
+        pid = r[0]
+        prev = _player_agg_row(r[3::2])
+        curr = _player_agg_row(r[2::2])
 
         # Jos ennen viimeisintä ei ollut mitään, näytä prev=None, delta=None (UI näyttää "(no prev)")
         if prev["maps_played"] == 0 and prev["rounds"] == 0 and prev["kills"] == 0 and prev["deaths"] == 0 and prev["assists"] == 0:
             out[pid] = {"curr": curr, "prev": None, "delta": None}
         else:
-            delta = {}
-            for k in curr.keys():
-                delta[k] = (curr[k] - prev[k]) if isinstance(curr[k], (int, float)) else None
+            # Kaikki kentät numeerisia ja samassa järjestyksessä: yksi zip-läpikäynti
+            delta = {k: c - p for (k, c), p in zip(curr.items(), prev.values())}
             out[pid] = {"curr": curr, "prev": prev, "delta": delta}
     return out
 
@@ -1271,170 +2413,171 @@ def compute_player_deltas(con: sqlite3.Connection, division_id: int, team_id: st
 # Map deltas (per map rows)
 # -----------------------------
 
-def compute_map_stats_table_data_until(con: sqlite3.Connection, championship_id: int, team_id: str, cutoff_ts: int) -> list[dict]:
-    """
-    Same as compute_map_stats_table_data but only counting matches where _TS_EXPR <= cutoff_ts.
-    Note: 'dates' removed; only 'decov' is returned.
-    """
-    pool = get_season_map_pool(con, championship_id)
-    if pool:
-        all_maps = [r["map_id"] for r in pool]
-    else:
-        rows = query(con, "SELECT DISTINCT map_id FROM maps_catalog", ())
-        all_maps = [r["map_id"] for r in rows] if rows else [
-            "de_nuke","de_inferno","de_mirage","de_overpass","de_dust2","de_ancient","de_train","de_anubis"
-        ]
-    values_sql = ", ".join([f"('{m}')" for m in all_maps])
-
-    sql = f"""
-        WITH allmaps(map) AS ( VALUES {values_sql} ),
-
-        my_matches AS (
-            SELECT m.*
-            FROM matches m
-            WHERE m.championship_id = :champ
-              AND (:team = m.team1_id OR :team = m.team2_id)
-              AND { _TS_EXPR } <= :cutoff
-        ),
-
-        team_maps AS (
-            SELECT
-                mp.map_name AS map,
-                CASE WHEN m.team1_id = :team THEN mp.score_team1 ELSE mp.score_team2 END AS rounds_for,
-                CASE WHEN m.team1_id = :team THEN mp.score_team2 ELSE mp.score_team1 END AS rounds_against,
-                CASE
-                    WHEN m.team1_id = :team AND mp.score_team1 > mp.score_team2 THEN 1
-                    WHEN m.team2_id = :team AND mp.score_team2 > mp.score_team1 THEN 1
-                    ELSE 0
-                END AS win,
-                1 AS game,
-                CASE WHEN EXISTS (
-                    SELECT 1 FROM map_votes v
-                    WHERE v.match_id = m.match_id
-                      AND LOWER(v.status) = 'pick'
-                      AND v.map_name = mp.map_name
-                      AND v.selected_by_team_id = :team
-                ) THEN 1 ELSE 0 END AS own_pick,
-                CASE WHEN EXISTS (
-                    SELECT 1 FROM map_votes v
-                    WHERE v.match_id = m.match_id
-                      AND LOWER(v.status) = 'pick'
-                      AND v.map_name = mp.map_name
-                      AND v.selected_by_team_id IS NOT NULL
-                      AND v.selected_by_team_id <> :team
-                ) THEN 1 ELSE 0 END AS opp_pick
-            FROM my_matches m
-            JOIN maps mp ON mp.match_id = m.match_id AND mp.round_index IS NOT NULL
-        ),
-
-        team_drops AS (
-            SELECT
-                v.match_id,
-                v.map_name,
-                v.selected_by_team_id,
-                v.round_num,
-                ROW_NUMBER() OVER (
-                    PARTITION BY v.match_id, v.selected_by_team_id
-                    ORDER BY COALESCE(v.round_num, 999), v.map_name
-                ) AS drop_idx
-            FROM map_votes v
-            JOIN my_matches m ON m.match_id = v.match_id
-            WHERE LOWER(v.status) = 'drop' AND v.selected_by_team_id = :team
-        ),
-
-        opp_drops AS (
-            SELECT v.match_id, v.map_name
-            FROM map_votes v
-            JOIN my_matches m ON m.match_id = v.match_id
-            WHERE LOWER(v.status) = 'drop' AND (
-                (m.team1_id = :team AND v.selected_by_team_id = m.team2_id) OR
-                (m.team2_id = :team AND v.selected_by_team_id = m.team1_id)
-            )
-        ),
-
-        ban_counts AS (
-            SELECT am.map,
-                   COALESCE((SELECT COUNT(*) FROM team_drops td WHERE td.map_name = am.map AND td.drop_idx = 1), 0) AS ban1,
-                   COALESCE((SELECT COUNT(*) FROM team_drops td WHERE td.map_name = am.map AND td.drop_idx = 2), 0) AS ban2,
-                   COALESCE((SELECT COUNT(*) FROM opp_drops  od WHERE od.map_name = am.map), 0) AS opp_ban,
-                   COALESCE((SELECT COUNT(*) FROM team_drops td WHERE td.map_name = am.map AND td.drop_idx IN (1,2)), 0) AS total_own_ban
-            FROM allmaps am
-        ),
-
-        perf AS (
-            SELECT mp.map_name AS map,
-                   SUM(ps.kills) AS kills,
-                   SUM(ps.deaths) AS deaths,
-                   SUM( (COALESCE(mp.score_team1,0)+COALESCE(mp.score_team2,0)) * COALESCE(ps.adr,0) ) AS adr_weighted,
-                   SUM( COALESCE(mp.score_team1,0)+COALESCE(mp.score_team2,0) ) AS rounds_weight
-            FROM player_stats ps
-            JOIN my_matches m ON m.match_id = ps.match_id
-            JOIN maps mp       ON mp.match_id = ps.match_id AND mp.round_index = ps.round_index
-            WHERE ps.team_id = :team
-            GROUP BY mp.map_name
-        ),
-
-        decov AS (
-            SELECT
-                v.map_name AS map,
-                COUNT(*)   AS decov_cnt
-            FROM map_votes v
-            JOIN my_matches m ON m.match_id = v.match_id
-            WHERE LOWER(v.status) IN ('decider','overflow')
-            GROUP BY v.map_name
-        )
-
-        SELECT am.map AS map,
-
-               COALESCE(COUNT(tm.map), 0) AS played,
-               COALESCE(SUM(tm.own_pick), 0) AS picks,
-               COALESCE(SUM(tm.opp_pick), 0) AS opp_picks,
-
-               COALESCE(SUM(tm.win), 0) AS wins,
-               COALESCE(SUM(tm.game), 0) AS games,
-               CASE WHEN COALESCE(SUM(tm.game),0)=0 THEN 0.0
-                    ELSE 100.0 * SUM(tm.win) / SUM(tm.game) END AS wr,
-
-               COALESCE(SUM(CASE WHEN tm.own_pick=1 THEN tm.win  ELSE 0 END),0) AS wins_own,
-               COALESCE(SUM(CASE WHEN tm.own_pick=1 THEN tm.game ELSE 0 END),0) AS games_own,
-               CASE WHEN COALESCE(SUM(CASE WHEN tm.own_pick=1 THEN tm.game ELSE 0 END),0)=0 THEN 0.0
-                    ELSE 100.0 * SUM(CASE WHEN tm.own_pick=1 THEN tm.win ELSE 0 END)
-                                 / SUM(CASE WHEN tm.own_pick=1 THEN tm.game ELSE 0 END) END AS wr_own,
-
-               COALESCE(SUM(CASE WHEN tm.opp_pick=1 THEN tm.win  ELSE 0 END),0) AS wins_opp,
-               COALESCE(SUM(CASE WHEN tm.opp_pick=1 THEN tm.game ELSE 0 END),0) AS games_opp,
-               CASE WHEN COALESCE(SUM(CASE WHEN tm.opp_pick=1 THEN tm.game ELSE 0 END),0)=0 THEN 0.0
-                    ELSE 100.0 * SUM(CASE WHEN tm.opp_pick=1 THEN tm.win ELSE 0 END)
-                                 / SUM(CASE WHEN tm.opp_pick=1 THEN tm.game ELSE 0 END) END AS wr_opp,
-
-               COALESCE(SUM(tm.rounds_for), 0) - COALESCE(SUM(tm.rounds_against), 0) AS rd,
-
-               COALESCE(bc.ban1, 0) AS ban1,
-               COALESCE(bc.ban2, 0) AS ban2,
-               COALESCE(bc.opp_ban, 0) AS opp_ban,
-               COALESCE(bc.total_own_ban, 0) AS total_own_ban,
-
-               COALESCE(1.0 * p.kills / NULLIF(p.deaths, 0), 0.0)            AS kd,
-               COALESCE(1.0 * p.adr_weighted / NULLIF(p.rounds_weight, 0), 0.0) AS adr,
-
-               COALESCE(dc.decov_cnt, 0) AS decov
-
-        FROM allmaps am
-        LEFT JOIN team_maps tm ON tm.map = am.map
-        LEFT JOIN ban_counts bc ON bc.map = am.map
-        LEFT JOIN perf p        ON p.map  = am.map
-        LEFT JOIN decov dc      ON dc.map = am.map
-        GROUP BY am.map
-        ORDER BY am.map COLLATE NOCASE
-    """
-
-    res = con.execute(sql, {"champ": championship_id, "team": team_id, "cutoff": cutoff_ts}).fetchall()
-    out = [dict(r) for r in res]
-    return out
+_SQL_CATALOG_MAP_IDS = "SELECT DISTINCT map_id FROM maps_catalog"
+
+# Sama rakenne kuin _SQL_MAP_STATS, mutta molemmat rajat (:curr ja :prev)
+# samalla ajolla: my_matches kattaa ottelut <= :curr ja merkitsee in_prev-lipulla
+# ne, jotka olivat mukana jo <= :prev. Jokainen sarake lasketaan kahdesti,
+# <x> koko joukosta ja <x>_prev in_prev-riveistä (drop-järjestys ja pickit ovat
+# ottelukohtaisia, joten rajaus ei muuta niitä). Kertakäyttöiset CTE:t SQLite
+# litistää itse; vain my_matches materialisoidaan.
+_MAP_DELTA_CTES = f"""
+WITH allmaps(map) AS ( SELECT value FROM json_each(:maps) ),
+
+my_matches AS MATERIALIZED (
+    SELECT m.match_id, m.team1_id, m.team2_id, { _TS_EXPR } <= :prev AS in_prev
+    FROM matches m
+    WHERE m.championship_id = :champ
+      AND (:team = m.team1_id OR :team = m.team2_id)
+      AND { _TS_EXPR } <= :curr
+),
+
+-- Pickit kerran per (match_id, map_name), omat ja vastustajan samalla
+-- map_votes-läpikäynnillä: LEFT JOIN korvaa rivikohtaiset EXISTS-haut
+picks_agg AS (
+    SELECT v.match_id, v.map_name,
+           MAX(CASE WHEN v.selected_by_team_id = :team THEN 1 ELSE 0 END) AS own_pick,
+           MAX(CASE WHEN v.selected_by_team_id IS NOT NULL AND v.selected_by_team_id <> :team
+                    THEN 1 ELSE 0 END) AS opp_pick
+    FROM map_votes v
+    WHERE v.match_id IN (SELECT match_id FROM my_matches)
+      AND v.status = 'pick'
+    GROUP BY v.match_id, v.map_name
+),
+team_maps AS (
+    SELECT
+        mp.map_name AS map,
+        m.in_prev,
+        CASE WHEN m.team1_id = :team THEN mp.score_team1 ELSE mp.score_team2 END AS rounds_for,
+        CASE WHEN m.team1_id = :team THEN mp.score_team2 ELSE mp.score_team1 END AS rounds_against,
+        CASE
+            WHEN m.team1_id = :team AND mp.score_team1 > mp.score_team2 THEN 1
+            WHEN m.team2_id = :team AND mp.score_team2 > mp.score_team1 THEN 1
+            ELSE 0
+        END AS win,
+        1 AS game,
+        COALESCE(pk.own_pick, 0) AS own_pick,
+        COALESCE(pk.opp_pick, 0) AS opp_pick,
+        -- joukkueen KD/ADR samalla läpikäynnillä (ei erillistä perf-skannia)
+        SUM(ps.kills)                              AS kills,
+        SUM(ps.deaths)                             AS deaths,
+        SUM(mp.rounds_total * COALESCE(ps.adr,0))  AS adr_weighted,
+        mp.rounds_total * COUNT(ps.match_id)       AS rounds_weight
+    FROM my_matches m
+    JOIN maps mp ON mp.match_id = m.match_id AND mp.round_index IS NOT NULL
+    LEFT JOIN picks_agg pk ON pk.match_id = m.match_id AND pk.map_name = mp.map_name
+    LEFT JOIN player_stats ps
+      ON ps.match_id = mp.match_id AND ps.round_index = mp.round_index AND ps.team_id = :team
+    GROUP BY mp.match_id, mp.round_index
+),
+
+team_drops AS (
+    SELECT
+        v.map_name,
+        v.match_id IN (SELECT match_id FROM my_matches WHERE in_prev) AS in_prev,
+        ROW_NUMBER() OVER (
+            PARTITION BY v.match_id, v.selected_by_team_id
+            ORDER BY COALESCE(v.round_num, 999), v.map_name
+        ) AS drop_idx
+    FROM map_votes v
+    WHERE v.match_id IN (SELECT match_id FROM my_matches)
+      AND v.status = 'drop' AND v.selected_by_team_id = :team
+),
+
+opp_drops AS (
+    SELECT v.map_name,
+           v.match_id IN (SELECT match_id FROM my_matches WHERE in_prev) AS in_prev
+    FROM map_votes v
+    WHERE (v.match_id, v.selected_by_team_id) IN (
+            SELECT match_id, CASE WHEN team1_id = :team THEN team2_id ELSE team1_id END
+            FROM my_matches)
+      AND v.status = 'drop'
+),
+
+ban_counts AS (
+    -- Yksi GROUP BY -ajo dropeista (ei korreloituja COUNT-alikyselyitä per kartta)
+    SELECT map_name AS map,
+           SUM(CASE WHEN drop_idx = 1 THEN 1 ELSE 0 END)                   AS ban1,
+           SUM(CASE WHEN drop_idx = 2 THEN 1 ELSE 0 END)                   AS ban2,
+           SUM(CASE WHEN drop_idx IN (1,2) THEN 1 ELSE 0 END)              AS total_own_ban,
+           SUM(CASE WHEN in_prev AND drop_idx = 1 THEN 1 ELSE 0 END)       AS ban1_prev,
+           SUM(CASE WHEN in_prev AND drop_idx = 2 THEN 1 ELSE 0 END)       AS ban2_prev,
+           SUM(CASE WHEN in_prev AND drop_idx IN (1,2) THEN 1 ELSE 0 END)  AS total_own_ban_prev
+    FROM team_drops
+    GROUP BY map_name
+),
+opp_ban_counts AS (
+    SELECT map_name AS map, COUNT(*) AS opp_ban, SUM(in_prev) AS opp_ban_prev
+    FROM opp_drops
+    GROUP BY map_name
+),
+
+decov AS (
+    SELECT
+        v.map_name AS map,
+        COUNT(*)   AS decov_cnt,
+        SUM(v.match_id IN (SELECT match_id FROM my_matches WHERE in_prev)) AS decov_cnt_prev
+    FROM map_votes v
+    WHERE v.match_id IN (SELECT match_id FROM my_matches)
+      AND v.status IN ('decider','overflow')
+    GROUP BY v.map_name
+)
+"""
+
+def _map_delta_cols(sfx: str) -> list[str]:
+    # Output columns of one cutoff; sfx='' reads every team_maps row,
+    # sfx='_prev' only the in_prev ones (other rows become NULL for the aggregate).
+    def w(expr: str) -> str:
+        return f"CASE WHEN tm.in_prev THEN {expr} END" if sfx else expr
+    own_win  = w("CASE WHEN tm.own_pick=1 THEN tm.win  ELSE 0 END")
+    own_game = w("CASE WHEN tm.own_pick=1 THEN tm.game ELSE 0 END")
+    opp_win  = w("CASE WHEN tm.opp_pick=1 THEN tm.win  ELSE 0 END")
+    opp_game = w("CASE WHEN tm.opp_pick=1 THEN tm.game ELSE 0 END")
+    return [
+        f"COALESCE(COUNT({w('tm.map')}), 0) AS played{sfx}",
+        f"COALESCE(SUM({w('tm.own_pick')}), 0) AS picks{sfx}",
+        f"COALESCE(SUM({w('tm.opp_pick')}), 0) AS opp_picks{sfx}",
+        f"COALESCE(SUM({w('tm.win')}), 0) AS wins{sfx}",
+        f"COALESCE(SUM({w('tm.game')}), 0) AS games{sfx}",
+        f"CASE WHEN COALESCE(SUM({w('tm.game')}),0)=0 THEN 0.0 "
+        f"ELSE 100.0 * SUM({w('tm.win')}) / SUM({w('tm.game')}) END AS wr{sfx}",
+        f"COALESCE(SUM({own_win}),0) AS wins_own{sfx}",
+        f"COALESCE(SUM({own_game}),0) AS games_own{sfx}",
+        f"CASE WHEN COALESCE(SUM({own_game}),0)=0 THEN 0.0 "
+        f"ELSE 100.0 * SUM({own_win}) / SUM({own_game}) END AS wr_own{sfx}",
+        f"COALESCE(SUM({opp_win}),0) AS wins_opp{sfx}",
+        f"COALESCE(SUM({opp_game}),0) AS games_opp{sfx}",
+        f"CASE WHEN COALESCE(SUM({opp_game}),0)=0 THEN 0.0 "
+        f"ELSE 100.0 * SUM({opp_win}) / SUM({opp_game}) END AS wr_opp{sfx}",
+        f"COALESCE(SUM({w('tm.rounds_for')}), 0) - COALESCE(SUM({w('tm.rounds_against')}), 0) AS rd{sfx}",
+        f"COALESCE(bc.ban1{sfx}, 0) AS ban1{sfx}",
+        f"COALESCE(bc.ban2{sfx}, 0) AS ban2{sfx}",
+        f"COALESCE(ob.opp_ban{sfx}, 0) AS opp_ban{sfx}",
+        f"COALESCE(bc.total_own_ban{sfx}, 0) AS total_own_ban{sfx}",
+        f"COALESCE(1.0 * SUM({w('tm.kills')}) / NULLIF(SUM({w('tm.deaths')}), 0), 0.0) AS kd{sfx}",
+        f"COALESCE(1.0 * SUM({w('tm.adr_weighted')}) / NULLIF(SUM({w('tm.rounds_weight')}), 0), 0.0) AS adr{sfx}",
+        f"COALESCE(dc.decov_cnt{sfx}, 0) AS decov{sfx}",
+    ]
+
+# Columns: map, the current-cutoff block, then the same block suffixed _prev.
+_MAP_DELTA_SELECT = ",\n       ".join(_map_delta_cols("") + _map_delta_cols("_prev"))
+_SQL_MAP_STATS_DELTA = _MAP_DELTA_CTES + f"""
+SELECT am.map AS map,
+       {_MAP_DELTA_SELECT}
+FROM allmaps am
+LEFT JOIN team_maps tm ON tm.map = am.map
+LEFT JOIN ban_counts bc ON bc.map = am.map
+LEFT JOIN opp_ban_counts ob ON ob.map = am.map
+LEFT JOIN decov dc      ON dc.map = am.map
+GROUP BY am.map
+ORDER BY am.map COLLATE NOCASE
+"""
 
 def compute_map_stats_with_delta(con: sqlite3.Connection, championship_id: int, team_id: str) -> dict[str, dict]:
     """
-    Map-delta = (agg <= curr_ts) - (agg <= curr_ts-1)
+    Map-delta = (agg <= curr_ts) - (agg <= curr_ts-1), both cutoffs from one query.
+    Rows are the compute_map_stats_table_data columns; 'dates' is not included,
+    only 'decov'.
     """
     curr_ts, _ = _get_team_last_prev_ts(con, championship_id, team_id)
     if curr_ts is None:
@@ -1442,57 +2585,46 @@ def compute_map_stats_with_delta(con: sqlite3.Connection, championship_id: int,
 
     prev_cutoff = max(0, int(curr_ts) - 1)
 
-    curr = compute_map_stats_table_data_until(con, championship_id, team_id, curr_ts)
-    prev = compute_map_stats_table_data_until(con, championship_id, team_id, prev_cutoff)
-
-    curr_by = {r["map"]: r for r in curr}
-    prev_by = {r["map"]: r for r in prev}
+    # All values are bound (map ids as one JSON array): the statement text is
+    # constant, so the connection's statement cache reuses the compiled plan.
+    maps = _map_pool_param(con, championship_id, _SQL_CATALOG_MAP_IDS)
+    cur = con.cursor()
+    cur.row_factory = None
+    cur.execute(_SQL_MAP_STATS_DELTA, {"champ": championship_id, "team": team_id,
+                                       "curr": curr_ts, "prev": prev_cutoff, "maps": maps})
+    n = (len(cur.description) - 1) // 2
+    keys = [d[0] for d in cur.description[:n + 1]]
+    stat_keys = keys[1:]
 
     out: dict[str, dict] = {}
-    for m, c in curr_by.items():
-        p = prev_by.get(m)
-        if not p:
-            out[m] = {"curr": c, "prev": None, "delta": None}
-        else:
-            d = {}
-            for k, v in c.items():
-                if isinstance(v, (int, float)):
-                    d[k] = v - (p.get(k) or 0)
-            out[m] = {"curr": c, "prev": p, "delta": d}
+    for row in cur:
+        m = row[0]
+        curr_vals, prev_vals = row[1:n + 1], row[n + 1:]
+        # delta straight from the tuples by position (no per-key dict lookups)
+        out[m] = {"curr": dict(zip(keys, row[:n + 1])),
+                  "prev": dict(zip(keys, (m, *prev_vals))),
+                  "delta": dict(zip(stat_keys, map(sub, curr_vals, prev_vals)))}
     return out
 
+_SQL_CHAMP_LAST_SEEN = """
+SELECT NULLIF(MAX(COALESCE(last_seen_at, configured_at, started_at, finished_at, scheduled_at, 0)), 0)
+FROM matches
+WHERE championship_id = ?
+"""
+
+# (database file, championship_id) -> ts. Every matches write refreshes
+# last_seen_at, so upsert_matches_many() drops the cache (as does invalidate_caches()).
+_CHAMP_LAST_SEEN_CACHE: dict[tuple[str, Any], int | None] = {}
+
 def get_champ_last_seen(con: sqlite3.Connection, championship_id: int | str) -> int | None:
     """
     Returns the latest 'last_seen_at' timestamp for a championship from matches table.
     Fallback to max of configured/started/finished/scheduled if last_seen_at is NULLs.
     """
-    row = con.execute("""
-        SELECT MAX(COALESCE(last_seen_at, configured_at, started_at, finished_at, scheduled_at, 0)) AS ts
-        FROM matches
-        WHERE championship_id = ?
-    """, (championship_id,)).fetchone()
-    ts = row["ts"] if row else None
-    return int(ts) if ts else None
-
-def upsert_players_bulk(con: sqlite3.Connection, players: list[dict]) -> None:
-    """
-    Bulk upsert for players to reduce per-row INSERT/UPDATE overhead.
-    players: list of dicts with keys {player_id, nickname, updated_at?}
-    """
-    if not players:
-        return
-    payload = []
-    for p in players:
-        payload.append({
-            "player_id":  p.get("player_id"),
-            "nickname":   (p.get("nickname") or ""),
-            "updated_at": p.get("updated_at"),
-        })
-    sql = """
-    INSERT INTO players (player_id, nickname, updated_at)
-    VALUES (:player_id, :nickname, COALESCE(:updated_at, strftime('%s','now')))
-    ON CONFLICT(player_id) DO UPDATE SET
-      nickname   = CASE WHEN players.nickname IS NULL OR players.nickname='' THEN excluded.nickname ELSE players.nickname END,
-      updated_at = COALESCE(excluded.updated_at, players.updated_at)
-    """
-    con.executemany(sql, payload)
+    key = (_db_key(con), championship_id)
+    if key in _CHAMP_LAST_SEEN_CACHE:
+        return _CHAMP_LAST_SEEN_CACHE[key]
+    # Aggregate -> always one row; NULL when no matches / no timestamps.
+    ts = query_one(con, _SQL_CHAMP_LAST_SEEN, (championship_id,))[0]
+    _CHAMP_LAST_SEEN_CACHE[key] = out = ts if ts is None else int(ts)
+    return out
@@ -1,5 +1,5 @@
 # debug_match_players.py
-import os, sys, json, sqlite3
+import os, sys, json
 from typing import Any, Dict
 
 # Käytetään olemassa olevaa clienttia (lukee FACEIT_API_KEY:n)
@@ -9,7 +9,9 @@ except Exception as e:
     print("faceit_client.py ei saatavilla tai import epäonnistui:", e)
     sys.exit(1)
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "faceit_reports.sqlite")
+from db import get_conn_ro
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "pappaliiga.db")
 
 def flat_keys(d: Dict[str, Any]) -> str:
     return ", ".join(sorted(d.keys()))
@@ -49,18 +51,25 @@ def db_inspect(match_id: str) -> None:
     if not os.path.exists(DB_PATH):
         print(f"[DB] Ei löydy: {DB_PATH}")
         return
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
+    # Sama lukuyhteys kuin HTML-puolella: read-only + cache/mmap-pragmat
+    con = get_conn_ro(DB_PATH)
     cur = con.cursor()
 
     print(f"\n[DB] player_stats rivit matchille {match_id}:")
+    # Stat rivit tallentavat vain id:t (player_id/team_id); nimet tulevat
+    # players/teams -tauluista.
     cur.execute("""
-        SELECT nickname, team_name, team_id, round_index, kills, deaths, assists,
-               adr, kr, hs_pct, utility_damage, sniper_kills,
-               mk_3k, mk_4k, mk_5k, clutches_won
-        FROM player_stats
-        WHERE match_id=?
-        ORDER BY team_name, nickname, round_index
+        SELECT COALESCE(p.nickname, ps.player_id) AS nickname,
+               COALESCE(t.name, ps.team_id)       AS team_name,
+               ps.team_id, ps.round_index, ps.kills, ps.deaths, ps.assists,
+               ps.adr, ps.kr, ps.hs_pct, ps.utility_damage, ps.sniper_kills,
+               ps.mk_3k, ps.mk_4k, ps.mk_5k,
+               COALESCE(ps.cl_1v1_wins, 0) + COALESCE(ps.cl_1v2_wins, 0) AS clutches_won
+        FROM player_stats ps
+        LEFT JOIN players p ON p.player_id = ps.player_id
+        LEFT JOIN teams   t ON t.team_id   = ps.team_id
+        WHERE ps.match_id=?
+        ORDER BY team_name, nickname, ps.round_index
     """, (match_id,))
     rows = cur.fetchall()
     if not rows:
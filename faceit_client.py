@@ -4,12 +4,22 @@
 
 from __future__ import annotations
 import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict, Any, List, Optional
 
 from faceit_config import API_KEY, OPEN_BASE, DEMOCRACY_BASE
 
+# orjson parses the large match stats payloads several times faster; optional,
+# stdlib json (which also accepts bytes) is used when it is not installed.
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
 # Try to import adaptive tuning from config; fall back to sane defaults if missing.
 try:
     from faceit_config import BASE_SLEEP, MAX_SLEEP, BACKOFF_FACTOR, RECOVER_FACTOR, RECOVER_STEPS
@@ -23,6 +33,10 @@ except Exception:
 # Local HTTP timeout (seconds). Kept local on purpose; not part of config anymore.
 DEFAULT_TIMEOUT = 20
 ADAPT_MAX_RETRIES = 4  # total attempts per request
+# Match list types (past/ongoing/upcoming) are paged concurrently, one thread each.
+LIST_WORKERS = 3
+# Pages requested at once after a full first page (list responses carry no total).
+PAGE_WINDOW = 4
 
 HEADERS_OPEN = {
     "Accept": "application/json",
@@ -39,12 +53,16 @@ HEADERS_DEMOCRACY = {
 
 class AdaptiveLimiter:
     """
-    Adaptive sleeper:
-      - Start at BASE_SLEEP
+    Adaptive token bucket shared by all threads:
+      - `cur` is the interval between requests (1/rate); starts at BASE_SLEEP
       - On 429 or exception: grow by BACKOFF_FACTOR (capped to MAX_SLEEP)
       - On successive successes: decay towards BASE_SLEEP by RECOVER_FACTOR every RECOVER_STEPS
+      - acquire() takes one token; a caller that finds the bucket empty reserves
+        the next slot under the lock and sleeps outside it, so concurrent
+        callers are spaced `cur` apart globally instead of each sleeping `cur`
     """
-    def __init__(self, base: float, maxv: float, grow: float, recover: float, recover_steps: int):
+    def __init__(self, base: float, maxv: float, grow: float, recover: float, recover_steps: int,
+                 capacity: float = 1.0):
         self.base = max(0.0, base)
         self.maxv = maxv
         self.grow = grow
@@ -52,24 +70,40 @@ class AdaptiveLimiter:
         self.recover_steps = max(1, recover_steps)
         self.cur = self.base
         self.ok_streak = 0
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
 
     def on_throttle(self) -> None:
-        self.cur = min(self.maxv, max(self.cur, self.base) * self.grow)
-        self.ok_streak = 0
+        with self._lock:
+            self.cur = min(self.maxv, max(self.cur, self.base) * self.grow)
+            self.ok_streak = 0
 
     def on_error(self) -> None:
-        self.cur = min(self.maxv, max(self.cur, self.base) * self.grow)
-        self.ok_streak = 0
-
-    def on_success(self) -> None:
-        self.ok_streak += 1
-        if self.ok_streak >= self.recover_steps and self.cur > self.base:
-            self.cur = max(self.base, self.cur * self.recover)
+        with self._lock:
+            self.cur = min(self.maxv, max(self.cur, self.base) * self.grow)
             self.ok_streak = 0
 
-    def sleep(self) -> None:
-        if self.cur > 0:
-            time.sleep(self.cur)
+    def on_success(self) -> None:
+        with self._lock:
+            self.ok_streak += 1
+            if self.ok_streak >= self.recover_steps and self.cur > self.base:
+                self.cur = max(self.base, self.cur * self.recover)
+                self.ok_streak = 0
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self.cur <= 0:
+                self._tokens, self._last = self.capacity, now
+                return
+            rate = 1.0 / self.cur
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * rate) - 1.0
+            self._last = now
+            wait = -self._tokens / rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
 
 
 # One module-level limiter instance used by all calls
@@ -79,6 +113,12 @@ _ADAPT = AdaptiveLimiter(
 )
 
 
+# One keep-alive session for all calls: TCP/TLS connections to the API hosts
+# are reused instead of a new handshake per request. Retries stay in _get().
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=0))
+
+
 def _retry_after_seconds(resp: requests.Response) -> Optional[float]:
     """Parse Retry-After header if present (seconds)."""
     ra = resp.headers.get("Retry-After")
@@ -91,9 +131,9 @@ def _retry_after_seconds(resp: requests.Response) -> Optional[float]:
 
 def _get(url: str, headers: dict, params: dict | None = None, *, retries: int = ADAPT_MAX_RETRIES, backoff: float = 0.8):
     """
-    GET with adaptive sleep + Retry-After support.
+    GET with adaptive pacing + Retry-After support.
     - Uses DEFAULT_TIMEOUT for all calls
-    - Honors 429 Retry-After
+    - Honors Retry-After on 429/503
     - Falls back once without Authorization on 403 (as before)
     - Advances _ADAPT on success/error
     """
@@ -101,20 +141,21 @@ def _get(url: str, headers: dict, params: dict | None = None, *, retries: int =
     tried_unauth = False
 
     for attempt in range(max(1, retries)):
-        # adaptive pre-sleep
-        _ADAPT.sleep()
+        # adaptive pacing (token bucket shared by all threads)
+        _ADAPT.acquire()
         try:
-            resp = requests.get(url, headers=headers, params=params, timeout=DEFAULT_TIMEOUT)
+            resp = _SESSION.get(url, headers=headers, params=params, timeout=DEFAULT_TIMEOUT)
             sc = resp.status_code
 
-            # Handle 429 with Retry-After
-            if sc == 429:
+            # Handle 429 (and 503 with Retry-After) by waiting as told
+            if sc == 429 or sc == 503:
                 ra = _retry_after_seconds(resp)
                 if ra is not None and ra > 0:
                     time.sleep(ra)
-                else:
+                    continue
+                if sc == 429:
                     _ADAPT.on_throttle()
-                continue
+                    continue
 
             # CI-friendly warning for 403/404 (unchanged)
             if sc in (403, 404):
@@ -126,10 +167,10 @@ def _get(url: str, headers: dict, params: dict | None = None, *, retries: int =
                     noauth.pop("Authorization", None)
                     tried_unauth = True
                     time.sleep(backoff * (2 ** attempt))
-                    resp2 = requests.get(url, headers=noauth, params=params, timeout=DEFAULT_TIMEOUT)
+                    resp2 = _SESSION.get(url, headers=noauth, params=params, timeout=DEFAULT_TIMEOUT)
                     if resp2.ok:
                         _ADAPT.on_success()
-                        return resp2.json()
+                        return _json_loads(resp2.content)
                     else:
                         print(f"[warn] Fallback unauth GET {url} -> {resp2.status_code}", flush=True)
 
@@ -137,7 +178,7 @@ def _get(url: str, headers: dict, params: dict | None = None, *, retries: int =
 
             resp.raise_for_status()
             _ADAPT.on_success()
-            return resp.json()
+            return _json_loads(resp.content)
 
         except requests.HTTPError as e:
             last_err = e
@@ -147,40 +188,69 @@ def _get(url: str, headers: dict, params: dict | None = None, *, retries: int =
             last_err = e
             print(f"[warn] RequestException on GET {url}: {e}", flush=True)
             _ADAPT.on_error()
+        except ValueError as e:
+            # Malformed JSON body (resp.json() raised a RequestException for this)
+            last_err = e
+            print(f"[warn] Invalid JSON on GET {url}: {e}", flush=True)
+            _ADAPT.on_error()
 
         # simple exponential backoff between attempts
         time.sleep(backoff * (2 ** attempt))
 
     raise RuntimeError(f"GET failed for {url}: {last_err}")
 
+def _get_pages(url: str, headers: dict, params: dict, limit: int) -> tuple[list[dict], bool]:
+    """
+    All items of an offset/limit paged list, in offset order.
+    Page 0 alone first (most lists fit in it); while pages come back full, the
+    next PAGE_WINDOW offsets are fetched concurrently (paced by _ADAPT) and
+    read in order up to the first short/empty page.
+    Returns (items, ok); ok=False when a page came back None (403/404).
+    """
+    def fetch(offset: int):
+        return _get(url, headers, params={**params, "offset": offset, "limit": limit})
+
+    out: list[dict] = []
+    offset, n = 0, 1
+    ex: Optional[ThreadPoolExecutor] = None
+    try:
+        while True:
+            offsets = [offset + i * limit for i in range(n)]
+            pages = ex.map(fetch, offsets) if ex else [fetch(offsets[0])]
+            for data in pages:
+                if data is None:
+                    return out, False
+                items = data.get("items") or []
+                out.extend(items)
+                if len(items) < limit:
+                    return out, True
+            offset += n * limit
+            if ex is None:
+                n = PAGE_WINDOW
+                ex = ThreadPoolExecutor(max_workers=n)
+    finally:
+        if ex is not None:
+            ex.shutdown(wait=True, cancel_futures=True)
+
 def list_championship_matches(championship_id: str, match_type: str = "all", limit: int = 100) -> list[dict]:
     """
     Palauttaa listan Faceit-matseja. Jos listaus päätyy 403/404 -> skip ja jatka.
     match_type: "past" | "ongoing" | "upcoming" | "all"
     """
     types = ["past", "ongoing", "upcoming"] if match_type == "all" else [match_type]
-    out: list[dict] = []
     base = f"{OPEN_BASE}/championships/{championship_id}/matches"
 
-    for mt in types:
-        offset = 0
-        while True:
-            params = {"type": mt, "offset": offset, "limit": limit}
-            data = _get(base, HEADERS_OPEN, params=params)
-            if data is None:
-                print(f"[skip] championship {championship_id} list {mt} -> None (403/404)", flush=True)
-                break
-
-            items = data.get("items") or []
-            if not items:
-                break
-
-            out.extend(items)
-            if len(items) < limit:
-                break
-            offset += limit
+    def _pages(mt: str) -> list[dict]:
+        out, ok = _get_pages(base, HEADERS_OPEN, {"type": mt}, limit)
+        if not ok:
+            print(f"[skip] championship {championship_id} list {mt} -> None (403/404)", flush=True)
+        return out
 
-    return out
+    if len(types) == 1:
+        return _pages(types[0])
+    # Types in parallel; results concatenated in the fixed types order.
+    with ThreadPoolExecutor(max_workers=min(LIST_WORKERS, len(types))) as ex:
+        return [it for items in ex.map(_pages, types) for it in items]
 
 def get_match_details(match_id: str) -> Dict[str, Any]:
     url = f"{OPEN_BASE}/matches/{match_id}"
@@ -204,17 +274,5 @@ def get_democracy_history(match_id: str) -> Dict[str, Any]:
 def list_championships_for_organizer(organizer_id: str, limit: int = 100) -> List[Dict[str, Any]]:
     """List all championships for a given organizer_id."""
     url = f"{OPEN_BASE}/organizers/{organizer_id}/championships"
-    items: List[Dict[str, Any]] = []
-    offset = 0
-    while True:
-        params = {"offset": offset, "limit": limit}
-        data = _get(url, HEADERS_OPEN, params=params)
-        batch = data.get("items", [])
-        if not batch:
-            break
-        items.extend(batch)
-        if len(batch) < limit:
-            break
-        offset += limit
-        _ADAPT.sleep()
+    items, _ = _get_pages(url, HEADERS_OPEN, {}, limit)
     return items
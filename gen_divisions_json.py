@@ -12,7 +12,7 @@ import argparse
 import json
 import re
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional
 
 from faceit_client import list_championships_for_organizer
 from faceit_config import PAPPALIGA_ORG_ID
@@ -85,14 +85,10 @@ def discover_cs_divisions(organizer_id: str, min_season: int = 0) -> List[Dict[s
         if not DIV_RX.search(name):
             continue
 
-        dnum   = parse_leading_divnum(name)
+        dnum   = parse_leading_divnum(name)  # Mestaruussarja -> 0 jo parserissa
         season = parse_season(name)
         po     = is_playoffs(name)
 
-        # NEW: Mestaruussarja fallback (jos parse ei jo palauttanut 0)
-        if dnum is None and MESTAR_RX.search(name):
-            dnum = 0
-
         if season < min_season:
             continue
 
@@ -123,7 +119,7 @@ def load_existing(path: Path) -> List[Dict[str, Any]]:
         raise ValueError("divisions.json must be a JSON array")
 
 
-def next_unique_division_id(existing: List[Dict[str, Any]]) -> int:
+def next_unique_division_id(existing: Iterable[Dict[str, Any]]) -> int:
     nums = [int(e["division_id"]) for e in existing if isinstance(e.get("division_id"), int)]
     return (max(nums) + 1) if nums else 101  # start at 101 to avoid clashing with historical small ints
 
@@ -140,10 +136,14 @@ def non_destructive_merge(existing: List[Dict[str, Any]],
         if cid:
             by_cid[cid] = dict(e)
 
-    # Helper for division_id allocation
+    # Helper for division_id allocation: one scan for the current max, then
+    # count up (merging never changes an existing division_id)
+    last_id = next_unique_division_id(by_cid.values()) - 1
+
     def alloc_id() -> int:
-        cur = list(by_cid.values())
-        return next_unique_division_id(cur)
+        nonlocal last_id
+        last_id += 1
+        return last_id
 
     # Merge discovered
     for d in discovered:
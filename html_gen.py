@@ -7,14 +7,17 @@ from faceit_config import DIVISIONS, TOOL_VERSION
 from html import escape
 import hashlib, tempfile, re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
 from db import (
-    get_conn,
+    ReadPool,
+    ensure_read_schema,
     get_teams_in_championship,
     compute_team_summary_data,
-    compute_player_table_data,
+    compute_all_team_summaries,
+    compute_all_player_tables,
     compute_map_stats_table_data,
     compute_champ_map_avgs_data,
     compute_champ_map_summary_data,
@@ -35,6 +38,8 @@ HELSINKI_TZ = ZoneInfo("Europe/Helsinki")
 _GENVER_RE = re.compile(r"<!--\s*GENVER:(\d+)\s*(?:\S+)?\s*-->", re.IGNORECASE)
 DB_PATH = str(Path(__file__).with_name("pappaliiga.db"))
 OUT_DIR = Path(__file__).with_name("docs")
+# Divisioonat renderöidään rinnakkain, kukin omalla lukuyhteydellään
+HTML_WORKERS = min(4, os.cpu_count() or 1)
 
 # --- YHTEINEN POHJA KAIKILLE SIVUILLE (CSS + JS) ---
 UNIFIED_HEAD = """<!doctype html>
@@ -1074,15 +1079,15 @@ def compute_champ_player_summary(con, division_id: int, min_rounds: int = 40, mi
         SUM(ps.kills)                       AS kills,
         SUM(ps.deaths)                      AS deaths,
         SUM(ps.assists)                     AS assists,
-        SUM(COALESCE(ps.utility_damage,0))  AS util_total,
-        SUM(COALESCE(ps.enemies_flashed,0)) AS flashed_total,
-        SUM(COALESCE(ps.flash_count,0))     AS flash_cnt_total,
-        SUM(COALESCE(ps.entry_wins,0))      AS entry_wins,
-        SUM(COALESCE(ps.entry_count,0))     AS entry_count,
-        SUM(COALESCE(ps.cl_1v1_wins,0))     AS c11_wins,
-        SUM(COALESCE(ps.cl_1v1_attempts,0)) AS c11_atts,
-        SUM(COALESCE(ps.cl_1v2_wins,0))     AS c12_wins,
-        SUM(COALESCE(ps.cl_1v2_attempts,0)) AS c12_atts,
+        SUM(ps.utility_damage)  AS util_total,
+        SUM(ps.enemies_flashed) AS flashed_total,
+        SUM(ps.flash_count)     AS flash_cnt_total,
+        SUM(ps.entry_wins)      AS entry_wins,
+        SUM(ps.entry_count)     AS entry_count,
+        SUM(ps.cl_1v1_wins)     AS c11_wins,
+        SUM(ps.cl_1v1_attempts) AS c11_atts,
+        SUM(ps.cl_1v2_wins)     AS c12_wins,
+        SUM(ps.cl_1v2_attempts) AS c12_atts,
 
         -- kierrokset painotuksiin
         SUM(mp.score_team1 + mp.score_team2)                             AS rounds,
@@ -1385,6 +1390,9 @@ def render_division(con, div):
     teams = get_teams_in_championship(con, div["championship_id"])
     div_avgs = compute_champ_map_avgs_data(con, div["championship_id"])
     thresholds = compute_champ_thresholds_data(con, div["championship_id"])
+    # Joukkuekohtaiset taulut yhdellä haulla koko divisioonalle
+    team_summaries = compute_all_team_summaries(con, div["championship_id"])
+    player_tables = compute_all_player_tables(con, div["championship_id"])
 
     # Timestamp shown on page: use DB UTC epoch -> Helsinki local
     ts_epoch = get_division_generated_ts(con, div["championship_id"])
@@ -1564,7 +1572,7 @@ def render_division(con, div):
         html.append(f"<summary><h2>{logo}{escape(team_name)}</h2></summary>")
         
         # --- Lataa pelaajadata ensin, jotta voidaan laskea varaluotettavat tiimikompaktit ---
-        players = compute_player_table_data(con, div["championship_id"], team_id)
+        players = player_tables.get(team_id, [])
 
         # Weekly deltas per player (curr/prev)
         player_deltas = compute_player_deltas(con, div["championship_id"], team_id)
@@ -1615,7 +1623,7 @@ def render_division(con, div):
         }
 
         # Alkuperäinen tiivistelmä (W-L, RD, ym. tulevat täältä edelleen)
-        s = compute_team_summary_data(con, div["championship_id"], team_id)
+        s = team_summaries.get(team_id) or compute_team_summary_data(con, div["championship_id"], team_id)
 
         # Paikkaa puuttuvat/nollatiedot pelaajista lasketuilla arvoilla
         for k in ("kd", "kr", "adr", "util"):
@@ -2177,13 +2185,22 @@ def write_if_changed(path: "Path", content: str) -> bool:
 
 def main():
     OUT_DIR.mkdir(parents=True, exist_ok=True)
-    con = get_conn(DB_PATH)
-    con.row_factory = sqlite3.Row
+    ensure_read_schema(DB_PATH)
+    # Pelkät lukuyhteydet: ei kirjoituslukkoa, sync voi ajaa samaan aikaan (WAL).
+    # sqlite3 vapauttaa GIL:n kyselyn ajaksi -> divisioonat rinnakkain.
+    pool = ReadPool(DB_PATH, n=HTML_WORKERS)
+    try:
+        def _render(div):
+            with pool.read() as con:
+                return render_division(con, div)
 
-    for div in DIVISIONS:
-        path = render_division(con, div)
+        with ThreadPoolExecutor(max_workers=HTML_WORKERS) as ex:
+            list(ex.map(_render, DIVISIONS))
 
-    write_index(con)
+        with pool.read() as con:
+            write_index(con)
+    finally:
+        pool.close()
 
 if __name__ == "__main__":
     main()
@@ -65,16 +65,19 @@ CREATE INDEX IF NOT EXISTS ix_matches_status       ON matches(status);
 CREATE INDEX IF NOT EXISTS ix_matches_started ON matches(started_at);
 
 -- One row per played map within a match (for BO2/BO3).
+-- WITHOUT ROWID: the natural key is the table's only B-tree (no separate
+-- rowid table + unique index to update on every upsert).
 CREATE TABLE IF NOT EXISTS maps (
-  id            INTEGER PRIMARY KEY AUTOINCREMENT,
   match_id      TEXT NOT NULL REFERENCES matches(match_id) ON DELETE CASCADE,
   round_index   INTEGER NOT NULL,                  -- 1,2,3... = map order in match
   map_name      TEXT,
   score_team1   INTEGER,
   score_team2   INTEGER,
   winner_team_id TEXT,
-  UNIQUE(match_id, round_index)
-);
+  -- played rounds (weight for ADR/KPR aggregates); VIRTUAL so old DBs can ALTER it in
+  rounds_total  INTEGER GENERATED ALWAYS AS (COALESCE(score_team1,0) + COALESCE(score_team2,0)) VIRTUAL,
+  PRIMARY KEY (match_id, round_index)
+) WITHOUT ROWID;
 
 -- Map veto votes (Faceit Democracy API), per match
 CREATE TABLE IF NOT EXISTS map_votes (
@@ -89,38 +92,40 @@ CREATE TABLE IF NOT EXISTS map_votes (
 );
 
 -- Player stats per map (per match_id + round_index).
+-- Counter columns are NOT NULL (a NULL write becomes 0): aggregates SUM them
+-- without COALESCE. Ratios (kd/kr/adr/hs_pct) stay nullable.
 CREATE TABLE IF NOT EXISTS player_stats (
   id               INTEGER PRIMARY KEY AUTOINCREMENT,
   match_id         TEXT NOT NULL REFERENCES matches(match_id) ON DELETE CASCADE,
   round_index      INTEGER NOT NULL,
   player_id        TEXT REFERENCES players(player_id) ON DELETE SET NULL,
   team_id          TEXT REFERENCES teams(team_id) ON DELETE SET NULL,
-  kills            INTEGER,
-  deaths           INTEGER,
-  assists          INTEGER,
+  kills            INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  deaths           INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  assists          INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
   kd               REAL,
   kr               REAL,
   adr              REAL,
   hs_pct           REAL,
-  mvps             INTEGER,
-  sniper_kills     INTEGER,
-  utility_damage   INTEGER,
-  enemies_flashed  INTEGER,
-  flash_count      INTEGER,
-  flash_successes  INTEGER,
-  mk_2k            INTEGER,
-  mk_3k            INTEGER,
-  mk_4k            INTEGER,
-  mk_5k            INTEGER,
-  clutch_kills     INTEGER DEFAULT 0,
-  cl_1v1_attempts  INTEGER DEFAULT 0,
-  cl_1v1_wins      INTEGER DEFAULT 0,
-  cl_1v2_attempts  INTEGER DEFAULT 0,
-  cl_1v2_wins      INTEGER DEFAULT 0,
-  entry_count      INTEGER,
-  entry_wins       INTEGER,
-  pistol_kills     INTEGER,
-  damage           INTEGER,
+  mvps             INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  sniper_kills     INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  utility_damage   INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  enemies_flashed  INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  flash_count      INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  flash_successes  INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  mk_2k            INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  mk_3k            INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  mk_4k            INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  mk_5k            INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  clutch_kills     INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  cl_1v1_attempts  INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  cl_1v1_wins      INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  cl_1v2_attempts  INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  cl_1v2_wins      INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  entry_count      INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  entry_wins       INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  pistol_kills     INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
+  damage           INTEGER NOT NULL ON CONFLICT REPLACE DEFAULT 0,
 
   UNIQUE(match_id, round_index, player_id)
 );
@@ -128,7 +133,8 @@ CREATE TABLE IF NOT EXISTS player_stats (
 CREATE INDEX IF NOT EXISTS ix_playerstats_team ON player_stats(team_id);
 CREATE INDEX IF NOT EXISTS idx_matches_champ ON matches(championship_id);
 CREATE INDEX IF NOT EXISTS idx_ps_match_round ON player_stats(match_id, round_index, player_id);
-CREATE INDEX IF NOT EXISTS idx_maps_match_round ON maps(match_id, round_index);
+-- Sync skip probe: EXISTS(... match_id=? AND map_name='forfeit') answered from the index
+CREATE INDEX IF NOT EXISTS idx_maps_match_name ON maps(match_id, map_name);
 CREATE INDEX IF NOT EXISTS idx_votes_match ON map_votes(match_id);
 CREATE INDEX IF NOT EXISTS ix_playerstats_match_team ON player_stats(match_id, team_id);
 CREATE INDEX IF NOT EXISTS idx_matches_champ_team1 ON matches(championship_id, team1_id);
@@ -157,3 +163,51 @@ CREATE TABLE IF NOT EXISTS map_pool_seasons (
   map_id  TEXT NOT NULL REFERENCES maps_catalog(map_id) ON DELETE CASCADE,
   PRIMARY KEY (season, map_id)
 );
+
+------------------------------------------------------------
+-- Materialized player table per championship (db.refresh_champ_agg)
+------------------------------------------------------------
+-- Same rows/values as the live player table query; rebuilt at the end of
+-- each sync pass. HTML reads it instead of player_stats ⋈ matches ⋈ maps.
+CREATE TABLE IF NOT EXISTS player_champ_agg (
+  championship_id  TEXT NOT NULL REFERENCES championships(championship_id) ON DELETE CASCADE,
+  team_id          TEXT,
+  player_id        TEXT,
+  nickname_display TEXT,
+  maps_played      INTEGER,
+  kills            INTEGER,
+  deaths           INTEGER,
+  assists          INTEGER,
+  adr              REAL,
+  kr               REAL,
+  hs_pct           REAL,
+  awp_kills        INTEGER,
+  k2               INTEGER,
+  k3               INTEGER,
+  k4               INTEGER,
+  k5               INTEGER,
+  util             INTEGER,
+  damage           INTEGER,
+  mvps             INTEGER,
+  flashed          INTEGER,
+  flash_count      INTEGER,
+  flash_successes  INTEGER,
+  rounds           INTEGER,
+  clutch_kills     INTEGER,
+  c11_att          INTEGER,
+  c11_win          INTEGER,
+  c12_att          INTEGER,
+  c12_win          INTEGER,
+  entry_count      INTEGER,
+  entry_win        INTEGER,
+  pistol_kills     INTEGER,
+  PRIMARY KEY (championship_id, team_id, player_id)
+);
+
+-- Refresh marker: MAX(matches.last_seen_at) of the championship when its
+-- player_champ_agg rows were rebuilt. Newer match writes (a pass killed or
+-- whose last commit failed before the refresh) -> HTML uses the live query.
+CREATE TABLE IF NOT EXISTS player_champ_agg_state (
+  championship_id  TEXT PRIMARY KEY REFERENCES championships(championship_id) ON DELETE CASCADE,
+  last_seen_at     INTEGER NOT NULL
+);
@@ -8,6 +8,8 @@
 from __future__ import annotations
 import argparse
 import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import time
 from pathlib import Path
@@ -21,13 +23,17 @@ from faceit_client import (
     list_championship_matches, get_match_details, get_match_stats, get_democracy_history
 )
 from db import (
-    get_conn, init_db,
+    ConnPool, DBWriter, open_pool, init_db, checkpoint, bulk,
     upsert_championship, upsert_match,
-    upsert_team,
+    upsert_teams_many,
     upsert_maps, upsert_map_votes,
     upsert_player_stats,
-    upsert_map_catalog, add_map_to_season_pool,
-    upsert_players_bulk,
+    upsert_map_catalog_many, add_maps_to_season_pool,
+    upsert_players_many,
+    get_match_snapshot,
+    prime_identity_cache,
+    refresh_champ_agg,
+    invalidate_caches,
 )
 
 _SCORE_RE = re.compile(r"^\s*(\d+)\s*[/\:]\s*(\d+)\s*$")
@@ -127,6 +133,7 @@ def _persist_map_catalog_from_details(con: sqlite3.Connection, details: dict, se
         slug = (map_id or "").replace("de_", "").replace("_", " ").strip()
         return slug.title() if slug else map_id
 
+    rows = []
     for ent in entities:
         map_id = ent.get("class_name") or ent.get("game_map_id") or ent.get("guid") or ""
         if not map_id:
@@ -135,14 +142,15 @@ def _persist_map_catalog_from_details(con: sqlite3.Connection, details: dict, se
         img_sm = ent.get("image_sm") or ""
         img_lg = ent.get("image_lg") or ""
 
-        row = {
+        rows.append({
             "map_id": map_id.lower(),
             "pretty_name": pretty,
             "image_sm": img_sm,
             "image_lg": img_lg,
-        }
-        upsert_map_catalog(con, row)
-        add_map_to_season_pool(con, season, row["map_id"])
+        })
+    if rows:
+        upsert_map_catalog_many(con, rows)
+        add_maps_to_season_pool(con, season, [r["map_id"] for r in rows])
 
 def _extract_player_rows(match_id: str, rounds: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     rows: List[Dict[str, Any]] = []
@@ -343,45 +351,9 @@ def _normalize_team_ref(ref: Any, team1_id: Optional[str], team2_id: Optional[st
 # Skipataanko kannassa jo valmiiksi finished-matsit (säästää API:a)?
 SKIP_FINISHED_IN_DB = True  
 
-def _db_match_snapshot(con: sqlite3.Connection, match_id: str) -> dict:
-    """
-    Single snapshot for skip logic with fewer roundtrips:
-    - 1x SELECT from matches
-    - 1x SELECT over maps to get both "has_any_map" and "has_forfeit_map"
-    - 1x EXISTS for player_stats
-    """
-    row = con.execute(
-        """SELECT status, scheduled_at, started_at, finished_at, team1_id, team2_id
-           FROM matches WHERE match_id=?""",
-        (match_id,)
-    ).fetchone()
-    exists = bool(row)
-    status = (row["status"] or "").lower() if row else None
-    sched  = row["scheduled_at"] if row else None
-    start  = row["started_at"]   if row else None
-    finish = row["finished_at"]  if row else None
-    t1     = row["team1_id"]     if row else None
-    t2     = row["team2_id"]     if row else None
-
-    maps_row = con.execute(
-        "SELECT COUNT(*) AS c, MAX(CASE WHEN map_name='forfeit' THEN 1 ELSE 0 END) AS has_ff "
-        "FROM maps WHERE match_id=?",
-        (match_id,)
-    ).fetchone()
-    has_any_map = (maps_row["c"] or 0) > 0
-    has_ff_map  = bool(maps_row["has_ff"])
-
-    has_ps = bool(con.execute(
-        "SELECT 1 FROM player_stats WHERE match_id=? LIMIT 1", (match_id,)
-    ).fetchone())
-
-    return {
-        "exists": exists,
-        "status": status, "scheduled_at": sched, "started_at": start, "finished_at": finish,
-        "team1_id": t1, "team2_id": t2,
-        "has_any_map": has_any_map, "has_player_stats": has_ps, "has_forfeit_map": has_ff_map,
-    }
-
+# Montako matsia haetaan API:sta yhtä aikaa (faceit_client._ADAPT tahdittaa
+# silti kaikki pyynnöt yhteisellä token bucketilla).
+FETCH_WORKERS = 6
 
 def _target_kind_from_status(item: dict) -> str:
     """
@@ -422,11 +394,16 @@ def _list_matches_all(championship_id: str) -> list[dict]:
         })
     return out
 
-def _sync_division_one_pass(con: sqlite3.Connection, champ_row: dict) -> None:
+def _sync_division_one_pass(pool: ConnPool, champ_row: dict, writer: Optional[DBWriter] = None) -> None:
     """
     One pass over all matches (type=all). Ongoing are handled like scheduled.
     Optimized to:
-      - Use SAVEPOINT/RELEASE per match, commit once per division (reduces fsyncs)
+      - Fetch (HTTP) up to FETCH_WORKERS matches concurrently, write in the
+        DBWriter thread in list order: the commit fsync of one match overlaps
+        the API calls of the next ones
+      - Microbatched commits (DBWriter: one COMMIT per 32 matches or 1 s);
+        each match is a SAVEPOINT, so a failed match rolls back alone
+      - Skip probes run on a reader connection (WAL: never blocked by the writer)
       - Throttle progress bar updates (<=1 Hz) to cut stdout overhead
       - Use single DB snapshot query for skip logic
     """
@@ -438,115 +415,140 @@ def _sync_division_one_pass(con: sqlite3.Connection, champ_row: dict) -> None:
         _progress_bar(title, 0, 0, time.time(), skipped=0)
         return
 
+    own_writer = writer is None
+    if own_writer:
+        writer = DBWriter(pool)
+        writer.start()
+
     seen: set[str] = set()
     skipped = 0
     start_ts = time.time()
     last_print = 0.0  # throttle progress updates
 
-    for i, m in enumerate(matches, start=1):
-        mid = m.get("match_id")
-        if not mid or mid in seen:
-            # Throttled progress update
-            if (i == total) or (time.time() - last_print > 1.0):
-                _progress_bar(title, i, total, start_ts, skipped)
-                last_print = time.time()
-            continue
-
-        # Early skip: BYE
-        if _is_bye_match_summary(m):
-            logging.info("[skip] bye match %s (%s vs %s)", mid, m.get("team1_name"), m.get("team2_name"))
-            seen.add(mid); skipped += 1
-            if (i == total) or (time.time() - last_print > 1.0):
-                _progress_bar(title, i, total, start_ts, skipped)
-                last_print = time.time()
-            continue
+    # Fetches in flight, oldest first: (mid, kind, summary, future)
+    pending: deque = deque()
+    fetcher = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+    # Past matches: /stats alongside /details (own pool: the fetch workers
+    # block on these futures, so they must not share one)
+    stats_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="stats")
 
-        # Single DB snapshot for all skip checks
-        snap = _db_match_snapshot(con, mid)
+    def _hand_off_oldest() -> None:
+        mid_, tgt_, summary_, fut = pending.popleft()
+        try:
+            bundle = fut.result()
+        except Exception as e:
+            logging.warning("sync (all) %s failed: %s", mid_, e)
+            bundle = None
+        if bundle is not None:
+            writer.submit(write_match_bundle, champ_row, mid_, tgt_, summary_, bundle)
 
-        # Skip finished+complete (maps+either player_stats or a 'forfeit' map)
-        if SKIP_FINISHED_IN_DB and (snap["status"] in {"finished", "played", "closed"}) and (
-            snap["has_player_stats"] or (snap["has_any_map"] and snap["has_forfeit_map"])
-        ):
-            seen.add(mid); skipped += 1
-            if (i == total) or (time.time() - last_print > 1.0):
-                _progress_bar(title, i, total, start_ts, skipped)
-                last_print = time.time()
-            continue
+    try:
+        for i, m in enumerate(matches, start=1):
+            mid = m.get("match_id")
+            if not mid or mid in seen:
+                # Throttled progress update
+                if (i == total) or (time.time() - last_print > 1.0):
+                    _progress_bar(title, i, total, start_ts, skipped)
+                    last_print = time.time()
+                continue
 
-        # Non-past summary unchanged vs DB header → skip
-        tgt = m.get("_target_kind") or "upcoming"
-        if tgt != "past" and snap["exists"]:
-            unchanged = (
-                (snap["status"] or "") == (m.get("status") or "").lower() and
-                (snap["scheduled_at"] or None) == (m.get("scheduled_at") or None) and
-                (snap["started_at"]   or None) == (m.get("started_at")   or None) and
-                (snap["finished_at"]  or None) == (m.get("finished_at")  or None) and
-                (snap["team1_id"]     or None) == (m.get("team1_id")     or None) and
-                (snap["team2_id"]     or None) == (m.get("team2_id")     or None)
-            )
-            if unchanged:
+            # Early skip: BYE
+            if _is_bye_match_summary(m):
+                logging.info("[skip] bye match %s (%s vs %s)", mid, m.get("team1_name"), m.get("team2_name"))
                 seen.add(mid); skipped += 1
                 if (i == total) or (time.time() - last_print > 1.0):
                     _progress_bar(title, i, total, start_ts, skipped)
                     last_print = time.time()
                 continue
 
-        # Persist with per-match SAVEPOINT; commit will be done once per division
-        seen.add(mid)
-        try:
-            con.execute("SAVEPOINT match_tx")
-            summary = m if tgt != "past" else None
-            persist_match(con, champ_row, mid, kind=tgt, summary=summary)
-            con.execute("RELEASE SAVEPOINT match_tx")
-        except Exception as e:
-            logging.warning("sync (all) %s failed: %s", mid, e)
-            try:
-                con.execute("ROLLBACK TO SAVEPOINT match_tx")
-            except Exception:
-                pass  # ignore nested rollback errors
+            # Single DB snapshot for all skip checks (cached once a match is complete)
+            with pool.read() as rcon:
+                snap = get_match_snapshot(rcon, mid)
 
-        # Throttled progress update
-        if (i == total) or (time.time() - last_print > 1.0):
-            _progress_bar(title, i, total, start_ts, skipped)
-            last_print = time.time()
-
-    # Single commit per division pass
-    try:
-        con.commit()
-    except Exception as e:
-        logging.warning("division commit failed: %s", e)
+            # Skip finished+complete (maps+either player_stats or a 'forfeit' map)
+            if SKIP_FINISHED_IN_DB and snap["fully_synced"]:
+                seen.add(mid); skipped += 1
+                if (i == total) or (time.time() - last_print > 1.0):
+                    _progress_bar(title, i, total, start_ts, skipped)
+                    last_print = time.time()
+                continue
 
-def persist_match(con: sqlite3.Connection, champ_row: Dict[str, Any], match_id: str, kind: str, summary: Optional[Dict[str, Any]] = None) -> None:
-    details: Dict[str, Any] = {}
-    f1: Dict[str, Any] = {}
-    f2: Dict[str, Any] = {}
+            # Non-past summary unchanged vs DB header → skip
+            tgt = m.get("_target_kind") or "upcoming"
+            if tgt != "past" and snap["exists"]:
+                unchanged = (
+                    (snap["status"] or "") == (m.get("status") or "").lower() and
+                    (snap["scheduled_at"] or None) == (m.get("scheduled_at") or None) and
+                    (snap["started_at"]   or None) == (m.get("started_at")   or None) and
+                    (snap["finished_at"]  or None) == (m.get("finished_at")  or None) and
+                    (snap["team1_id"]     or None) == (m.get("team1_id")     or None) and
+                    (snap["team2_id"]     or None) == (m.get("team2_id")     or None)
+                )
+                if unchanged:
+                    seen.add(mid); skipped += 1
+                    if (i == total) or (time.time() - last_print > 1.0):
+                        _progress_bar(title, i, total, start_ts, skipped)
+                        last_print = time.time()
+                    continue
+
+            # Fetch in the pool; the oldest finished fetch goes to the writer thread
+            seen.add(mid)
+            summary = m if tgt != "past" else None
+            pending.append((mid, tgt, summary, fetcher.submit(fetch_match_bundle, mid, tgt, summary, stats_pool)))
+            if len(pending) >= FETCH_WORKERS:
+                _hand_off_oldest()
 
+            # Throttled progress update
+            if (i == total) or (time.time() - last_print > 1.0):
+                _progress_bar(title, i, total, start_ts, skipped)
+                last_print = time.time()
+        while pending:
+            _hand_off_oldest()
+    finally:
+        fetcher.shutdown(wait=True, cancel_futures=True)
+        stats_pool.shutdown(wait=True, cancel_futures=True)
+        # Materialized player table for the HTML path, after this pass's writes
+        writer.submit(refresh_champ_agg, champ_row["championship_id"])
+        if own_writer:
+            writer.close()
+        else:
+            writer.flush()
+
+
+def fetch_match_bundle(match_id: str, kind: str, summary: Optional[Dict[str, Any]] = None,
+                       stats_pool: Optional[ThreadPoolExecutor] = None) -> Optional[Dict[str, Any]]:
+    """
+    Network half of a match sync: all API calls, no DB access (runs in the
+    fetch pool while the DB writer thread commits earlier matches).
+    stats_pool: if given, a past match's /stats is fetched there alongside /details.
+    Returns None for bye matches.
+    """
     if kind != "past" and isinstance(summary, dict) and _is_bye_match_summary(summary):
         logging.info("[skip] bye (summary) %s", match_id)
-        return
+        return None
+
+    # STATS (past only) in flight while details are fetched: two RTTs overlap.
+    # Deliberate trade-off: a bye only visible in /details still spends this
+    # /stats call (cancel() cannot stop a running request). The sync loop has
+    # already dropped byes by their summary faction ids -- the same ids the
+    # details check reads -- so this is the rare list/details mismatch only.
+    stats_fut = stats_pool.submit(get_match_stats, match_id) if kind == "past" and stats_pool else None
 
     if kind != "past" and isinstance(summary, dict):
         details = summary.get("_raw") or {}
-        f1 = {"name": summary.get("team1_name"), "avatar": summary.get("team1_avatar"), "roster": summary.get("team1_roster") or []}
-        f2 = {"name": summary.get("team2_name"), "avatar": summary.get("team2_avatar"), "roster": summary.get("team2_roster") or []}
     else:
         details = get_match_details(match_id) or {}
         if _is_bye_match_details(details):
             logging.info("[skip] bye (details) %s", match_id)
-            return
-        teams_d = details.get("teams") or {}
-        f1 = teams_d.get("faction1") or {}
-        f2 = teams_d.get("faction2") or {}
-        _persist_map_catalog_from_details(con, details, season=champ_row["season"])
+            if stats_fut is not None:
+                stats_fut.cancel()
+            return None
 
-    # STATS
     stats = {}
     rounds = []
-    forfeit_like = False
     if kind == "past":
         try:
-            stats = get_match_stats(match_id) or {}
+            stats = (stats_fut.result() if stats_fut is not None else get_match_stats(match_id)) or {}
         except Exception as e:
             logging.info("[skip] stats %s -> %s", match_id, e)
             stats = {}
@@ -563,7 +565,35 @@ def persist_match(con: sqlite3.Connection, champ_row: Dict[str, Any], match_id:
         except Exception:
             demo_json = {}
 
-    if kind == "past" and not rounds and not (has_detailed or has_score):
+    return {
+        "details": details,
+        "rounds": rounds,
+        "demo_json": demo_json,
+        "has_result": has_detailed or has_score,
+        "forfeit_like": forfeit_like,
+    }
+
+
+def write_match_bundle(con: sqlite3.Connection, champ_row: Dict[str, Any], match_id: str, kind: str,
+                       summary: Optional[Dict[str, Any]], bundle: Optional[Dict[str, Any]]) -> None:
+    """DB half of a match sync: parse the fetched bundle and upsert it (no API calls)."""
+    if bundle is None:
+        return
+    details: Dict[str, Any] = bundle["details"]
+    rounds = bundle["rounds"]
+    demo_json = bundle["demo_json"]
+    forfeit_like = bundle["forfeit_like"]
+
+    if kind != "past" and isinstance(summary, dict):
+        f1 = {"name": summary.get("team1_name"), "avatar": summary.get("team1_avatar"), "roster": summary.get("team1_roster") or []}
+        f2 = {"name": summary.get("team2_name"), "avatar": summary.get("team2_avatar"), "roster": summary.get("team2_roster") or []}
+    else:
+        teams_d = details.get("teams") or {}
+        f1 = teams_d.get("faction1") or {}
+        f2 = teams_d.get("faction2") or {}
+        _persist_map_catalog_from_details(con, details, season=champ_row["season"])
+
+    if kind == "past" and not rounds and not bundle["has_result"]:
         upsert_match(con, {
             "match_id": match_id,
             "championship_id": champ_row["championship_id"],
@@ -584,10 +614,13 @@ def persist_match(con: sqlite3.Connection, champ_row: Dict[str, Any], match_id:
     winner_team_id = _normalize_team_ref(winner_raw, team1_id, team2_id)
 
     # Upsert teams (names & avatars live only in teams)
+    teams = []
     if team1_id or (summary and summary.get("team1_name")) or f1.get("name"):
-        upsert_team(con, {"team_id": team1_id, "name": (summary.get("team1_name") if summary else f1.get("name")), "avatar": (summary.get("team1_avatar") if summary else f1.get("avatar")), "updated_at": None})
+        teams.append({"team_id": team1_id, "name": (summary.get("team1_name") if summary else f1.get("name")), "avatar": (summary.get("team1_avatar") if summary else f1.get("avatar")), "updated_at": None})
     if team2_id or (summary and summary.get("team2_name")) or f2.get("name"):
-        upsert_team(con, {"team_id": team2_id, "name": (summary.get("team2_name") if summary else f2.get("name")), "avatar": (summary.get("team2_avatar") if summary else f2.get("avatar")), "updated_at": None})
+        teams.append({"team_id": team2_id, "name": (summary.get("team2_name") if summary else f2.get("name")), "avatar": (summary.get("team2_avatar") if summary else f2.get("avatar")), "updated_at": None})
+    if teams:
+        upsert_teams_many(con, teams)
 
     # Bulk upsert rosters (players)
     roster_players = []
@@ -601,12 +634,7 @@ def persist_match(con: sqlite3.Connection, champ_row: Dict[str, Any], match_id:
             for pr in (fac.get("roster") or []):
                 roster_players.append({"player_id": pr.get("player_id"), "nickname": pr.get("nickname") or "", "updated_at": None})
     if roster_players:
-        uniq = {}
-        for p in roster_players:
-            pid = p.get("player_id")
-            if pid:
-                uniq[pid] = p
-        upsert_players_bulk(con, list(uniq.values()))
+        upsert_players_many(con, roster_players)  # dedups by player_id
 
     configured_at = safe_int(
         (details.get("configured_at") if isinstance(details, dict) else None) \
@@ -732,36 +760,66 @@ def persist_match(con: sqlite3.Connection, champ_row: Dict[str, Any], match_id:
 # ---- main sync --------------------------------------------------------------
 
 def main(db_path: str) -> None:
-    con = get_conn(db_path)
+    # 1 writer + readers for the skip probes
+    pool = open_pool(db_path, n_readers=2)
+    writer: Optional[DBWriter] = None
     try:
-        init_db(con)
-
-        # Upsert championships from faceit_config.DIVISIONS
-        champs = []
-        for d in DIVISIONS:
-            if int(d.get("season", 0)) < CURRENT_SEASON:
-                continue  # skip older seasons
-            row = upsert_championship(con, {
-                "championship_id": d["championship_id"],
-                "season": d["season"],
-                "division_num": d["division_num"],
-                "name": d["name"],
-                "is_playoffs": d.get("is_playoffs", 0),
-                "slug": d["slug"],
-            })
-            champs.append(row)
+        with pool.write() as con:
+            init_db(con)
+            prime_identity_cache(con)
+
+            # Upsert championships from faceit_config.DIVISIONS
+            # (one transaction for all of them: upsert_championship never commits)
+            champs = []
+            with bulk(con):
+                for d in DIVISIONS:
+                    if int(d.get("season", 0)) < CURRENT_SEASON:
+                        continue  # skip older seasons
+                    row = upsert_championship(con, {
+                        "championship_id": d["championship_id"],
+                        "season": d["season"],
+                        "division_num": d["division_num"],
+                        "name": d["name"],
+                        "is_playoffs": d.get("is_playoffs", 0),
+                        "slug": d["slug"],
+                    })
+                    champs.append(row)
+
+        # Kirjoitukset omassa säikeessään; haku (HTTP) jatkuu sillä välin
+        writer = DBWriter(pool)
+        writer.start()
 
         # Käy kaikki divisioonat läpi yhdellä passilla / divisioona
         for c in champs:
-            _sync_division_one_pass(con, c)
+            _sync_division_one_pass(pool, c, writer)
+            # Checkpoint at the division boundary, not inside the hot loop
+            with pool.write() as con:
+                checkpoint(con, "PASSIVE")
 
-        print(">> [OK] Sync valmis")
+        # Refresh planner statistics after the bulk load (runs ANALYZE where useful)
+        with pool.write() as con:
+            try:
+                con.execute("PRAGMA optimize;")
+            except Exception as e:
+                logging.warning("PRAGMA optimize failed: %s", e)
+            # Fold the WAL back into the DB file and truncate it
+            checkpoint(con, "TRUNCATE")
+
+        # Luettu data muuttui: tyhjennä lukupuolen välimuistit (map pool)
+        invalidate_caches()
+        # Epäonnistuneet kirjoitukset näkyvät vain lokissa -> raportoi lopuksi
+        if writer.failed or writer.commit_failed:
+            msg = (f"{writer.failed} match write(s) rolled back, "
+                   f"{writer.commit_failed} commit(s) failed -- see sync.log")
+            logging.warning("sync: %s", msg)
+            print(f">> [WARN] Sync valmis, mutta {msg}")
+        else:
+            print(">> [OK] Sync valmis")
     finally:
-        # Sulje yhteys aina lopuksi
-        try:
-            con.close()
-        except Exception:
-            pass
+        # Sulje yhteydet aina lopuksi (writer ensin: se tyhjentää jononsa)
+        if writer is not None:
+            writer.close()
+        pool.close()
 
 
 if __name__ == "__main__":